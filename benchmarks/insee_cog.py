@@ -0,0 +1,177 @@
+"""Benchmark of the INSEE official geographic code parser.
+
+A synthetic TriG archive shaped like the INSEE register
+(one resource with an UUID-based URI and one with a
+code-based URI per commune, about a dozen triples each) is
+generated, then served on a local HTTP server and parsed:
+
+* ``rdflib`` loads the data into a :py:class:`rdflib.Dataset`,
+  as the parser did before it read the data as a stream;
+* ``stream`` runs the parser in streaming mode, as the loader does;
+* ``parser`` runs the parser in regular mode, with the whole
+  vocabulary held in memory and validated.
+
+Each mode runs in its own process, so that its peak
+memory can be measured.
+
+Usage, with the extension installed in the Python environment::
+
+    python benchmarks/insee_cog.py --communes 100000
+
+"""
+
+import argparse
+import functools
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from io import BytesIO
+from pathlib import Path
+
+MODES = ('rdflib', 'stream', 'parser')
+
+RDF_TYPES = [
+    'http://rdf.insee.fr/def/geo#Departement',
+    'http://rdf.insee.fr/def/geo#Commune'
+]
+
+def generate(path, communes, seed=1):
+    """Write a synthetic INSEE geographic code archive.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the zip archive.
+    communes : int
+        Number of communes.
+    seed : int, default 1
+        Seed of the random values.
+
+    """
+    rng = random.Random(seed)
+    lines = [
+        '@prefix geo: <http://rdf.insee.fr/def/geo#> .',
+        '@prefix owl: <http://www.w3.org/2002/07/owl#> .',
+        '@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .',
+        '@prefix dct: <http://purl.org/dc/terms/> .',
+        '<http://rdf.insee.fr/graphes/geo/cog> {',
+    ]
+    for d in range(100):
+        lines.append(
+            f'<http://id.insee.fr/geo/departement/d{d}> a geo:Departement ; '
+            f'geo:nom "Département {d}"@fr ; geo:codeINSEE "{d:02d}" .'
+        )
+    for i in range(communes):
+        d = i % 100
+        uuid_uri = f'<http://id.insee.fr/geo/commune/{i:08x}-1c2d-4e5f-9a8b-{i:012x}>'
+        code_uri = f'<http://id.insee.fr/geo/commune/{d:02d}{i:05d}>'
+        rdf_type = 'geo:Commune' if i % 7 else 'geo:CommuneDeleguee'
+        lines.append(
+            f'{uuid_uri} a {rdf_type} ; geo:nom "La Commune n°{i}"@fr ; '
+            f'geo:nomSansArticle "Commune n°{i}"@fr ; '
+            f'geo:nomEntier "LA COMMUNE N°{i}"@fr ; '
+            f'geo:codeINSEE "{d:02d}{i:05d}" ; '
+            f'geo:subdivisionDirecteDe <http://id.insee.fr/geo/departement/d{d}> ; '
+            f'owl:sameAs {code_uri} ; dct:issued "2019-01-01"^^xsd:date ; '
+            f'geo:codeArticle "1" ; geo:population {rng.randint(10, 100000)} .'
+        )
+        lines.append(
+            f'{code_uri} a {rdf_type} ; geo:codeINSEE "{d:02d}{i:05d}" ; '
+            'dct:modified "2021-03-10"^^xsd:date .'
+        )
+    lines.append('}')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('cog.trig', '\n'.join(lines))
+
+def run(mode, path):
+    """Parse an archive in the current process.
+
+    Returns
+    -------
+    dict
+        Duration in seconds, peak memory in MB and
+        number of rows (or quads, for ``rdflib``).
+
+    """
+    from ckanext.ecospheres.vocabulary.parser.httpcache import HttpCache
+    from ckanext.ecospheres.vocabulary.parser.parsers import (
+        insee_official_geographic_code
+    )
+    HttpCache.configure(enabled=False)
+
+    path = Path(path)
+    server = HTTPServer(
+        ('127.0.0.1', 0),
+        functools.partial(_QuietHandler, directory=str(path.parent))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/{path.name}'
+
+    start = time.perf_counter()
+    if mode == 'rdflib':
+        from rdflib import Dataset
+        with zipfile.ZipFile(path) as archive:
+            content = archive.read(archive.namelist()[0])
+        dataset = Dataset()
+        dataset.parse(BytesIO(content), format='trig')
+        count = len(dataset)
+    elif mode == 'stream':
+        result, chunks = insee_official_geographic_code.stream(
+            'insee_official_geographic_code', url, rdf_types=RDF_TYPES
+        )
+        count = sum(len(rows) for table, rows in chunks)
+    else:
+        result = insee_official_geographic_code(
+            'insee_official_geographic_code', url, rdf_types=RDF_TYPES
+        )
+        count = sum(len(table) for table in result.data.values())
+    duration = time.perf_counter() - start
+    server.shutdown()
+    return {
+        'mode': mode,
+        'seconds': round(duration, 1),
+        'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+        'count': count,
+    }
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--communes', type=int, default=20000)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--run', nargs=2, metavar=('MODE', 'PATH'),
+        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(*args.run)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / f'cog{args.communes}.zip'
+        generate(path, args.communes)
+        print(f'{args.communes} communes, {path.stat().st_size // 1024} kB archive')
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, __file__, '--run', mode, str(path)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            res = json.loads(output.strip().splitlines()[-1])
+            print(
+                '{mode:>8}: {seconds:>7} s {peak_mb:>6} MB '
+                '{count:>9} rows/quads'.format(**res)
+            )
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
+import json
+
 import click
 
-from ckanext.ecospheres.vocabulary.loader import load_vocab
+from ckanext.ecospheres.vocabulary import bundle
+from ckanext.ecospheres.vocabulary.loader import load_vocab, rollback_vocab
+from ckanext.ecospheres.vocabulary.parser.httpcache import HttpCache
 from ckanext.ecospheres.vocabulary.reader import VocabularyReader
+from ckanext.ecospheres.vocabulary.unmatched import UnmatchedValuesReport
 
 @click.group(short_help=u'Vocabulary administration commands.')
 def vocabulary():
@@ -133,7 +138,12 @@ def rsearch(vocabulary, terms):
 )
 @click.argument(u'name', required=False, nargs=-1)
 @click.option(u'-e', u'--exclude', u'exclude', multiple=True, help=u'A vocabulary not to load.')
-def load(name, exclude):
+@click.option(u'-f', u'--full', u'full', is_flag=True, help=u'Reload all rows, even if the vocabulary is already in the database.')
+@click.option(u'-j', u'--jobs', u'jobs', type=int, default=1, show_default=True, help=u'Number of vocabularies fetched and parsed in parallel.')
+@click.option(u'-s', u'--stream', u'stream', is_flag=True, help=u'Load the vocabularies with a streaming parser while they are parsed.')
+@click.option(u'--force', u'force', is_flag=True, help=u'Parse and load the vocabularies even if their source did not change.')
+@click.option(u'--offline', u'offline', is_flag=True, help=u'Only use the sources stored in the HTTP cache.')
+def load(name, exclude, full, jobs, stream, force, offline):
     '''Load vocabularies into CKAN database.
 
     To load all vocabularies:
@@ -148,6 +158,26 @@ def load(name, exclude):
 
          >>> ckan -c ckan.ini vocabulary load --exclude insee_official_geographic_code --exclude ogc_epsg
 
+    Vocabularies that are already in the database are
+    updated by inserting and deleting the changed rows only.
+    To fully reload them:
+
+        >>> ckan -c ckan.ini vocabulary load --full ecospheres_theme
+
+    Vocabularies whose source didn't change since their
+    last load are skipped. To parse and update them anyway:
+
+        >>> ckan -c ckan.ini vocabulary load --force ecospheres_theme
+
+    Sources are kept in an HTTP cache. To load the vocabularies
+    from the cache only, without network access:
+
+        >>> ckan -c ckan.ini vocabulary load --offline
+
+    To fetch and parse four vocabularies at a time:
+
+        >>> ckan -c ckan.ini vocabulary load --jobs 4
+
     Parameters
     ----------
     name : list(str), optional
@@ -158,14 +188,39 @@ def load(name, exclude):
         Names of the vocabularies that shall not be loaded.
         If `exclude` is used simultaneously with `name`, it will
         exclude vocabularies from this list.
+    full : bool, default False
+        If ``True``, the vocabularies are fully reloaded
+        instead of being updated, even if their source
+        didn't change.
+    jobs : int, default 1
+        Number of vocabularies fetched and parsed at the
+        same time, by a pool of processes.
+    stream : bool, default False
+        If ``True``, the vocabularies whose parser has a
+        streaming mode (such as ``insee_official_geographic_code``)
+        are loaded by chunks while they are parsed, which
+        bounds the memory used. Not available with `jobs`.
+    force : bool, default False
+        If ``True``, vocabularies are parsed and updated
+        even if their source didn't change.
+    offline : bool, default False
+        If ``True``, no request is sent and the sources
+        are read from the HTTP cache (see
+        :py:mod:`ckanext.ecospheres.vocabulary.parser.httpcache`).
 
     '''
+    if offline:
+        HttpCache.configure(offline=True)
     click.secho('Loading vocabularies...', fg=u'green')
     _exclude = []
     if exclude:
         for ex in exclude:
             _exclude.append(ex)
-    report = load_vocab(vocab_list=name, exclude=_exclude)
+    stats = {}
+    report = load_vocab(
+        vocab_list=name, exclude=_exclude, incremental=not full, stats=stats,
+        jobs=max(jobs, 1), streaming=stream, skip_unchanged=not (force or full)
+    )
     if not report:
         click.secho('No vocabulary has been loaded', fg=u'green')
     else:
@@ -176,3 +231,209 @@ def load(name, exclude):
             ),
             fg=u'green'
         )
+        for vocabulary in report:
+            vocab_stats = stats.get(vocabulary)
+            if not vocab_stats:
+                continue
+            if vocab_stats['mode'] == 'skipped':
+                click.echo('  {}: source unchanged, skipped'.format(vocabulary))
+                continue
+            if not vocab_stats['changed']:
+                click.echo('  {}: up to date'.format(vocabulary))
+                continue
+            click.echo('  {}: {} load, {}'.format(
+                vocabulary, vocab_stats['mode'], ', '.join(
+                    '{} +{} -{}'.format(
+                        table_name, table_stats.get('inserted', 0),
+                        table_stats.get('deleted', 0)
+                    ) for table_name, table_stats in vocab_stats['tables'].items()
+                )
+            ))
+
+@vocabulary.command(
+    help=u'Restore the previous generation of a vocabulary.',
+    short_help=u'Rollback a vocabulary.'
+)
+@click.argument(u'name')
+def rollback(name):
+    '''Restore the previous generation of a vocabulary.
+
+    When a vocabulary is loaded, the tables it replaces are
+    kept. This command swaps them back with the current tables.
+    Running it again restores the current tables.
+
+        >>> ckan -c ckan.ini vocabulary rollback ecospheres_theme
+
+    Parameters
+    ----------
+    name : str
+        Name of the vocabulary, ie its ``name``
+        property in ``vocabularies.yaml``.
+
+    '''
+    if rollback_vocab(name):
+        click.secho(
+            'The previous generation of vocabulary "{}" has been restored'.format(name),
+            fg=u'green'
+        )
+    else:
+        click.secho(
+            'Failed to restore the previous generation of vocabulary "{}"'.format(name),
+            fg=u'red'
+        )
+
+@vocabulary.command(
+    u'export-bundle',
+    help=u'Export vocabularies into a bundle file.',
+    short_help=u'Export vocabularies.'
+)
+@click.argument(u'path', type=click.Path(dir_okay=False, writable=True))
+@click.argument(u'name', required=False, nargs=-1)
+@click.option(u'-e', u'--exclude', u'exclude', multiple=True, help=u'A vocabulary not to export.')
+@click.option(u'-f', u'--fetch', u'fetch', is_flag=True, help=u'Fetch and parse the vocabularies instead of reading them from the database.')
+@click.option(u'-j', u'--jobs', u'jobs', type=int, default=1, show_default=True, help=u'Number of vocabularies fetched and parsed in parallel.')
+def export_bundle(path, name, exclude, fetch, jobs):
+    '''Export vocabularies into a bundle file.
+
+    The bundle can then be loaded into another CKAN
+    database without network access:
+
+        >>> ckan -c ckan.ini vocabulary export-bundle vocabularies.ndjson.gz
+
+    Parameters
+    ----------
+    path : str
+        Path of the bundle file.
+    name : list(str), optional
+        Names of vocabularies to export, ie their
+        ``name`` property in ``vocabularies.yaml``.
+        If not provided, all available vocabularies are exported.
+    exclude : list(str), optional
+        Names of the vocabularies that shall not be exported.
+    fetch : bool, default False
+        If ``True``, the vocabularies are fetched from their
+        registers and parsed, rather than read from the database.
+    jobs : int, default 1
+        Number of vocabularies fetched and parsed at the
+        same time, when `fetch` is ``True``.
+
+    '''
+    report = bundle.export_bundle(
+        path, vocab_list=name, exclude=exclude, fetch=fetch, jobs=max(jobs, 1)
+    )
+    if not report:
+        click.secho('No vocabulary has been exported', fg=u'red')
+    else:
+        click.secho('{} vocabular{} been exported: {}'.format(
+                len(report),
+                'ies have' if len(report) > 1 else 'y has',
+                ', '.join(report)
+            ),
+            fg=u'green'
+        )
+
+@vocabulary.command(
+    u'import-bundle',
+    help=u'Load the vocabularies of a bundle file into CKAN database.',
+    short_help=u'Import vocabularies.'
+)
+@click.argument(u'path', type=click.Path(exists=True, dir_okay=False))
+@click.argument(u'name', required=False, nargs=-1)
+@click.option(u'-e', u'--exclude', u'exclude', multiple=True, help=u'A vocabulary not to load.')
+@click.option(u'-f', u'--full', u'full', is_flag=True, help=u'Reload all rows, even if the vocabulary is already in the database.')
+def import_bundle(path, name, exclude, full):
+    '''Load the vocabularies of a bundle file into CKAN database.
+
+    No network access is needed, and the vocabularies
+    are not parsed again:
+
+        >>> ckan -c ckan.ini vocabulary import-bundle vocabularies.ndjson.gz
+
+    Parameters
+    ----------
+    path : str
+        Path of the bundle file, as created by the
+        ``export-bundle`` command.
+    name : list(str), optional
+        Names of vocabularies to load, ie their
+        ``name`` property in ``vocabularies.yaml``.
+        If not provided, all available vocabularies of
+        the bundle are loaded.
+    exclude : list(str), optional
+        Names of the vocabularies that shall not be loaded.
+    full : bool, default False
+        If ``True``, the vocabularies are fully reloaded
+        instead of being updated.
+
+    '''
+    click.secho('Loading vocabularies...', fg=u'green')
+    try:
+        report = bundle.import_bundle(
+            path, vocab_list=name, exclude=exclude, incremental=not full
+        )
+    except ValueError as e:
+        click.secho(str(e), fg=u'red')
+        return
+    if not report:
+        click.secho('No vocabulary has been loaded', fg=u'green')
+    else:
+        click.secho('{} vocabular{} been loaded: {}'.format(
+                len(report),
+                'ies have' if len(report) > 1 else 'y has',
+                ', '.join(report)
+            ),
+            fg=u'green'
+        )
+
+@vocabulary.command(
+    help=u'Show the metadata values without vocabulary match for a harvest job.',
+    short_help=u'Unmatched values report.'
+)
+@click.argument(u'harvest_job_id')
+@click.option(
+    u'-l', u'--limit', u'limit', type=int,
+    help=u'Maximum number of values to list for each field.'
+)
+@click.option(
+    u'-j', u'--json', u'as_json',
+    help=u'Use this flag to get the report as JSON.',
+    is_flag=True, flag_value=True
+)
+def unmatched(harvest_job_id, limit, as_json):
+    '''Show the metadata values without vocabulary match for a harvest job.
+
+    Basic usage:
+
+        >>> ckan -c ckan.ini vocabulary unmatched 2d1c6a5e-63b0-4b6e-9a4e-3b8e4a9d5f21
+
+    Parameters
+    ----------
+    harvest_job_id : str
+        Identifier of the harvest job.
+    limit : int, optional
+        Maximum number of values to list for each field,
+        the most frequent values being listed first.
+    as_json : bool, default False
+        If ``True``, the report is printed as JSON.
+
+    '''
+    report = UnmatchedValuesReport.read(harvest_job_id, limit=limit)
+    if report is None:
+        click.secho('Failed to read the report', fg=u'red')
+        return
+    if as_json:
+        click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    if not report['distinct']:
+        click.secho('< No result >', fg=u'green')
+        return
+    click.secho(
+        '{} occurrences of {} unmatched values'.format(
+            report['total'], report['distinct']
+        ),
+        fg=u'green'
+    )
+    for field_path, values in report['fields'].items():
+        click.secho(field_path, fg=u'green', bold=True)
+        for value in values:
+            click.echo('  {count:>6}  {value}'.format(**value))
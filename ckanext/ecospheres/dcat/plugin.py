@@ -1,6 +1,7 @@
 import collections
 import json
 import re
+import threading
 from urllib import parse
 
 from flask import Blueprint
@@ -11,8 +12,9 @@ from ckan.lib.helpers import lang
 import ckanext.ecospheres.validators as v
 import ckanext.ecospheres.helpers as helpers
 from ckanext.ecospheres import cli
+from ckanext.ecospheres.vocabulary.cache import VocabularyCache
 from ckanext.ecospheres.vocabulary.reader import VocabularyReader
-from ckanext.ecospheres.vocabulary.loader import load_vocab as load_all_vocab
+from ckanext.ecospheres.vocabulary.jobs import VocabularyLoadJobs
 from ckanext.ecospheres.views import organizations_by_admin_type
 
 
@@ -25,7 +27,22 @@ class DcatFrenchPlugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IPackageController, inherit=True)
     plugins.implements(plugins.IBlueprint)
     plugins.implements(plugins.IClick)
-    
+    plugins.implements(plugins.IConfigurable)
+
+    warm_up_vocabularies = []
+    warm_up_in_background = True
+    warm_up_started = False
+    warm_up_lock = threading.Lock()
+
+    # ------------- IConfigurable ---------------#
+    def configure(self, config):
+        VocabularyCache.configure(config)
+        self.warm_up_vocabularies = plugins.toolkit.aslist(
+            config.get('ckanext.ecospheres.vocabulary_cache.warm_up', '')
+        )
+        self.warm_up_in_background = plugins.toolkit.asbool(
+            config.get('ckanext.ecospheres.vocabulary_cache.warm_up_in_background', True)
+        )
     
     # ------------- IClick ---------------#
     def get_commands(self):
@@ -321,16 +338,37 @@ class DcatFrenchPlugin(plugins.SingletonPlugin):
         for rule in rules:
             blueprint.add_url_rule(*rule)
 
+        # Préchargement des vocabulaires à la première requête, pour
+        # ne pas le déclencher lors de l'exécution des commandes ckan
+        # (before_app_first_request n'existe plus depuis Flask 2.3)
+        @blueprint.before_app_request
+        def _warm_up_vocabulary_cache():
+            if self.warm_up_started:
+                return
+            with self.warm_up_lock:
+                if self.warm_up_started:
+                    return
+                self.warm_up_started = True
+            if not self.warm_up_vocabularies:
+                return
+            if self.warm_up_in_background:
+                threading.Thread(
+                    target=VocabularyReader.warm_up,
+                    args=(self.warm_up_vocabularies,),
+                    name='ecospheres-vocabulary-warm-up',
+                    daemon=True
+                ).start()
+            else:
+                VocabularyReader.warm_up(self.warm_up_vocabularies)
+
         from flask import request
-        @blueprint.route('/api/load-vocab', methods=["POST"])
-        def _load_vocab_():
-        
+
+        def _check_sysadmin():
             import ckan.lib.base as base
             import ckan.model as model
             import ckan.logic as logic
             c = base.c
 
-
             context = {'model': model,
                 'user': c.user, 'auth_user_obj': c.userobj}
             try:
@@ -338,27 +376,43 @@ class DcatFrenchPlugin(plugins.SingletonPlugin):
             except logic.NotAuthorized:
                 base.abort(403, 'Need to be system administrator to administer')
 
-            vocab = request.get_json()
-            import threading
+        @blueprint.route('/api/load-vocab', methods=["POST"])
+        def _load_vocab_():
+            _check_sysadmin()
 
-            vocab_list=vocab.get("vocab_list",[])
+            vocab = request.get_json(silent=True) or {}
+            vocab_list = vocab.get("vocab_list", [])
 
-            class BackgroundTasks(threading.Thread):
-                def run(self,*args,**kwargs):
-                    load_all_vocab(vocab_list=vocab_list)
+            # un job par vocabulaire (partagé avec les vocabulaires
+            # dont il dépend), dans la file de CKAN ; les vocabulaires
+            # déjà en attente ou en cours de chargement ne sont pas
+            # ajoutés une seconde fois
+            report = VocabularyLoadJobs.enqueue(vocab_list=vocab_list)
 
-            t = BackgroundTasks()
-            t.start()    
-               
-            if vocab_list!=[]:
-                msg=f'chargement des vocabulaires: { "".join(vocab.get("vocab_list",None)) } lancé'
+            if vocab_list != []:
+                msg = f'chargement des vocabulaires: { ", ".join(report["queued"]) } lancé'
             else:
-                msg='chargement de tous les vocabulaires lancé'
-            
+                msg = 'chargement de tous les vocabulaires lancé'
+            if report['skipped']:
+                msg += f' (déjà en cours: { ", ".join(report["skipped"]) })'
+            if report['failed']:
+                msg += f' (échec: { ", ".join(report["failed"]) })'
+
             return {
-                "msg": msg
-            
-                        }
+                "msg": msg,
+                **report
+            }
+
+        @blueprint.route('/api/load-vocab/status', methods=["GET"])
+        def _load_vocab_status_():
+            _check_sysadmin()
+
+            vocab_list = request.args.getlist('vocabulary')
+            status = VocabularyLoadJobs.status(vocab_list=vocab_list or None)
+            if status is None:
+                return {"msg": "état des chargements indisponible"}, 503
+            return {"jobs": status}
+
         return blueprint
 
 def _extract_pattern(pattern, string):
@@ -2,15 +2,16 @@
 import logging
 import datetime
 import re
+from collections.abc import Mapping
 
 from rdflib import Literal, BNode
-from rdflib.util import from_n3
 from rdflib.namespace import Namespace
 
 import ckan.plugins.toolkit as toolkit
 from ckanext.dcat.profiles import RDFProfile, CleanedURIRef
 
 from ckanext.ecospheres.helpers import ecospheres_get_package_uri
+from ckanext.ecospheres.scheming.registry import SchemaRegistry
 
 from .dataset.parse_dataset import parse_dataset as _parse_dataset
 from .graph.graph_from_catalog import graph_from_catalog as _graph_from_catalog
@@ -155,7 +156,7 @@ class EcospheresDCATAPProfile(RDFProfile):
                 prefix, namespace, override=True, replace=True
             )
         
-        schema = dataset_schema()
+        registry = SchemaRegistry.get(dataset_schema(), namespaces=NAMESPACES)
         if dataset_ref_str := dataset_dict.get('uri'):
             dataset_ref = CleanedURIRef(dataset_ref_str)
         else:
@@ -166,7 +167,7 @@ class EcospheresDCATAPProfile(RDFProfile):
         # champs décrivant le jeu de données
         self._graph_from_dataset_and_schema(
             dataset_dict,
-            schema.get('dataset_fields'),
+            registry.dataset_fields,
             dataset_ref,
             dataset_ref
         )
@@ -184,7 +185,7 @@ class EcospheresDCATAPProfile(RDFProfile):
                 
                 self._graph_from_dataset_and_schema(
                     resource_dict,
-                    schema.get('resource_fields'),
+                    registry.resource_fields,
                     node,
                     dataset_ref
                 )
@@ -192,20 +193,14 @@ class EcospheresDCATAPProfile(RDFProfile):
                     self.g.add((dataset_ref, DCAT.distribution, node))
                     self.g.add((node, RDF.type, DCAT.Distribution))
     
-    def _read_rdf_path(self, rdf_path, subject):
-        if len(rdf_path) == 2:
-            return (
-                subject,
-                from_n3(rdf_path[0], nsm=self.g.namespace_manager),
-                from_n3(rdf_path[1], nsm=self.g.namespace_manager)
-            )
+    def _read_rdf_path(self, rdf_terms, subject):
+        if len(rdf_terms) == 2:
+            return (subject, rdf_terms[0], rdf_terms[1])
         else:
             node = BNode()
-            property = from_n3(rdf_path[0], nsm=self.g.namespace_manager)
-            self.g.add((subject, property, node))
-            rdftype = from_n3(rdf_path[1], nsm=self.g.namespace_manager)
-            self.g.add((node, RDF.type, rdftype))
-            return self._read_rdf_path(rdf_path[2:], node)
+            self.g.add((subject, rdf_terms[0], node))
+            self.g.add((node, RDF.type, rdf_terms[1]))
+            return self._read_rdf_path(rdf_terms[2:], node)
 
     def _graph_from_dataset_and_schema(
         self, fields_data, fields_schema, subject, dataset_ref
@@ -226,7 +221,7 @@ class EcospheresDCATAPProfile(RDFProfile):
                 'skipped during serialization'
                 )
             return
-        if not isinstance(fields_schema, list):
+        if not isinstance(fields_schema, Mapping):
             logger.debug(
                 f'< {dataset_ref} > Data for ill-formed '
                 'schema skipped during serialization'
@@ -244,25 +239,21 @@ class EcospheresDCATAPProfile(RDFProfile):
                 continue
 
             # recherche de la description du champ
-            for field_dict in fields_schema:
-                if field_dict.get('field_name') == field:
-                    field_schema = field_dict
-                    break
-            else:
+            field_schema = fields_schema.get(field)
+            if field_schema is None:
                 logger.debug(
                     f'< {dataset_ref} > Unknown field "{field}" '
                     'skipped during serialization'
                 )
                 continue
             
-            value_type = field_schema.get('value_type')
+            value_type = field_schema.value_type
 
             # création des parents implicites
-            rdf_path = field_schema.get('rdf_path')
-            if not rdf_path:
+            if not field_schema.rdf_terms:
                 continue
             field_subject, property, rdftype = self._read_rdf_path(
-                rdf_path, field_subject
+                field_schema.rdf_terms, field_subject
             )
 
             # cas particuliers
@@ -285,7 +276,7 @@ class EcospheresDCATAPProfile(RDFProfile):
                 and value
                 and isinstance(value[0], dict)
             ):
-                subfields_schema = field_schema.get('repeating_subfields')
+                subfields_schema = field_schema.subfields
                 if not subfields_schema:
                     continue
                 for subfields_data in value:
@@ -317,7 +308,7 @@ class EcospheresDCATAPProfile(RDFProfile):
             
             # valeur littérale
             elif value_type == 'literal':
-                if field_schema.get('translatable_values'):
+                if field_schema.definition.get('translatable_values'):
                     if not isinstance(value, dict):
                         return
                     for language, e in value.items():
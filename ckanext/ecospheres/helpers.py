@@ -15,6 +15,7 @@ import ckan.plugins.toolkit as toolkit
 from ckanext.ecospheres.vocabulary.reader import VocabularyReader
 from ckanext.ecospheres.vocabulary.search import search_label
 from ckanext.ecospheres.maps import TYPE_ADMINISTRATION
+from ckanext.ecospheres.scheming.registry import SchemaRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -257,14 +258,13 @@ def ecospheres_get_field_dict(field_name, schema, resource_field=False):
         ``None`` if the field doesn't exist.
     
     '''
+    registry = SchemaRegistry.get(schema)
     if resource_field:
-        fields = schema.get('resource_fields', [])
+        field = registry.resource_fields.get(field_name)
     else:
-        fields = schema.get('dataset_fields', [])
-    
-    for field in fields:
-        if field.get('field_name') == field_name:
-            return field
+        field = registry.dataset_fields.get(field_name)
+    if field:
+        return field.definition
 
 def ecospheres_is_empty(data_dict, subfield=None):
     '''Is the subfield value empty?
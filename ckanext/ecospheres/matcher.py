@@ -0,0 +1,201 @@
+"""
+Compiled matchers for the term maps of :py:mod:`ckanext.ecospheres.maps`.
+
+Maps such as :py:data:`ckanext.ecospheres.maps.LICENSE_MAP` or
+:py:data:`ckanext.ecospheres.maps.RIGHTS_STATEMENT_MAP` associate
+tuples of terms with a value. A string matches a key if it contains
+all the terms of the tuple (case insensitive), and the first matching
+key wins.
+
+Instead of testing every term of every key against every string,
+:py:class:`TermMatcher` finds all the terms contained in a string
+with a single scan of the string (Aho-Corasick automaton), then
+picks the first key whose terms were all found. Results are cached
+per string.
+
+>>> from ckanext.ecospheres.maps import LICENSE_MAP
+>>> compile_map(LICENSE_MAP).lookup('Licence Ouverte Etalab 2.0')
+'https://spdx.org/licenses/etalab-2.0'
+
+"""
+import threading
+from collections import OrderedDict, deque
+
+class TermMatcher:
+    """Matcher compiled from a term map.
+
+    Parameters
+    ----------
+    map : dict
+        The map. With `map_type` ``'all'``, its keys
+        are tuples of terms. With `map_type` ``'exact'``,
+        its keys are strings.
+    map_type : {'all', 'exact'}, default 'all'
+        * If ``'all'``, a string matches a key if it contains
+          all terms of the tuple (case unsensitive).
+        * If ``'exact'``, a string matches a key if it's equal
+          to the key (case unsensitive).
+    cache_size : int, default 1024
+        Maximum number of strings whose classification
+        is cached.
+
+    """
+
+    def __init__(self, map, map_type='all', cache_size=1024):
+        if not map_type in ('all', 'exact'):
+            raise ValueError(f'Unknown map type "{map_type}"')
+        self.map_type = map_type
+        self.cache_size = cache_size
+        self._values = list(map.values())
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        if map_type == 'exact':
+            self._exact = {}
+            for index, key in enumerate(map):
+                self._exact.setdefault(key.lower(), index)
+            return
+
+        terms = {}
+        self._key_terms = []
+        self._always = []
+        self._keys_by_term = {}
+        for index, key in enumerate(map):
+            key_terms = {
+                terms.setdefault(term.lower(), len(terms))
+                for term in key if term
+            }
+            self._key_terms.append(key_terms)
+            if not key_terms:
+                # a key without terms matches anything
+                self._always.append(index)
+            for term_id in key_terms:
+                self._keys_by_term.setdefault(term_id, []).append(index)
+        self._build_automaton(terms)
+
+    def _build_automaton(self, terms):
+        self._goto = [{}]
+        self._output = [set()]
+        for term, term_id in terms.items():
+            node = 0
+            for char in term:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._output.append(set())
+                node = next_node
+            self._output[node].add(term_id)
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and not char in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._output[child] |= self._output[self._fail[child]]
+
+    def _find_terms(self, string):
+        found = set()
+        node = 0
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        for char in string:
+            while node and not char in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+        return found
+
+    def _match(self, string):
+        string = string.lower()
+        if self.map_type == 'exact':
+            return self._exact.get(string)
+        found = self._find_terms(string)
+        candidates = set(self._always)
+        for term_id in found:
+            candidates.update(self._keys_by_term[term_id])
+        for index in sorted(candidates):
+            if self._key_terms[index] <= found:
+                return index
+
+    def match(self, string):
+        """Return the position of the first key matching the string.
+
+        Parameters
+        ----------
+        string : str
+            The string to classify.
+
+        Returns
+        -------
+        int or None
+            Position of the key in the map, or ``None``
+            if no key matches.
+
+        """
+        with self._lock:
+            if string in self._cache:
+                self._cache.move_to_end(string)
+                return self._cache[string]
+        index = self._match(string)
+        with self._lock:
+            self._cache[string] = index
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return index
+
+    def lookup(self, string, default=None):
+        """Return the map value of the first key matching the string.
+
+        Parameters
+        ----------
+        string : str
+            The string to classify.
+        default : optional
+            Value to return when no key matches.
+
+        """
+        index = self.match(string)
+        if index is None:
+            return default
+        return self._values[index]
+
+_COMPILED = {}
+_compiled_lock = threading.Lock()
+
+def compile_map(map, map_type='all'):
+    """Return the :py:class:`TermMatcher` for a map.
+
+    Matchers are compiled once per map object, maps
+    are not expected to be modified afterwards.
+
+    Parameters
+    ----------
+    map : dict
+        See :py:class:`TermMatcher`.
+    map_type : {'all', 'exact'}, default 'all'
+        See :py:class:`TermMatcher`.
+
+    Returns
+    -------
+    TermMatcher
+
+    """
+    key = (id(map), map_type)
+    with _compiled_lock:
+        compiled = _COMPILED.get(key)
+        # the map itself is kept alongside the matcher, so
+        # that its id can't be reused by another object
+        if compiled is None or compiled[0] is not map:
+            compiled = _COMPILED[key] = (map, TermMatcher(map, map_type=map_type))
+        return compiled[1]
@@ -0,0 +1,317 @@
+"""
+Compiled index of the dataset schema.
+
+The schema is walked once, and every field or subfield
+is registered under its path, ie the tuple of the field
+names from the first level field to the subfield. As in
+:py:class:`ckanext.ecospheres.vocabulary.search.FieldsVocabularies`,
+paths of resource fields begin with the keyword ``'resource'``.
+
+>>> registry = SchemaRegistry.get()
+>>> registry.field(('category', 'uri')).vocabularies
+('ecospheres_theme',)
+>>> registry.vocabularies('category')
+('ecospheres_theme',)
+>>> registry.field(('resource', 'license', 'uri')).value_type
+'uri'
+
+By default, the schema is the one registered by ckanext-scheming
+for datasets, or, outside of CKAN, the ``ecospheres_dataset_schema.yaml``
+file. It is only compiled again when the schema changes.
+
+"""
+
+import logging
+import threading
+from pathlib import Path
+from types import MappingProxyType
+
+import yaml
+from rdflib import Graph
+from rdflib.namespace import NamespaceManager
+from rdflib.util import from_n3
+
+from ckanext.ecospheres.scheming import __path__ as scheming_path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = Path(scheming_path[0]) / 'ecospheres_dataset_schema.yaml'
+
+class FieldDefinition:
+    """Read-only description of a field or subfield of the schema.
+
+    Attributes
+    ----------
+    path : tuple(str)
+        Path of the field.
+    name : str
+        Name of the field, ie the last element of its path.
+    definition : dict
+        The field definition, as provided by the schema.
+        It should not be modified.
+    vocabularies : tuple(str)
+        Names of the field's vocabularies, if any.
+    value_type : str or None
+        Type of the field's values.
+    rdf_path : tuple(str)
+        The field's ``rdf_path``, as written in the schema.
+    rdf_terms : tuple(rdflib.term.URIRef) or None
+        The field's ``rdf_path`` with its CURIEs resolved,
+        if the namespaces were provided when compiling
+        the schema and all the prefixes are known. ``None``
+        otherwise.
+    subfields : mappingproxy
+        The field's repeating subfields, as
+        :py:class:`FieldDefinition` objects, by name.
+
+    """
+
+    __slots__ = (
+        'path', 'name', 'definition', 'vocabularies',
+        'value_type', 'rdf_path', 'rdf_terms', 'subfields'
+    )
+
+    def __init__(self, path, definition, namespace_manager=None):
+        set_attr = super().__setattr__
+        set_attr('path', path)
+        set_attr('name', path[-1])
+        set_attr('definition', definition)
+        set_attr('vocabularies', tuple(definition.get('vocabularies') or ()))
+        set_attr('value_type', definition.get('value_type'))
+        set_attr('rdf_path', tuple(definition.get('rdf_path') or ()))
+        set_attr('rdf_terms', _resolve_rdf_path(self.rdf_path, namespace_manager))
+        subfields = {}
+        for subfield_dict in definition.get('repeating_subfields') or ():
+            if subfield_name := subfield_dict.get('field_name'):
+                subfields[subfield_name] = FieldDefinition(
+                    path + (subfield_name,), subfield_dict,
+                    namespace_manager=namespace_manager
+                )
+            else:
+                logger.error(f'Missing "field_name" key for a subfield of "{path}"')
+        set_attr('subfields', MappingProxyType(subfields))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} objects are read-only')
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path!r})'
+
+    def walk(self):
+        """Iterate over the field and all its descendants."""
+        yield self
+        for subfield in self.subfields.values():
+            yield from subfield.walk()
+
+def _resolve_rdf_path(rdf_path, namespace_manager):
+    if not rdf_path or namespace_manager is None:
+        return None
+    try:
+        return tuple(
+            from_n3(curie, nsm=namespace_manager) for curie in rdf_path
+        )
+    except Exception as error:
+        logger.error(f'Failed to resolve rdf_path "{rdf_path}". {error}')
+
+class SchemaRegistry:
+    """Compiled, read-only index of a dataset schema.
+
+    Registries should be obtained with :py:meth:`SchemaRegistry.get`,
+    which only compiles the schema once.
+
+    Parameters
+    ----------
+    schema : dict
+        A ckanext-scheming's dataset schema.
+    namespaces : dict, optional
+        Namespaces (by prefix) to use for resolving
+        the ``rdf_path`` of the fields.
+
+    Attributes
+    ----------
+    schema : dict
+        The schema.
+    dataset_fields : mappingproxy
+        The first level dataset fields, as
+        :py:class:`FieldDefinition` objects, by name.
+    resource_fields : mappingproxy
+        The first level resource fields, as
+        :py:class:`FieldDefinition` objects, by name.
+
+    """
+
+    MAX_COMPILED = 8
+
+    _COMPILED = {}
+    _file_schema = None
+    _lock = threading.Lock()
+
+    def __init__(self, schema, namespaces=None):
+        self.schema = schema
+        namespace_manager = None
+        if namespaces is not None:
+            namespace_manager = NamespaceManager(Graph())
+            for prefix, namespace in namespaces.items():
+                namespace_manager.bind(
+                    prefix, namespace, override=True, replace=True
+                )
+        self.dataset_fields = self._compile_fields(
+            (), schema.get('dataset_fields'), namespace_manager
+        )
+        self.resource_fields = self._compile_fields(
+            ('resource',), schema.get('resource_fields'), namespace_manager
+        )
+        index = {}
+        vocabularies = {}
+        for fields in (self.dataset_fields, self.resource_fields):
+            for field in fields.values():
+                for descendant in field.walk():
+                    index[descendant.path] = descendant
+                    if not descendant.vocabularies:
+                        continue
+                    vocabularies[descendant.path] = descendant.vocabularies
+                    # the vocabularies of "uri" subfields can
+                    # also be accessed from the parent's path
+                    parent_path = descendant.path[:-1]
+                    if (
+                        descendant.name == 'uri'
+                        and not vocabularies.get(parent_path)
+                    ):
+                        vocabularies[parent_path] = descendant.vocabularies
+        self._index = MappingProxyType(index)
+        self._vocabularies = MappingProxyType(vocabularies)
+
+    @staticmethod
+    def _compile_fields(parent_path, fields_list, namespace_manager):
+        fields = {}
+        for field_dict in fields_list or ():
+            if field_name := field_dict.get('field_name'):
+                fields[field_name] = FieldDefinition(
+                    parent_path + (field_name,), field_dict,
+                    namespace_manager=namespace_manager
+                )
+            else:
+                logger.error('Missing "field_name" key for a field of the schema')
+        return MappingProxyType(fields)
+
+    def __iter__(self):
+        return iter(self._index.values())
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, field_path):
+        return _normalize_path(field_path) in self._index
+
+    def field(self, field_path):
+        """Return the definition of a field or subfield.
+
+        Parameters
+        ----------
+        field_path : tuple(str) or str
+            The path of the field or subfield in the
+            metadata schema. For resource fields, the path
+            should begin with the keyword ``'resource'``.
+            Strings are allowed for single-element paths.
+
+        Returns
+        -------
+        FieldDefinition or None
+            ``None`` if the field doesn't exist.
+
+        """
+        return self._index.get(_normalize_path(field_path))
+
+    def vocabularies(self, field_path):
+        """List the field's vocabularies, if any.
+
+        Contrary to :py:attr:`FieldDefinition.vocabularies`,
+        the ``'uri'`` element at the end of the path can
+        be omitted.
+
+        Parameters
+        ----------
+        field_path : tuple(str) or str
+            The path of the field or subfield in the
+            metadata schema.
+
+        Returns
+        -------
+        tuple(str)
+
+        """
+        return self._vocabularies.get(_normalize_path(field_path), ())
+
+    @classmethod
+    def get(cls, schema=None, namespaces=None):
+        """Return the compiled registry for a schema.
+
+        Parameters
+        ----------
+        schema : dict, optional
+            A ckanext-scheming's dataset schema. If not
+            provided, the schema registered for datasets is
+            used, or the ``ecospheres_dataset_schema.yaml``
+            file if ckanext-scheming isn't available.
+        namespaces : dict, optional
+            Namespaces (by prefix) to use for resolving
+            the ``rdf_path`` of the fields.
+
+        Returns
+        -------
+        SchemaRegistry
+
+        """
+        if schema is None:
+            schema = cls._default_schema()
+        key = (id(schema), id(namespaces))
+        with cls._lock:
+            compiled = cls._COMPILED.get(key)
+            # the schema and namespaces themselves are kept alongside
+            # the registry, so that their ids can't be reused
+            if (
+                compiled is None
+                or compiled[0] is not schema
+                or compiled[1] is not namespaces
+            ):
+                compiled = (schema, namespaces, cls(schema, namespaces=namespaces))
+                cls._COMPILED[key] = compiled
+                while len(cls._COMPILED) > cls.MAX_COMPILED:
+                    del cls._COMPILED[next(iter(cls._COMPILED))]
+            return compiled[2]
+
+    @classmethod
+    def clear(cls):
+        """Forget all compiled registries."""
+        with cls._lock:
+            cls._COMPILED.clear()
+            cls._file_schema = None
+
+    @classmethod
+    def _default_schema(cls):
+        try:
+            import ckan.plugins.toolkit as toolkit
+            # ckanext-scheming keeps its schemas in memory, the
+            # same object is returned until the schema is reloaded
+            return toolkit.get_action('scheming_dataset_schema_show')(
+                None, {'type': 'dataset'}
+            )
+        except Exception as error:
+            logger.debug(
+                f'Dataset schema not available from ckanext-scheming, '
+                f'reading "{SCHEMA_PATH}" instead. {error}'
+            )
+        mtime = SCHEMA_PATH.stat().st_mtime_ns
+        with cls._lock:
+            if cls._file_schema and cls._file_schema[0] == mtime:
+                return cls._file_schema[1]
+        with open(SCHEMA_PATH, 'r', encoding='utf-8') as src:
+            schema = yaml.load(src.read(), yaml.Loader)
+        with cls._lock:
+            cls._file_schema = (mtime, schema)
+        return schema
+
+def _normalize_path(field_path):
+    if isinstance(field_path, str):
+        return (field_path,)
+    return tuple(field_path or ())
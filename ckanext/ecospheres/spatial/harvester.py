@@ -23,10 +23,12 @@ from ckanext.ecospheres.maps import (
     ISO_639_2, DCAT_ENDPOINT_FORMATS, RIGHTS_STATEMENT_MAP,
     LICENSE_MAP, RESTRICTED_ACCESS_URIS, DATA_SERVICES_URIS
 )
+from ckanext.ecospheres.matcher import compile_map
 from ckanext.ecospheres.vocabulary.reader import VocabularyReader
 from ckanext.ecospheres.vocabulary.search import (
-    search_uri, search_territory
+    search_uri, search_uri_many, search_territory, search_scope
 )
+from ckanext.ecospheres.vocabulary.unmatched import unmatched_scope
 from ckanext.ecospheres.helpers import get_org_territories
 
 logger = logging.getLogger(__name__)
@@ -75,6 +77,15 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
         and :py:func:`ckanext.spatial.interface.ISpatialHarvester.get_package_dict`.
         
         '''
+        # les résultats des recherches dans les vocabulaires sont
+        # mémorisés le temps du moissonnage, et les valeurs sans
+        # correspondance sont comptabilisées dans le rapport du moissonnage
+        harvest_job_id = data_dict['harvest_object'].harvest_job_id
+        with search_scope(harvest_job_id), unmatched_scope(harvest_job_id):
+            return self._get_package_dict(context, data_dict)
+
+    def _get_package_dict(self, context, data_dict):
+        '''See :py:meth:`FrSpatialHarvester.get_package_dict`.'''
         package_dict = data_dict['package_dict']
         iso_values = data_dict['iso_values'] 
         xml_tree = data_dict['xml_tree']
@@ -277,8 +288,9 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
             iso_values.get('topic-category', [])
         )
         if iso_categories:
+            theme_uris = search_uri_many('theme', iso_categories)
             for iso_category in iso_categories:
-                theme_uri =  search_uri('theme', iso_category)
+                theme_uri = theme_uris.get(iso_category)
                 if theme_uri:
                     dataset_dict.set_value('theme', theme_uri)
 
@@ -286,8 +298,9 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
             iso_values.get('keyword-inspire-theme', [])
         )
         if iso_themes:
+            theme_uris = search_uri_many('theme', iso_themes, warn_if_not_found=False)
             for iso_theme in iso_themes:
-                theme_uri =  search_uri('theme', iso_theme, warn_if_not_found=False)
+                theme_uri = theme_uris.get(iso_theme)
                 if theme_uri:
                     dataset_dict.set_value('theme', theme_uri)
         
@@ -300,12 +313,13 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
             + dataset_dict.get_values('free_tags')
             + dataset_dict.get_values('title_translated')
         )
+        category_uris = search_uri_many(
+            'category', words, check_regexp=False, warn_if_not_found=False
+        )
+        # NB: regular expression search is done separately, to retrieve all
+        # matches instead of one
         for word in words:
-            category_uri = search_uri(
-                'category', word, check_regexp=False, warn_if_not_found=False
-            )
-            # NB: regular expression search is done separately, to retrieve all
-            # matches instead of one
+            category_uri = category_uris.get(word)
             if category_uri:
                 dataset_dict.set_value('category', category_uri)                
         category_uris = VocabularyReader.get_uris_from_regexp(
@@ -349,11 +363,12 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
         # doesn't have any associated search path for now. It's added
         # here in case future updates put it to use.
         
+        spatial_coverage_uris = search_uri_many(
+            'spatial_coverage', iso_extents, warn_if_not_found=False
+        )
         for iso_extent in iso_extents:
 
-            spatial_coverage_uri = search_uri(
-                'spatial_coverage', iso_extent, warn_if_not_found=False
-                )
+            spatial_coverage_uri = spatial_coverage_uris.get(iso_extent)
             if spatial_coverage_uri:
                 spatial_coverage_dict = dataset_dict.new_item('spatial_coverage')
                 spatial_coverage_dict.set_value('uri', spatial_coverage_uri)
@@ -457,8 +472,9 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
         states = iso_values.get('progress', [])
         # apparently admits more than one value, when DCAT does not
         # only the last valid value will be stored
+        state_uris = search_uri_many('status', states)
         for state in states:
-            if state_uri := search_uri('status', state):
+            if state_uri := state_uris.get(state):
                 dataset_dict.set_value('status', state_uri)
 
         # < crs >
@@ -472,8 +488,9 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
             )
         else:
             crss = crs if isinstance(crs, list) else [crs]
+        crs_uris = search_uri_many('crs', crss)
         for crs in crss:
-            if crs_uri := search_uri('crs', crs):
+            if crs_uri := crs_uris.get(crs):
                 dataset_dict.set_value('crs', crs_uri)
 
         # < language >
@@ -484,8 +501,9 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
                 'gmd:language/gco:CharacterString/text()',
                 namespaces=ISO_NAMESPACES
             )
+        data_language_uris = search_uri_many('language', data_languages)
         for data_language in data_languages:
-            data_language_uri = search_uri('language', data_language)
+            data_language_uri = data_language_uris.get(data_language)
             dataset_dict.set_value('language', data_language_uri)
 
         # < access_rights >, < rights >, < restricted_access >
@@ -515,10 +533,19 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
                 namespaces=ISO_NAMESPACES
             )
         )
+        access_rights_uris = search_uri_many(
+            'access_rights', rights_statements, warn_if_not_found=False
+        )
+        license_uris = search_uri_many(
+            'license', [
+                rights_statement for rights_statement in rights_statements
+                if not rights_statement in access_rights_uris
+                or not access_rights_uris[rights_statement]
+            ],
+            warn_if_not_found=False, map=LICENSE_MAP, map_type='all'
+        )
         for rights_statement in rights_statements:
-            if access_rights_uri := search_uri(
-                'access_rights', rights_statement, warn_if_not_found=False
-            ):
+            if access_rights_uri := access_rights_uris.get(rights_statement):
                 access_rights = dataset_dict.new_item('access_rights')
                 access_rights.set_value('uri', access_rights_uri)
                 registered = True
@@ -526,32 +553,24 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
                     restricted_access = True
                 continue
             elif not resource_license_uri:
-                if license_uri := search_uri(
-                    'license', rights_statement, warn_if_not_found=False,
-                    map=LICENSE_MAP, map_type='all'
-                ):
+                if license_uri := license_uris.get(rights_statement):
                     dataset_dict.set_value('license', license_uri)
                     resource_license_uri = license_uri
                     registered = True
                     continue
 
-            for statement_terms, field in RIGHTS_STATEMENT_MAP.items():
-                if all(
-                    statement_term.lower() in rights_statement.lower()
-                    for statement_term in statement_terms
-                ):
-                    if field == 'access_rights':
-                        access_rights = dataset_dict.new_item('access_rights')
-                        access_rights.set_value('label', rights_statement)
-                        registered = True
-                    elif (
-                        field == 'license'
-                        and not resource_license_uri
-                        and not resource_license_label
-                    ):
-                        resource_license_label = rights_statement
-                        registered = True
-                    break
+            field = compile_map(RIGHTS_STATEMENT_MAP).lookup(rights_statement)
+            if field == 'access_rights':
+                access_rights = dataset_dict.new_item('access_rights')
+                access_rights.set_value('label', rights_statement)
+                registered = True
+            elif (
+                field == 'license'
+                and not resource_license_uri
+                and not resource_license_label
+            ):
+                resource_license_label = rights_statement
+                registered = True
             if not registered:
                 dataset_dict.set_value('rights', rights_statement)
             
@@ -566,18 +585,25 @@ class FrSpatialHarvester(plugins.SingletonPlugin):
         resources_format_uris = []
         resources_format_labels = []
         if resources_formats:
-            for resource_format in resources_formats:
-                if not isinstance(resource_format, dict):
-                    continue
-                if resource_format_name := resource_format.get('name'):
-                    if resource_media_type_uri := search_uri(
-                        ('resource', 'media_type'), resource_format_name,
-                        warn_if_not_found=False
-                    ):
+            resources_format_names = [
+                resource_format.get('name') for resource_format in resources_formats
+                if isinstance(resource_format, dict)
+            ]
+            media_type_uris = search_uri_many(
+                ('resource', 'media_type'), resources_format_names,
+                warn_if_not_found=False
+            )
+            other_format_uris = search_uri_many(
+                ('resource', 'other_format'), [
+                    resource_format_name for resource_format_name in resources_format_names
+                    if not media_type_uris.get(resource_format_name)
+                ]
+            )
+            for resource_format_name in resources_format_names:
+                if resource_format_name:
+                    if resource_media_type_uri := media_type_uris.get(resource_format_name):
                         resources_media_type_uris.append(resource_media_type_uri)
-                    elif resource_format_uri := search_uri(
-                        ('resource', 'other_format'), resource_format_name
-                    ):
+                    elif resource_format_uri := other_format_uris.get(resource_format_name):
                         resources_format_uris.append(resource_format_uri)
                     else:
                         resources_format_labels.append(resource_format_name)
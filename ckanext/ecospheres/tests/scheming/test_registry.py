@@ -0,0 +1,100 @@
+from builtins import object
+
+import pytest
+from rdflib.namespace import Namespace
+
+from ckanext.ecospheres.scheming.registry import SchemaRegistry
+
+DCT = Namespace('http://purl.org/dc/terms/')
+SKOS = Namespace('http://www.w3.org/2004/02/skos/core#')
+
+SCHEMA = {
+    'dataset_fields': [
+        {
+            'field_name': 'title',
+            'value_type': 'literal',
+            'rdf_path': ['dct:title', 'rdf:langString'],
+        },
+        {
+            'field_name': 'theme',
+            'value_type': 'node or uri',
+            'rdf_path': ['dct:subject', 'skos:Concept'],
+            'repeating_subfields': [
+                {
+                    'field_name': 'uri',
+                    'value_type': 'uri',
+                    'vocabularies': ['theme_a', 'theme_b'],
+                },
+                {'field_name': 'label', 'value_type': 'literal'},
+            ],
+        },
+        {'label': 'Field without name'},
+    ],
+    'resource_fields': [
+        {
+            'field_name': 'license',
+            'value_type': 'node',
+            'vocabularies': ['licenses'],
+            'repeating_subfields': [
+                {
+                    'field_name': 'uri',
+                    'value_type': 'uri',
+                    'vocabularies': ['spdx'],
+                },
+            ],
+        },
+    ],
+}
+
+class TestSchemaRegistry(object):
+
+    def test_fields_by_path(self):
+        """Vérifie que les champs et sous-champs sont accessibles par leur chemin."""
+        registry = SchemaRegistry(SCHEMA)
+        assert len(registry) == 6
+        assert list(registry.dataset_fields) == ['title', 'theme']
+        assert registry.field('title').value_type == 'literal'
+        assert registry.field(['theme', 'uri']).vocabularies == ('theme_a', 'theme_b')
+        assert list(registry.field('theme').subfields) == ['uri', 'label']
+        assert registry.field(('resource', 'license', 'uri')).definition is \
+            SCHEMA['resource_fields'][0]['repeating_subfields'][0]
+        assert registry.field('license') is None
+        assert ('resource', 'license') in registry
+
+    def test_vocabularies(self):
+        """Vérifie que les vocabulaires des sous-champs "uri" sont aussi accessibles depuis le champ parent, sauf s'il a les siens."""
+        registry = SchemaRegistry(SCHEMA)
+        assert registry.vocabularies('theme') == ('theme_a', 'theme_b')
+        assert registry.vocabularies(('resource', 'license')) == ('licenses',)
+        assert registry.vocabularies(('resource', 'license', 'uri')) == ('spdx',)
+        assert registry.vocabularies('title') == ()
+
+    def test_rdf_path(self):
+        """Vérifie que les CURIE des chemins RDF sont résolus avec les espaces de nommage fournis."""
+        registry = SchemaRegistry(SCHEMA, namespaces={'dct': DCT, 'skos': SKOS})
+        assert registry.field('theme').rdf_path == ('dct:subject', 'skos:Concept')
+        assert registry.field('theme').rdf_terms == (DCT.subject, SKOS.Concept)
+        assert registry.field(('theme', 'uri')).rdf_terms is None
+        assert SchemaRegistry(SCHEMA).field('theme').rdf_terms is None
+
+    def test_read_only(self):
+        """Vérifie que les définitions compilées ne peuvent pas être modifiées."""
+        field = SchemaRegistry(SCHEMA).field('theme')
+        with pytest.raises(AttributeError):
+            field.value_type = 'uri'
+        with pytest.raises(TypeError):
+            field.subfields['other'] = field
+
+    def test_compiled_once(self):
+        """Vérifie que le schéma n'est compilé à nouveau que s'il a changé."""
+        registry = SchemaRegistry.get(SCHEMA)
+        assert SchemaRegistry.get(SCHEMA) is registry
+        assert SchemaRegistry.get(dict(SCHEMA)) is not registry
+        namespaces = {'dct': DCT}
+        assert SchemaRegistry.get(SCHEMA, namespaces=namespaces) is not registry
+
+    def test_default_schema(self):
+        """Vérifie que le schéma des jeux de données est compilé par défaut."""
+        registry = SchemaRegistry.get()
+        assert registry.field(('category', 'uri')).vocabularies == ('ecospheres_theme',)
+        assert SchemaRegistry.get() is registry
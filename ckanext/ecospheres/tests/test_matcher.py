@@ -0,0 +1,77 @@
+from builtins import object
+
+import pytest
+
+from ckanext.ecospheres.maps import LICENSE_MAP, RIGHTS_STATEMENT_MAP
+from ckanext.ecospheres.matcher import TermMatcher, compile_map
+
+def naive_lookup(map, string):
+    for map_key, map_value in map.items():
+        if all(term.lower() in string.lower() for term in map_key):
+            return map_value
+
+SAMPLES = [
+    'Licence Ouverte Etalab 2.0',
+    'Open Database License (ODbL)',
+    'licence ouverte',
+    'License: ODBL',
+    'Accès libre, licence Etalab',
+    'Pas de restriction d\'accès publique',
+    'Conditions inconnues',
+    '',
+]
+
+class TestTermMatcher(object):
+
+    @pytest.mark.parametrize('map', [LICENSE_MAP, RIGHTS_STATEMENT_MAP])
+    @pytest.mark.parametrize('string', SAMPLES)
+    def test_same_result_as_naive_matching(self, map, string):
+        """Vérifie que le résultat est identique à celui de la recherche terme à terme."""
+        assert compile_map(map).lookup(string) == naive_lookup(map, string)
+
+    def test_first_matching_key_wins(self):
+        """Vérifie que la première clé satisfaite l'emporte, même si une clé suivante est plus précise."""
+        matcher = TermMatcher({
+            ('ab',): 'first',
+            ('ab', 'cd'): 'second',
+            ('b',): 'third',
+        })
+        assert matcher.lookup('xxABcdxx') == 'first'
+        assert matcher.match('xxbxx') == 2
+        assert matcher.lookup('xxcdxx') is None
+        assert matcher.lookup('xxcdxx', default='none') == 'none'
+
+    def test_overlapping_terms(self):
+        """Vérifie que les termes imbriqués ou qui se chevauchent sont tous trouvés."""
+        matcher = TermMatcher({
+            ('licence ouverte', 'ouverte 2'): 'both',
+            ('cence',): 'suffix',
+        })
+        assert matcher.lookup('Licence Ouverte 2.0') == 'both'
+        assert matcher.lookup('Licence Ouverte') == 'suffix'
+
+    def test_key_without_terms(self):
+        """Vérifie qu'une clé sans terme correspond à toute chaîne."""
+        matcher = TermMatcher({('zz',): 'zz', (): 'any'})
+        assert matcher.lookup('zz') == 'zz'
+        assert matcher.lookup('aa') == 'any'
+
+    def test_exact_map(self):
+        """Vérifie la correspondance exacte, insensible à la casse."""
+        matcher = TermMatcher({'ODbL': 'odbl', 'odbl': 'other'}, map_type='exact')
+        assert matcher.lookup('ODBL') == 'odbl'
+        assert matcher.lookup('ODbL 1.0') is None
+
+    def test_unknown_map_type(self):
+        """Vérifie qu'un type de table inconnu est refusé."""
+        with pytest.raises(ValueError):
+            TermMatcher({}, map_type='any')
+
+    def test_cache(self):
+        """Vérifie que la classification des chaînes est mise en cache, dans la limite configurée."""
+        matcher = TermMatcher({('a',): 'a'}, cache_size=2)
+        for string in ('a', 'b', 'c'):
+            matcher.match(string)
+        assert list(matcher._cache) == ['b', 'c']
+        assert compile_map(LICENSE_MAP) is compile_map(LICENSE_MAP)
+        assert compile_map(LICENSE_MAP) is not compile_map(dict(LICENSE_MAP))
@@ -0,0 +1,190 @@
+from builtins import object
+import hashlib
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from ckanext.ecospheres.vocabulary.parser.exceptions import OfflineCacheMissError
+from ckanext.ecospheres.vocabulary.parser.httpcache import HttpCache
+from ckanext.ecospheres.vocabulary.parser.utils import fetch_data
+
+class _Handler(BaseHTTPRequestHandler):
+
+    requests = []
+    failures = 0
+
+    def do_GET(self):
+        _Handler.requests.append((self.path, self.headers.get('If-None-Match')))
+        if _Handler.failures:
+            _Handler.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        content = '{"path": "%s"}' % self.path
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content.encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    _Handler.requests = []
+    _Handler.failures = 0
+    server = HTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def cache(tmp_path):
+    HttpCache.configure(cache_dir=tmp_path, backoff=0)
+    yield HttpCache
+    HttpCache.configure()
+
+def _closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class TestHttpCache(object):
+
+    def test_conditional_request(self, server, cache):
+        """Vérifie que le contenu mis en cache est réutilisé si le serveur indique qu'il n'a pas changé."""
+        assert fetch_data(f'{server}/voc.json') == {'path': '/voc.json'}
+        assert fetch_data(f'{server}/voc.json') == {'path': '/voc.json'}
+        assert _Handler.requests == [('/voc.json', None), ('/voc.json', '"v1"')]
+        response = cache.get(f'{server}/voc.json')
+        assert response.from_cache
+        assert response.headers['Content-Type'] == 'application/json'
+
+    def test_params(self, server, cache):
+        """Vérifie que les paramètres de la requête font partie de la clé du cache."""
+        fetch_data(f'{server}/voc.json', params={'page': 1})
+        assert fetch_data(f'{server}/voc.json', params={'page': 2}) == {
+            'path': '/voc.json?page=2'
+        }
+        assert [if_none_match for _, if_none_match in _Handler.requests] == [None, None]
+
+    def test_headers_and_credentials(self, server, cache):
+        """Vérifie que les en-têtes et l'identité de la requête font partie de la clé du cache."""
+        url = f'{server}/voc.json'
+        fetch_data(url, headers={'Accept': 'application/json'})
+        fetch_data(url, headers={'accept': 'application/json'})
+        fetch_data(url, headers={'Accept': 'application/ld+json'})
+        fetch_data(url, auth=('user', 'secret'))
+        fetch_data(url, auth=('other', 'secret'))
+        fetch_data(url, auth=('other', 'secret'))
+        assert [if_none_match for _, if_none_match in _Handler.requests] == [
+            None, '"v1"', None, None, None, '"v1"'
+        ]
+        # unknown identity
+        fetch_data(url, auth=requests.auth.HTTPDigestAuth('user', 'secret'))
+        assert _Handler.requests[-1][1] is None
+        assert cache.key(url) == hashlib.sha256(url.encode('utf-8')).hexdigest()
+        assert cache.key(url, headers={'If-None-Match': '"v1"'}) == cache.key(url)
+
+    def test_offline(self, server, cache):
+        """Vérifie qu'en mode hors ligne, seul le contenu en cache est disponible."""
+        fetch_data(f'{server}/voc.json')
+        HttpCache.OFFLINE = True
+        assert fetch_data(f'{server}/voc.json', format='text') == '{"path": "/voc.json"}'
+        with pytest.raises(OfflineCacheMissError):
+            fetch_data(f'{server}/other.json')
+        assert len(_Handler.requests) == 1
+
+    def test_retries(self, server, cache):
+        """Vérifie que les requêtes en échec sont relancées."""
+        _Handler.failures = 2
+        assert fetch_data(f'{server}/voc.json') == {'path': '/voc.json'}
+        assert len(_Handler.requests) == 3
+        _Handler.failures = 10
+        with pytest.raises(requests.HTTPError):
+            fetch_data(f'{server}/other.json')
+
+    def test_unreachable(self, server, cache):
+        """Vérifie que le contenu en cache est utilisé lorsque le serveur est injoignable."""
+        url = f'http://127.0.0.1:{_closed_port()}/voc.json'
+        with pytest.raises(requests.ConnectionError):
+            fetch_data(url)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"cached": true}'
+        cache.write(cache.key(url), url, response)
+        assert fetch_data(url) == {'cached': True}
+
+    def test_describe(self, server, cache):
+        """Vérifie que l'empreinte du contenu est calculée sans le garder en mémoire, puis lue dans le cache."""
+        content = b'{"path": "/voc.json"}'
+        info = cache.describe(f'{server}/voc.json')
+        assert info['hash'] == hashlib.sha256(content).hexdigest()
+        assert info['headers']['ETag'] == '"v1"'
+        assert not info['from_cache']
+        # the parser finds the content in the cache
+        assert fetch_data(f'{server}/voc.json') == {'path': '/voc.json'}
+        assert cache.describe(f'{server}/voc.json') == dict(info, from_cache=True)
+        assert [if_none_match for _, if_none_match in _Handler.requests] == [
+            None, '"v1"', '"v1"'
+        ]
+
+    def test_describe_entry_without_hash(self, server, cache):
+        """Vérifie que l'empreinte d'une entrée du cache antérieure à son enregistrement est calculée."""
+        url = f'{server}/voc.json'
+        fetch_data(url)
+        key = cache.key(url)
+        meta = cache.read_meta(key)
+        del meta['hash']
+        cache.touch(key, meta)
+        info = cache.describe(url)
+        assert info['from_cache']
+        assert info['hash'] == hashlib.sha256(b'{"path": "/voc.json"}').hexdigest()
+        assert cache.read_meta(key)['hash'] == info['hash']
+
+    def test_server_error(self, server, cache):
+        """Vérifie que le contenu en cache est utilisé lorsque le serveur répond par une erreur."""
+        url = f'{server}/voc.json'
+        info = cache.describe(url)
+        _Handler.failures = 10
+        assert fetch_data(url) == {'path': '/voc.json'}
+        _Handler.failures = 10
+        assert cache.describe(url) == dict(info, from_cache=True)
+
+    def test_entry_replacement(self, server, cache):
+        """Vérifie que le contenu d'une entrée est désigné par ses métadonnées et que l'ancien contenu est supprimé."""
+        url = f'{server}/voc.json'
+        key = cache.key(url)
+        for content in (b'{"v": 1}', b'{"v": 2}'):
+            response = requests.Response()
+            response.status_code = 200
+            response._content = content
+            cache.write(key, url, response)
+        meta, body = cache.read(key)
+        assert body == b'{"v": 2}'
+        assert meta['hash'] == hashlib.sha256(body).hexdigest()
+        meta_path, body_path = cache._paths(key, meta)
+        assert sorted(path.name for path in meta_path.parent.iterdir()) == sorted(
+            [meta_path.name, body_path.name]
+        )
+        # entry stored before the content files were named after their hash
+        legacy_path = meta_path.parent / f'{key}.body'
+        legacy_path.write_bytes(b'{"v": 0}')
+        del meta['body']
+        cache.touch(key, meta)
+        assert cache.read(key)[1] == b'{"v": 0}'
+        assert cache.describe(url)['hash'] == hashlib.sha256(b'{"path": "/voc.json"}').hexdigest()
+        assert not legacy_path.exists()
+        assert cache.read(key)[1] == b'{"path": "/voc.json"}'
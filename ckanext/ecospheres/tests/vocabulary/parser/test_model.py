@@ -1,10 +1,16 @@
 from builtins import object
+import copy
+import json
+import pickle
+import random
+import sys
+
 import pytest
 
 from ckanext.ecospheres.vocabulary.parser.model import (
     InvalidConstraintError, TableNotNullConstraint, VocabularyDataCluster, VocabularyDataTable,
     VocabularyHierarchyTable, VocabularyRegexpTable, VocabularySpatialTable, VocabularySynonymTable,
-    VocabularyLabelTable, VocabularyAltLabelTable
+    VocabularyLabelTable, VocabularyAltLabelTable, VocabularyDataRow
 )
 
 class TestVocabularyDataTable(object):
@@ -389,6 +395,20 @@ class TestDataValidation(object):
         assert len(cluster.label) == 9
         assert cluster == cluster_save
 
+    def test_first_occurrence_of_a_duplicated_row_is_kept(self):
+        """Vérifie que seule la ligne en doublon est supprimée, même si elle enfreint plusieurs contraintes."""
+        table = VocabularyDataTable('voc', 'table', ('a', 'b'))
+        table.set_unique_constraint('a')
+        table.set_unique_constraint('b')
+        table.add('x', 'y')
+        table.add('z', 'w')
+        table.add('x', 'y')
+        response = table.validate()
+        assert len(response) == 2
+        assert table == [{'a': 'x', 'b': 'y'}, {'a': 'z', 'b': 'w'}]
+        assert table.exists({'a': 'x', 'b': 'y'})
+        assert table.validate()
+
     def test_none_only_matches_itself_for_a_mono_field_unique_constraint_with_none_as_value(self):
         """Vérifie qu'une contrainte d'unicité portant sur un seul champ et avec none_as_value valant True ne fait jamais matcher None avec autre chose que lui-même."""
         table = VocabularyDataTable(
@@ -574,6 +594,31 @@ class TestDataValidation(object):
         cluster.voc_t2.add('v1a')
         assert cluster.validate()
 
+    def test_reference_anomalies_are_properly_deleted(self):
+        """Contrôle la suppression des enregistrements ne respectant pas les contraintes de référencement."""
+        cluster = VocabularyDataCluster('voc')
+        cluster.table('t1', ('f1',))
+        cluster.table('t2', ('f1', 'f2'))
+        cluster.set_reference_constraint('voc_t2', 'f1', 'voc_t1')
+        cluster.set_reference_constraint('voc_t2', 'f2', 'voc_t1', 'f1')
+        for value in ('v1', 'v2', 'v3'):
+            cluster.voc_t1.add(value)
+        cluster.voc_t2.add('v1', 'v2')
+        cluster.voc_t2.add('v4', 'v2')
+        cluster.voc_t2.add('v2', 'v3')
+        cluster.voc_t2.add('v4', 'v5')
+        cluster.voc_t2.add('v4', 'v5')
+        cluster.voc_t2.add('v3', 'v1')
+        response = cluster.validate()
+        assert len(response) == 5
+        assert cluster.voc_t2 == [
+            {'f1': 'v1', 'f2': 'v2'},
+            {'f1': 'v2', 'f2': 'v3'},
+            {'f1': 'v3', 'f2': 'v1'},
+        ]
+        assert len(cluster.voc_t1) == 3
+        assert cluster.validate()
+
     def test_hierarchy_table_can_be_accessed(self):
         """Vérifie que tout est en ordre avec la création de la table des relations."""
         cluster = VocabularyDataCluster('voc')
@@ -610,3 +655,150 @@ class TestDataValidation(object):
         assert isinstance(cluster.spatial, VocabularySpatialTable)
         assert cluster.spatial == cluster['voc_spatial']
 
+
+def _naive_validate(table):
+    """Validation des contraintes d'unicité par comparaison de toutes les paires de lignes."""
+    anomalies = []
+    for idx, row in enumerate(table):
+        for constraint in table.constraints:
+            fields = [
+                f for f in constraint
+                if constraint.none_as_value or row[f] is not None
+            ]
+            if any(
+                all(row[f] == previous[f] for f in fields)
+                for previous in table[:idx]
+            ):
+                anomalies.append((dict(row), constraint))
+    return anomalies
+
+class TestDataIndexes(object):
+    """Ensemble de tests relatif aux index des valeurs des tables."""
+
+    @pytest.mark.parametrize('none_as_value', [True, False])
+    def test_same_anomalies_as_without_index(self, none_as_value):
+        """Vérifie que les anomalies détectées sont celles d'une comparaison exhaustive des lignes."""
+        rng = random.Random(42)
+        for _ in range(20):
+            table = VocabularyDataTable('voc', 'table', ('a', 'b', 'c'))
+            table.set_unique_constraint(('a', 'b'), none_as_value=none_as_value)
+            table.set_unique_constraint('c', none_as_value=none_as_value)
+            for _ in range(40):
+                table.add(*(rng.choice([None, 1, 2, 3]) for _ in range(3)))
+            expected = _naive_validate(table)
+            response = table.validate(delete=False)
+            assert [
+                (dict(anomaly), anomaly.constraint) for anomaly in response
+            ] == expected
+            assert len(table) == 40
+
+    def test_validate_one_uses_up_to_date_indexes(self):
+        """Vérifie que les index suivent les ajouts et suppressions de lignes."""
+        table = VocabularyDataTable('voc', 'table', ('a', 'b'))
+        table.set_unique_constraint(('a', 'b'))
+        table.add('x', 'y')
+        assert not table.validate_one({'a': 'x', 'b': 'y'})
+        assert table.validate_one({'a': 'x', 'b': 'z'})
+        table.add('x', 'z')
+        assert not table.validate_one({'a': 'x', 'b': 'z'})
+        table.remove({'a': 'x', 'b': 'z'})
+        assert table.validate_one({'a': 'x', 'b': 'z'})
+        table.extend([{'a': 'x', 'b': 'z'}])
+        assert table.exists({'b': 'z', 'a': 'x'})
+        table.clear()
+        assert not table.exists({'a': 'x'})
+        table.append({'a': 'x', 'b': None})
+        assert table.exists({'a': 'x'})
+        assert table.exists({'b': None})
+        assert not table.exists({'b': 'y'})
+        del table[0]
+        assert not table.exists({'a': 'x'})
+
+    def test_unhashable_values(self):
+        """Vérifie que les valeurs non hachables sont comparées ligne à ligne."""
+        table = VocabularyDataTable('voc', 'table', ('a', 'b'))
+        table.set_unique_constraint('a')
+        table.add(['x'], 1)
+        table.add(['x'], 2)
+        assert table.exists({'a': ['x'], 'b': 2})
+        assert not table.exists({'a': ['y']})
+        table.add('z', 3)
+        response = table.validate(delete=False)
+        assert [anomaly['b'] for anomaly in response] == [2]
+
+    def test_pickle(self):
+        """Vérifie que les index ne sont pas sérialisés et sont reconstruits au besoin."""
+        table = VocabularyDataTable('voc', 'table', ('a', 'b'))
+        table.add('x', 'y')
+        assert table.exists({'a': 'x'})
+        copy = pickle.loads(pickle.dumps(table))
+        assert not '_indexes' in copy.__dict__
+        assert copy == table and copy.name == table.name
+        copy.add('z', 'y')
+        assert copy.exists({'a': 'z'})
+        assert not table.exists({'a': 'z'})
+
+class TestDataRows(object):
+    """Ensemble de tests relatif aux lignes des tables."""
+
+    def test_rows_are_mappings(self):
+        """Vérifie que les lignes se comportent comme des dictionnaires."""
+        cluster = VocabularyDataCluster('somevoc')
+        row = cluster.label.add('uri:1', label='label1')
+        assert isinstance(row, VocabularyDataRow)
+        assert row == {'uri': 'uri:1', 'language': None, 'label': 'label1'}
+        assert {'uri': 'uri:1', 'language': None, 'label': 'label1'} == row
+        assert row != {'uri': 'uri:1', 'language': 'fr', 'label': 'label1'}
+        assert list(row) == ['uri', 'language', 'label']
+        assert len(row) == 3
+        assert 'label' in row and not 'regexp' in row
+        assert row.get('uri') == 'uri:1' and row.get('regexp', 'x') == 'x'
+        assert dict(**row) == dict(row.items())
+        assert repr(row) == repr(dict(row))
+        assert json.loads(json.dumps(dict(row))) == row
+        with pytest.raises(KeyError):
+            row['regexp']
+
+    def test_rows_values_can_be_modified(self):
+        """Vérifie que les valeurs des champs peuvent être modifiées, mais pas les champs eux-mêmes."""
+        table = VocabularyDataTable('voc', 'table', ('a', 'b'))
+        row = table.build_row('x')
+        row['b'] = 'y'
+        assert row == {'a': 'x', 'b': 'y'}
+        with pytest.raises(KeyError):
+            row['c'] = 'z'
+
+    def test_rows_of_tables_with_the_same_fields(self):
+        """Vérifie que les lignes des tables ayant les mêmes champs sont comparables."""
+        cluster = VocabularyDataCluster('somevoc')
+        label = cluster.label.add('uri:1', 'fr', 'label1')
+        altlabel = cluster.altlabel.add('uri:1', 'fr', 'label1')
+        assert type(label) is type(altlabel)
+        assert label == altlabel
+        assert label in cluster.altlabel
+
+    def test_rows_can_be_copied(self):
+        """Vérifie que les lignes peuvent être sérialisées et copiées."""
+        cluster = VocabularyDataCluster('somevoc')
+        cluster.label.add('uri:1', 'fr', 'label1')
+        cluster.label.add('uri:2', 'fr', 'label2')
+        restored = pickle.loads(pickle.dumps(cluster))
+        assert restored == cluster
+        assert type(restored.label[0]) is type(cluster.label[0])
+        row = copy.deepcopy(cluster.label[0])
+        row['label'] = 'label1-b'
+        assert cluster.label[0]['label'] == 'label1'
+
+    def test_rows_are_smaller_than_dictionaries(self):
+        """Vérifie que les lignes occupent moins de mémoire que les dictionnaires équivalents."""
+        table = VocabularyDataTable('voc', 'table', ('a', 'b', 'c', 'd', 'e'))
+        row = table.add('a', 'b', 'c', 'd', 'e')
+        assert sys.getsizeof(row) < sys.getsizeof(dict(row)) / 2
+
+    def test_dump(self, tmp_path):
+        """Vérifie l'export JSON des données du cluster."""
+        cluster = VocabularyDataCluster('somevoc')
+        cluster.label.add('uri:1', 'fr', 'label1')
+        cluster.dump(tmp_path)
+        with open(tmp_path / 'somevoc.json', encoding='utf-8') as src:
+            assert json.load(src) == cluster
@@ -0,0 +1,475 @@
+from builtins import object
+import threading
+import time
+import zipfile
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ckanext.ecospheres.vocabulary.parser.httpcache import HttpCache
+from ckanext.ecospheres.vocabulary.parser.parsers import (
+    basic_rdf, ogc_epsg, insee_official_geographic_code
+)
+from ckanext.ecospheres.vocabulary.parser.utils import Checkpoint
+
+CONCEPTS = 12
+
+ORDERED = 6
+
+CRS = 10
+
+class _RegisterHandler(BaseHTTPRequestHandler):
+    """Registre SKOS factice, dont chaque concept a sa propre page."""
+
+    base = None
+    delays = {}
+    requests = []
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = _RegisterHandler
+        path = self.path.strip('/')
+        with cls.lock:
+            cls.requests.append(path)
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        time.sleep(cls.delays.get(path, 0.02))
+        with cls.lock:
+            cls.active -= 1
+        if path == 'ordered':
+            content = cls.ordered_scheme()
+        elif path.startswith('o') and path[1:].isdigit():
+            content = cls.ordered_concept(int(path[1:]))
+        elif path == 'scheme':
+            content = '\n'.join(
+                f'<{cls.base}/c{i}> skos:inScheme <{cls.base}/scheme> ; '
+                f'skos:prefLabel "Concept {i}"@fr .'
+                for i in range(CONCEPTS)
+            )
+        elif path.startswith('c'):
+            content = (
+                f'<{cls.base}/{path}> skos:inScheme <{cls.base}/scheme> ; '
+                f'skos:prefLabel "Libellé {path}"@fr, "Label {path}"@en ; '
+                f'skos:altLabel "Autre {path}"@en .'
+            )
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = (
+            '@prefix skos: <http://www.w3.org/2004/02/skos/core#> .\n'
+            '@prefix dct: <http://purl.org/dc/terms/> .\n'
+            '@prefix ex: <http://example.org/> .\n'
+            + content
+        ).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/turtle')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @classmethod
+    def ordered_scheme(cls):
+        # items are returned in the order of the
+        # RDF classes, whatever the order of the triples
+        triples = [
+            f'<{cls.base}/o{i}> a ex:T{i} .' for i in range(ORDERED)
+        ] + [
+            f'<{cls.base}/o{i}> skos:prefLabel "Scheme {i}"@fr .'
+            for i in (4, 1, 2)
+        ] + [
+            f'<{cls.base}/o0> skos:narrower <{cls.base}/o1> .'
+        ]
+        return '\n'.join(triples)
+
+    @classmethod
+    def ordered_concept(cls, i):
+        if i == 3:
+            # no label at all
+            return f'<{cls.base}/o3> a ex:T3 .'
+        triples = [
+            f'<{cls.base}/o{i}> a ex:T{i} ; skos:prefLabel "Concept {i}"@fr ; '
+            f'skos:altLabel "Autre {i}"@fr ; dct:identifier "id-{i}" .'
+        ]
+        if i == 2:
+            # already known from the scheme page
+            triples.append(f'<{cls.base}/o2> skos:prefLabel "Scheme 2"@fr .')
+        if i < ORDERED - 1:
+            triples.append(
+                f'<{cls.base}/o{i + 1}> a ex:T{i + 1} ; skos:broader <{cls.base}/o{i}> .'
+            )
+        return '\n'.join(triples)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def register(tmp_path):
+    HttpCache.configure(cache_dir=tmp_path, enabled=False)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _RegisterHandler)
+    _RegisterHandler.base = f'http://127.0.0.1:{server.server_port}'
+    _RegisterHandler.max_active = 0
+    _RegisterHandler.requests = []
+    # the last concepts are the slowest to answer,
+    # though they are crawled first
+    _RegisterHandler.delays = {
+        f'c{i}': 0.01 * i for i in range(CONCEPTS)
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield _RegisterHandler.base
+    server.shutdown()
+    server.server_close()
+    HttpCache.configure()
+
+class _EpsgHandler(BaseHTTPRequestHandler):
+    """Registre EPSG factice, avec une définition par système de coordonnées."""
+
+    base = None
+    requests = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = _EpsgHandler
+        path = self.path.strip('/')
+        with cls.lock:
+            cls.requests.append(path)
+        if path == 'crs':
+            content = '<epsg:CRSList xmlns:epsg="urn:x-ogp:spec:schema-xsd:EPSG:2.2:dataset">{0}</epsg:CRSList>'.format(
+                ''.join(
+                    f'<epsg:CRS>{cls.base}/crs/{2154 + i}</epsg:CRS>'
+                    for i in range(CRS)
+                )
+            )
+        elif path.startswith('crs/'):
+            code = path[4:]
+            # the first definitions are the slowest to answer
+            time.sleep(0.005 * (int(code) - 2154 - CRS) ** 2 / CRS)
+            content = (
+                '<gml:ProjectedCRS xmlns:gml="http://www.opengis.net/gml/3.2">'
+                f'<gml:identifier codeSpace="IOGP">{code}</gml:identifier>'
+                f'<gml:name>CRS {code}</gml:name>'
+                '</gml:ProjectedCRS>'
+            )
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = content.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def epsg_register(tmp_path):
+    HttpCache.configure(cache_dir=tmp_path / 'http_cache')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _EpsgHandler)
+    _EpsgHandler.base = f'http://127.0.0.1:{server.server_port}'
+    _EpsgHandler.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield _EpsgHandler.base
+    server.shutdown()
+    server.server_close()
+    HttpCache.configure()
+
+COG = '''
+@prefix geo: <http://rdf.insee.fr/def/geo#> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix dep: <http://id.insee.fr/geo/departement/> .
+@prefix com: <http://id.insee.fr/geo/commune/> .
+
+<http://rdf.insee.fr/graphes/geo/cog> {
+    dep:d01 a geo:Departement ; geo:nom "Ain"@fr ; geo:codeINSEE "01" ;
+        owl:sameAs dep:01 .
+    com:u1 a geo:Commune ; geo:nom "L'Abergement-Clémenciat"@fr ;
+        geo:nomSansArticle "Abergement-Clémenciat"@fr ;
+        geo:nomEntier "L'Abergement-Clémenciat"@fr ;
+        geo:codeINSEE "01001" ; geo:subdivisionDirecteDe dep:d01 ;
+        owl:sameAs com:01001 .
+    com:u2 a geo:CommuneDeleguee ; geo:nom "Ancienne commune"@fr .
+    com:u3 a geo:Commune ; geo:nom "Ambérieu-en-Bugey"@fr ;
+        geo:subdivisionDirecteDe dep:d99 .
+}
+<http://rdf.insee.fr/graphes/geo/autre> {
+    com:u4 a geo:Commune ; geo:nom "Autre graphe"@fr .
+}
+'''
+
+class _FileHandler(BaseHTTPRequestHandler):
+
+    files = {}
+
+    def do_GET(self):
+        data = _FileHandler.files.get(self.path.strip('/'))
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def cog_url(tmp_path):
+    HttpCache.configure(cache_dir=tmp_path, enabled=False)
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_data:
+        zip_data.writestr('cog.trig', COG.encode('utf-8'))
+    _FileHandler.files = {'cog.zip': archive.getvalue()}
+    broken = BytesIO()
+    with zipfile.ZipFile(broken, 'w') as zip_data:
+        zip_data.writestr('cog.trig', COG.replace('"Ain"@fr', '?').encode('utf-8'))
+    _FileHandler.files['broken.zip'] = broken.getvalue()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FileHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+    HttpCache.configure()
+
+class TestBasicRdf(object):
+
+    def test_recursive_crawl(self, register):
+        """Vérifie que l'exploration concurrente des concepts donne le même résultat que l'exploration séquentielle."""
+        sequential = basic_rdf(
+            'voc', f'{register}/scheme', format='turtle', recursive=True,
+            crawl_workers=1, crawl_delay=0
+        )
+        assert sequential.status_code == 0
+        assert _RegisterHandler.max_active == 1
+        _RegisterHandler.max_active = 0
+        concurrent = basic_rdf(
+            'voc', f'{register}/scheme', format='turtle', recursive=True,
+            crawl_workers=8, crawl_host_concurrency=3, crawl_delay=0
+        )
+        assert concurrent.status_code == 0
+        assert 1 < _RegisterHandler.max_active <= 3
+        assert concurrent.data.label == sequential.data.label
+        assert concurrent.data.altlabel == sequential.data.altlabel
+        # the labels from the scheme page come first
+        assert {row['label'] for row in concurrent.data.label} == {
+            f'Concept {i}' for i in range(CONCEPTS)
+        } | {f'Label c{i}' for i in range(CONCEPTS)}
+        assert len(concurrent.data.altlabel) == 2 * CONCEPTS
+
+    def test_output_order(self, register):
+        """Vérifie l'ordre et le dédoublonnage des libellés, relations et anomalies."""
+        result = basic_rdf(
+            'voc', f'{register}/ordered', format='turtle', recursive=True,
+            rdf_types=[f'http://example.org/T{i}' for i in range(ORDERED)],
+            hierarchy=True, crawl_workers=4, crawl_delay=0
+        )
+        uri = lambda i: f'{register}/o{i}'
+        # labels from the scheme page come first, then
+        # those from the pages, in the order of the crawl
+        assert result.data.label == [
+            {'uri': uri(1), 'language': 'fr', 'label': 'Scheme 1'},
+            {'uri': uri(2), 'language': 'fr', 'label': 'Scheme 2'},
+            {'uri': uri(4), 'language': 'fr', 'label': 'Scheme 4'},
+            {'uri': uri(5), 'language': 'fr', 'label': 'Concept 5'},
+            {'uri': uri(0), 'language': 'fr', 'label': 'Concept 0'},
+        ]
+        altlabels = []
+        for i in (5, 4, 2, 1, 0):
+            if i in (4, 2, 1):
+                altlabels.append(
+                    {'uri': uri(i), 'language': 'fr', 'label': f'Concept {i}'}
+                )
+            altlabels += [
+                {'uri': uri(i), 'language': 'fr', 'label': f'Autre {i}'},
+                {'uri': uri(i), 'language': None, 'label': f'id-{i}'},
+            ]
+        assert result.data.altlabel == altlabels
+        assert result.data.hierarchy == [
+            {'parent': uri(0), 'child': uri(1)},
+            {'parent': uri(4), 'child': uri(5)},
+            {'parent': uri(1), 'child': uri(2)},
+        ]
+        assert [(str(e), e.detail) for e in result.log[:1]] == [
+            ('missing label', uri(3))
+        ]
+        assert len(result.log) == 2
+
+    def test_fetch_order(self, register):
+        """Vérifie que les pages sont récupérées dans l'ordre où l'exploration les traite."""
+        result = basic_rdf(
+            'voc', f'{register}/scheme', format='turtle', recursive=True,
+            crawl_workers=1, crawl_delay=0
+        )
+        assert result.status_code == 0
+        # the alternative labels come from the pages, in
+        # the order they were handled
+        crawled = list(dict.fromkeys(
+            row['uri'].rsplit('/', 1)[-1] for row in result.data.altlabel
+        ))
+        assert len(crawled) == CONCEPTS
+        assert _RegisterHandler.requests == ['scheme'] + crawled
+
+    def test_politeness_delay(self, register):
+        """Vérifie le délai minimal entre deux requêtes adressées au même hôte."""
+        start = time.monotonic()
+        result = basic_rdf(
+            'voc', f'{register}/scheme', format='turtle', recursive=True,
+            crawl_workers=8, crawl_host_concurrency=8, crawl_delay=0.05
+        )
+        assert result
+        assert time.monotonic() - start >= 0.05 * CONCEPTS
+
+    def test_missing_page(self, register):
+        """Vérifie que l'échec de la récupération de la page principale est critique."""
+        result = basic_rdf('voc', f'{register}/unknown', format='turtle')
+        assert not result
+
+class TestOgcEpsg(object):
+
+    def test_concurrent_fetch(self, epsg_register):
+        """Vérifie que la récupération concurrente des définitions préserve l'ordre du registre."""
+        result = ogc_epsg(
+            'ogc_epsg', f'{epsg_register}/crs', checkpoint=False,
+            crawl_workers=4, crawl_delay=0
+        )
+        assert result.status_code == 0
+        assert [row['label'] for row in result.data.label] == [
+            f'IOGP {2154 + i} : CRS {2154 + i}' for i in range(CRS)
+        ]
+        assert result.data.altlabel[:3] == [
+            {'uri': f'{epsg_register}/crs/2154', 'label': label, 'language': None}
+            for label in ('IOGP:2154', 'CRS 2154', '2154')
+        ]
+        limited = ogc_epsg(
+            'ogc_epsg', f'{epsg_register}/crs', limit=3, checkpoint=False,
+            crawl_delay=0
+        )
+        assert len(limited.data.label) == 3
+
+    def test_cache_max_age(self, epsg_register):
+        """Vérifie que les définitions récemment mises en cache ne sont pas redemandées au serveur."""
+        ogc_epsg('ogc_epsg', f'{epsg_register}/crs', checkpoint=False, crawl_delay=0)
+        assert len(_EpsgHandler.requests) == CRS + 1
+        ogc_epsg('ogc_epsg', f'{epsg_register}/crs', checkpoint=False, crawl_delay=0)
+        assert len(_EpsgHandler.requests) == CRS + 2
+        ogc_epsg(
+            'ogc_epsg', f'{epsg_register}/crs', checkpoint=False, crawl_delay=0,
+            cache_max_age=0
+        )
+        assert len(_EpsgHandler.requests) == 2 * CRS + 3
+
+    def test_checkpoint(self, epsg_register, tmp_path):
+        """Vérifie qu'une analyse interrompue reprend là où elle s'était arrêtée."""
+        url = f'{epsg_register}/crs'
+        path = tmp_path / 'ogc_epsg.jsonl'
+        with Checkpoint(path, url) as progress:
+            for i in range(4):
+                progress.add(
+                    f'{epsg_register}/crs/{2154 + i}',
+                    {'name': f'Checkpoint {i}', 'identifier': str(2154 + i),
+                    'code_space': 'IOGP'}
+                )
+        result = ogc_epsg(
+            'ogc_epsg', url, checkpoint=path, crawl_delay=0, cache_max_age=0
+        )
+        assert result.status_code == 0
+        assert not f'crs/2154' in _EpsgHandler.requests
+        assert len(_EpsgHandler.requests) == CRS - 4 + 1
+        assert result.data.label[0]['label'] == 'IOGP 2154 : Checkpoint 0'
+        assert result.data.label[4]['label'] == 'IOGP 2158 : CRS 2158'
+        assert not path.exists()
+        # a checkpoint built from another source is ignored
+        with Checkpoint(path, 'http://example.org') as progress:
+            progress.add(f'{epsg_register}/crs/2154', {'name': 'Other'})
+        assert Checkpoint(path, url).resumed == 0
+
+    def test_checkpoint_header(self, tmp_path):
+        """Vérifie qu'un point de reprise trop ancien ou dans un autre format est ignoré."""
+        path = tmp_path / 'ogc_epsg.jsonl'
+        with Checkpoint(path, 'http://example.org') as progress:
+            progress.add('crs/1', {'name': 'CRS 1'})
+        with Checkpoint(path, 'http://example.org') as progress:
+            assert progress.resumed == 1
+        assert Checkpoint(path, 'http://example.org', max_age=0).resumed == 0
+        header, item = path.read_text(encoding='utf-8').splitlines()
+        path.write_text(
+            header.replace('"version": 1', '"version": 0') + '\n' + item + '\n',
+            encoding='utf-8'
+        )
+        assert Checkpoint(path, 'http://example.org').resumed == 0
+
+    def test_checkpoint_lock(self, tmp_path):
+        """Vérifie qu'un point de reprise n'est utilisé que par un chargement à la fois."""
+        path = tmp_path / 'ogc_epsg.jsonl'
+        with Checkpoint(path, 'http://example.org') as progress:
+            progress.add('crs/1', {'name': 'CRS 1'})
+            with Checkpoint(path, 'http://example.org') as other:
+                assert not other.locked
+                assert other.resumed == 0
+                other.add('crs/2', {'name': 'CRS 2'})
+                other.complete()
+            assert path.exists()
+            progress.add('crs/3', {'name': 'CRS 3'})
+        with pytest.raises(RuntimeError):
+            with Checkpoint(path, 'http://example.org') as progress:
+                assert progress.locked
+                assert progress.resumed == 2
+                raise RuntimeError('interrupted')
+        # the lock was released
+        assert Checkpoint(path, 'http://example.org').locked
+
+class TestInseeOfficialGeographicCode(object):
+
+    def test_parser(self, cog_url):
+        """Vérifie la lecture des données du code officiel géographique."""
+        result = insee_official_geographic_code(
+            'insee', f'{cog_url}/cog.zip',
+            rdf_types=[
+                'http://rdf.insee.fr/def/geo#Departement',
+                'http://rdf.insee.fr/def/geo#Commune'
+            ]
+        )
+        assert result.status_code == 0
+        dep = 'http://id.insee.fr/geo/departement/'
+        com = 'http://id.insee.fr/geo/commune/'
+        assert result.data.label == [
+            {'uri': f'{dep}d01', 'language': 'fr', 'label': 'Ain'},
+            {'uri': f'{com}u1', 'language': 'fr', 'label': "L'Abergement-Clémenciat"},
+            {'uri': f'{com}u3', 'language': 'fr', 'label': 'Ambérieu-en-Bugey'},
+            {'uri': f'{dep}01', 'language': 'fr', 'label': 'Ain'},
+            {'uri': f'{com}01001', 'language': 'fr', 'label': "L'Abergement-Clémenciat"},
+        ]
+        assert result.data.altlabel == [
+            {'uri': f'{dep}d01', 'language': 'fr', 'label': '01'},
+            {'uri': f'{com}u1', 'language': 'fr', 'label': 'Abergement-Clémenciat'},
+            {'uri': f'{com}u1', 'language': 'fr', 'label': '01001'},
+        ]
+        assert result.data.hierarchy == [
+            {'parent': f'{dep}d01', 'child': f'{com}u1'}
+        ]
+        assert result.data.synonym == [
+            {'uri': f'{dep}01', 'synonym': f'{dep}d01'},
+            {'uri': f'{dep}d01', 'synonym': f'{dep}01'},
+            {'uri': f'{com}01001', 'synonym': f'{com}u1'},
+            {'uri': f'{com}u1', 'synonym': f'{com}01001'},
+        ]
+        result = insee_official_geographic_code('insee', f'{cog_url}/cog.zip')
+        assert len(result.data.label) == 6
+
+    def test_failures(self, cog_url):
+        """Vérifie que des données illisibles sont une erreur critique."""
+        assert not insee_official_geographic_code('insee', f'{cog_url}/broken.zip')
+        assert not insee_official_geographic_code('insee', f'{cog_url}/missing.zip')
@@ -0,0 +1,99 @@
+from builtins import object
+
+from ckanext.ecospheres.vocabulary.parser import exceptions
+from ckanext.ecospheres.vocabulary.parser.result import VocabularyParsingResult
+from ckanext.ecospheres.vocabulary.parser.stream import (
+    VocabularyStreamingResult, streaming_parser
+)
+
+LABELS = [
+    ('ex:a', 'fr', 'A'),
+    ('ex:a', 'fr', 'Autre A'),
+    ('ex:a', 'en', 'A (en)'),
+    ('ex:a', None, 'A sans langue'),
+    ('ex:b', None, 'B'),
+    ('ex:b', 'fr', 'B (fr)'),
+    ('ex:c', 'fr', 'C'),
+    (None, 'fr', 'D'),
+    ('ex:e', 'fr', ''),
+]
+
+@streaming_parser
+def dummy_parser(result, name, url, items=LABELS, **kwargs):
+    """Analyseur factice."""
+    if url == 'fail':
+        result.exit(ValueError('fail'))
+        return
+    if url == 'empty':
+        return
+    result.data.synonym_table()
+    for uri, language, label in items:
+        result.add_label(uri, language=language, label=label)
+        yield from result.chunks()
+    result.add_row('synonym', 'ex:a', 'ex:z')
+    yield from result.chunks(flush=True)
+
+class TestVocabularyStreamingResult(object):
+
+    def test_labels(self):
+        """Vérifie que les libellés sont répartis entre les tables comme par la méthode non séquentielle."""
+        expected = VocabularyParsingResult('voc')
+        for uri, language, label in LABELS:
+            expected.add_label(uri, language=language, label=label)
+        result = VocabularyStreamingResult('voc', chunk_size=None)
+        for uri, language, label in LABELS:
+            result.add_label(uri, language=language, label=label)
+        assert result.data.label == expected.data.label
+        assert result.data.altlabel == expected.data.altlabel
+        assert len(result.log) == 2
+        assert all(isinstance(e, exceptions.InvalidDataError) for e in result.log)
+
+    def test_chunks(self):
+        """Vérifie que les lignes sont émises par paquets de taille bornée."""
+        result = VocabularyStreamingResult('voc', chunk_size=2)
+        for uri, language, label in LABELS:
+            result.add_label(uri, language=language, label=label)
+        chunks = list(result.chunks())
+        assert [(table.name, len(rows)) for table, rows in chunks] == [
+            ('voc_label', 2), ('voc_altlabel', 2), ('voc_label', 2)
+        ]
+        assert len(result.data.label) == 1
+        chunks = list(result.chunks(flush=True))
+        assert [(table.name, len(rows)) for table, rows in chunks] == [
+            ('voc_label', 1)
+        ]
+        assert not result.data.label and not result.data.altlabel
+        assert result.rows == {'voc_label': 5, 'voc_altlabel': 2}
+
+class TestStreamingParser(object):
+
+    def test_parser(self):
+        """Vérifie que l'analyseur reste utilisable comme un analyseur ordinaire."""
+        result = dummy_parser('voc', 'url')
+        assert result
+        assert len(result.data.label) == 5
+        assert result.data.voc_synonym == [{'uri': 'ex:a', 'synonym': 'ex:z'}]
+        assert dummy_parser.__doc__ == 'Analyseur factice.'
+
+    def test_stream(self):
+        """Vérifie que le mode séquentiel émet toutes les lignes."""
+        result, chunks = dummy_parser.stream('voc', 'url', chunk_size=2)
+        rows = {}
+        for table, chunk in chunks:
+            assert len(chunk) <= 2
+            rows.setdefault(table.name, []).extend(chunk)
+        assert rows == {
+            'voc_label': dummy_parser('voc', 'url').data.label,
+            'voc_altlabel': dummy_parser('voc', 'url').data.altlabel,
+            'voc_synonym': [{'uri': 'ex:a', 'synonym': 'ex:z'}],
+        }
+        assert result.status_code == 2
+
+    def test_failures(self):
+        """Vérifie que les échecs critiques sont transmis par le résultat."""
+        result, chunks = dummy_parser.stream('voc', 'fail')
+        assert list(chunks) == []
+        assert not result
+        result = dummy_parser('voc', 'empty')
+        assert not result
+        assert isinstance(result.log[-1], exceptions.NoVocabularyDataError)
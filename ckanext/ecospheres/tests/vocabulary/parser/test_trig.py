@@ -0,0 +1,151 @@
+from builtins import object
+from io import BytesIO
+
+import pytest
+from rdflib import Dataset, BNode, Literal as RdfLiteral
+
+from ckanext.ecospheres.vocabulary.parser import trig
+from ckanext.ecospheres.vocabulary.parser.exceptions import TrigSyntaxError
+from ckanext.ecospheres.vocabulary.parser.trig import iter_quads, Literal, _TOKENS
+
+DATA = '''
+@prefix geo: <http://rdf.insee.fr/def/geo#> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+PREFIX ex: <http://example.org/>
+@base <http://example.org/base/> .
+
+# commentaire
+<http://rdf.insee.fr/graphes/geo/cog> {
+    <http://id.insee.fr/geo/commune/1> a geo:Commune ;
+        geo:nom "L'Abergement-Clémenciat"@fr ;
+        geo:codeINSEE "01001" ;
+        geo:nomSansArticle """Abergement
+Clémenciat""" , 'l\\'Abergement' ;
+        owl:sameAs <relative> ;
+        geo:subdivisionDirecteDe ex:dep\\-01 ;
+        ex:n 1, -2.5, true ;
+        ex:list ( 1 "deux" ex:trois ) ;
+        ex:node [ ex:p "q" ; ] ;
+        ex:typed "2020-01-01"^^xsd:date ;
+        ex:escaped "\\u00e9\\n" .
+    [] ex:p ex:o .
+    [ ex:a ex:b ] ex:c ex:d .
+    _:x ex:e ex:f .
+}
+GRAPH ex:g2 { ex:s ex:p ex:o }
+ex:default ex:p ex:o .
+'''.encode('utf-8')
+
+def _term(term):
+    if isinstance(term, (Literal, RdfLiteral)):
+        value = term.value if isinstance(term, Literal) else str(term)
+        return ('literal', value, term.language,
+            str(term.datatype) if term.datatype else None)
+    if isinstance(term, BNode) or term.startswith('_:'):
+        return 'blank node'
+    return str(term)
+
+def _quads(quads):
+    return sorted(
+        repr(tuple(_term(t) if t is not None else None for t in quad))
+        for quad in quads
+    )
+
+class TestIterQuads(object):
+
+    def test_rdflib(self):
+        """Vérifie que les quadruplets lus sont ceux que trouve rdflib."""
+        dataset = Dataset(default_union=False)
+        dataset.parse(data=DATA, format='trig')
+        expected = [
+            (s, p, o, g if str(g) != 'urn:x-rdflib:default' else None)
+            for s, p, o, g in dataset.quads()
+        ]
+        assert _quads(iter_quads(BytesIO(DATA))) == _quads(expected)
+        assert len(expected) == 27
+
+    def test_filters(self):
+        """Vérifie le filtrage des quadruplets par graphe et par prédicat."""
+        quads = list(iter_quads(
+            BytesIO(DATA), graphs=['http://rdf.insee.fr/graphes/geo/cog'],
+            predicates=[
+                'http://rdf.insee.fr/def/geo#nom',
+                'http://www.w3.org/2002/07/owl#sameAs'
+            ]
+        ))
+        assert quads == [
+            (
+                'http://id.insee.fr/geo/commune/1',
+                'http://rdf.insee.fr/def/geo#nom',
+                Literal("L'Abergement-Clémenciat", 'fr', None),
+                'http://rdf.insee.fr/graphes/geo/cog'
+            ),
+            (
+                'http://id.insee.fr/geo/commune/1',
+                'http://www.w3.org/2002/07/owl#sameAs',
+                'http://example.org/base/relative',
+                'http://rdf.insee.fr/graphes/geo/cog'
+            ),
+        ]
+        assert [q[2] for q in iter_quads(BytesIO(DATA), graphs=[None])] == [
+            'http://example.org/o'
+        ]
+
+    def test_buffer(self, monkeypatch):
+        """Vérifie que le découpage des données lues n'a pas d'effet sur le résultat."""
+        expected = list(iter_quads(BytesIO(DATA)))
+        monkeypatch.setattr(trig, 'READ_MARGIN', 40)
+        for read_size in (1, 3, 8, 50):
+            monkeypatch.setattr(trig, 'READ_SIZE', read_size)
+            assert list(iter_quads(BytesIO(DATA))) == expected
+
+    def test_long_literal_across_buffers(self, monkeypatch):
+        """Vérifie la lecture d'un littéral plus long que la marge, à cheval sur deux lectures."""
+        data = '<http://g> {{\n{0}\n}}'.format('\n'.join(
+            ' ' * 22 + f'<http://s{i}> <http://p> "{i}{"x" * 3000}" .'
+            for i in range(5)
+        )).encode('utf-8')
+        monkeypatch.setattr(trig, 'READ_MARGIN', 40)
+        monkeypatch.setattr(trig, 'READ_SIZE', 1000)
+        quads = list(iter_quads(BytesIO(data)))
+        assert [(s, o.value[0], len(o.value)) for s, p, o, g in quads] == [
+            (f'http://s{i}', str(i), 3001) for i in range(5)
+        ]
+
+    def test_no_backtracking_before_tokens(self):
+        """Vérifie qu'un lexème invalide précédé d'espaces et de commentaires est rejeté sans délai."""
+        assert _TOKENS.match(' ' * 30 + '"abc') is None
+        assert _TOKENS.match('# a # b\n' * 15 + ' ' * 30 + '"abc') is None
+        assert _TOKENS.match('  # a # b\n\t<http://a>').group('iri') == 'http://a'
+
+    def test_syntax_error(self):
+        """Vérifie que des données invalides provoquent une erreur, après les quadruplets valides."""
+        data = b'<http://a> <http://b> <http://c> .\n<http://a> <http://b> ?c .'
+        quads = iter_quads(BytesIO(data))
+        assert next(quads)[2] == 'http://c'
+        with pytest.raises(TrigSyntaxError):
+            next(quads)
+        with pytest.raises(TrigSyntaxError):
+            list(iter_quads(BytesIO(b'ex:a ex:b ex:c .')))
+        with pytest.raises(TrigSyntaxError):
+            list(iter_quads(BytesIO(b'<http://g> { <http://a> <http://b> "c" ')))
+
+    def test_graph_block_is_streamed(self):
+        """Vérifie que les quadruplets d'un bloc de graphe sont restitués au fil de la lecture, y compris avant une erreur de syntaxe."""
+        data = (
+            b'<http://g> {\n'
+            + b'\n'.join(
+                f'<http://s{i}> <http://p> "{i}" .'.encode('utf-8')
+                for i in range(3)
+            )
+            + b'\n<http://s3> <http://p> ?o .\n}'
+        )
+        quads = iter_quads(BytesIO(data))
+        assert next(quads) == (
+            'http://s0', 'http://p', Literal('0', None, None), 'http://g'
+        )
+        assert next(quads)[0] == 'http://s1'
+        assert next(quads)[0] == 'http://s2'
+        with pytest.raises(TrigSyntaxError):
+            next(quads)
@@ -0,0 +1,94 @@
+from builtins import object
+
+from rdflib import URIRef, Literal, SKOS, RDF
+
+from ckanext.ecospheres.vocabulary.parser.utils import (
+    VocabularyGraph, CONCEPTS_ARE_SUBJECTS_OF, CONCEPTS_ARE_OBJECTS_OF
+)
+
+DATA = '''
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+@prefix dct: <http://purl.org/dc/terms/> .
+@prefix at: <http://publications.europa.eu/ontology/authority/> .
+@prefix ex: <http://example.org/> .
+
+ex:scheme a skos:ConceptScheme ; skos:hasTopConcept ex:c1 .
+ex:c1 a skos:Concept, ex:Territory ; skos:inScheme ex:scheme ;
+    skos:prefLabel "Un"@fr, "One"@en ; skos:altLabel "1" ;
+    skos:narrower ex:c2 ; at:op-mapped-code ex:code1 ;
+    ex:regexp "^un$", "^one$" .
+ex:code1 at:legacy-code "C1" .
+ex:c2 skos:inScheme ex:scheme ; dct:title "Deux"@fr ; skos:broader ex:c1 .
+ex:c3 a ex:Territory ; skos:broader ex:c1, ex:c2 ; skos:notation "3" .
+'''
+
+EX = 'http://example.org/'
+
+def _graph():
+    graph = VocabularyGraph()
+    graph.parse(data=DATA, format='turtle')
+    return graph
+
+class TestVocabularyGraph(object):
+
+    def test_find_vocabulary_items(self):
+        """Vérifie l'identification des éléments du vocabulaire."""
+        graph = _graph()
+        # same items as pattern queries against the store
+        expected = list(graph.subjects(RDF.type, SKOS.Concept))
+        for predicate in CONCEPTS_ARE_SUBJECTS_OF:
+            expected += graph.subjects(predicate)
+        for predicate in CONCEPTS_ARE_OBJECTS_OF:
+            expected += graph.objects(predicate=predicate)
+        assert sorted(graph.find_vocabulary_items()) == sorted(expected)
+        assert len(expected) == 12
+        assert sorted(
+            graph.find_vocabulary_items(schemes=[f'{EX}scheme'])
+        ) == [URIRef(f'{EX}c1'), URIRef(f'{EX}c2')]
+        assert graph.find_vocabulary_items(
+            schemes=[f'{EX}scheme'], rdf_types=[f'{EX}Territory']
+        ) == [URIRef(f'{EX}c1')]
+        assert sorted(graph.find_vocabulary_items(
+            rdf_types=[f'{EX}Territory', SKOS.Concept]
+        )) == [URIRef(f'{EX}c1'), URIRef(f'{EX}c1'), URIRef(f'{EX}c3')]
+
+    def test_find_labels(self):
+        """Vérifie que les libellés sont ordonnés selon les propriétés qui les portent."""
+        graph = _graph()
+        labels = graph.find_labels(f'{EX}c1')
+        assert sorted(labels[:2]) == sorted(
+            [Literal('Un', lang='fr'), Literal('One', lang='en')]
+        )
+        assert labels[2:] == [Literal('1'), Literal('C1')]
+        assert graph.find_labels(f'{EX}c1', languages=['fr']) == [
+            Literal('Un', lang='fr')
+        ]
+        assert graph.find_labels(f'{EX}c2') == [Literal('Deux', lang='fr')]
+        assert graph.find_labels(f'{EX}c3', languages=[None]) == [Literal('3')]
+        assert graph.find_labels(f'{EX}unknown') == []
+
+    def test_hierarchy(self):
+        """Vérifie la recherche des concepts parents et enfants."""
+        graph = _graph()
+        assert sorted(graph.find_children(f'{EX}c1')) == [
+            URIRef(f'{EX}c2'), URIRef(f'{EX}c3')
+        ]
+        assert graph.find_parents(f'{EX}c2') == [URIRef(f'{EX}c1')]
+        assert sorted(graph.find_parents(f'{EX}c3')) == [
+            URIRef(f'{EX}c1'), URIRef(f'{EX}c2')
+        ]
+
+    def test_index(self):
+        """Vérifie l'indexation des propriétés supplémentaires."""
+        graph = _graph()
+        index = graph.index()
+        assert graph.index() is index
+        index = graph.index(properties=[f'{EX}regexp', None])
+        assert sorted(index.find_values(f'{EX}c1', f'{EX}regexp')) == [
+            Literal('^one$'), Literal('^un$')
+        ]
+        assert graph.index(properties=[f'{EX}regexp']) is index
+        graph.parse(data=f'<{EX}c4> <{EX}regexp> "^quatre$" .', format='turtle')
+        assert graph.index(properties=[f'{EX}regexp']).find_values(
+            f'{EX}c4', f'{EX}regexp'
+        ) == [Literal('^quatre$')]
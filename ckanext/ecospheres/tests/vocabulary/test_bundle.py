@@ -0,0 +1,73 @@
+from builtins import object
+import gzip
+import json
+from decimal import Decimal
+
+import pytest
+
+from ckanext.ecospheres.vocabulary.bundle import (
+    BUNDLE_FORMAT, read_bundle, write_bundle
+)
+from ckanext.ecospheres.vocabulary.parser.model import VocabularyDataCluster
+
+def _clusters():
+    theme = VocabularyDataCluster('ecospheres_theme')
+    theme.add_label('ex:a', language='fr', label='A')
+    theme.add_label('ex:a', language='fr', label='Autre\tlibellé')
+    theme.synonym_table()
+    theme.synonym.add('ex:a', 'ex:b')
+    territory = VocabularyDataCluster('ecospheres_territory')
+    territory.add_label('D01', language='fr', label='01 Ain')
+    territory.spatial_table()
+    territory.spatial.add('D01', Decimal('4.7'), 45.6, 6.2, 46.5)
+    territory.table('special', ('field_1', 'field_2'))
+    territory.ecospheres_territory_special.add('x', None)
+    return [theme, territory]
+
+class TestBundle(object):
+
+    def test_round_trip(self, tmp_path):
+        """Vérifie que les clusters lus dans un paquet sont identiques aux clusters exportés."""
+        path = tmp_path / 'vocabularies.ndjson.gz'
+        clusters = _clusters()
+        assert write_bundle(path, clusters) == [
+            'ecospheres_theme', 'ecospheres_territory'
+        ]
+        read = list(read_bundle(path))
+        assert [cluster.vocabulary for cluster in read] == [
+            'ecospheres_theme', 'ecospheres_territory'
+        ]
+        theme, territory = read
+        assert list(theme) == list(clusters[0])
+        assert theme.synonym == [{'uri': 'ex:a', 'synonym': 'ex:b'}]
+        assert theme.label == clusters[0].label
+        assert theme.altlabel == clusters[0].altlabel
+        assert territory.spatial.sql is not None
+        assert territory.spatial == [
+            {
+                'uri': 'D01', 'westlimit': 4.7, 'southlimit': 45.6,
+                'eastlimit': 6.2, 'northlimit': 46.5
+            }
+        ]
+        assert territory.ecospheres_territory_special == [
+            {'field_1': 'x', 'field_2': None}
+        ]
+
+    def test_selection(self, tmp_path):
+        """Vérifie que seuls les vocabulaires demandés sont lus."""
+        path = tmp_path / 'vocabularies.ndjson.gz'
+        write_bundle(path, _clusters())
+        read = list(read_bundle(path, vocab_list=['ecospheres_territory']))
+        assert [cluster.vocabulary for cluster in read] == ['ecospheres_territory']
+        assert len(read[0].spatial) == 1
+
+    def test_version(self, tmp_path):
+        """Vérifie que les paquets d'une version inconnue sont refusés."""
+        path = tmp_path / 'vocabularies.ndjson.gz'
+        with gzip.open(path, 'wt', encoding='utf-8') as target:
+            target.write(json.dumps({'format': BUNDLE_FORMAT, 'version': 999}))
+        with pytest.raises(ValueError):
+            list(read_bundle(path))
+        path.write_text('{}')
+        with pytest.raises(Exception):
+            list(read_bundle(path))
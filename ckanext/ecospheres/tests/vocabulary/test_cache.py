@@ -0,0 +1,225 @@
+from builtins import object
+
+import pytest
+
+from ckanext.ecospheres.vocabulary.cache import (
+    VocabularyCache, VocabularySnapshot, MemoryCacheBackend,
+    cached, lookup_failed, track_lookups
+)
+
+class DummyReader:
+    """Lecteur factice qui compte les appels à la base."""
+
+    calls = []
+
+    @classmethod
+    @cached
+    def get_label(cls, vocabulary, uri, language=None, database=None):
+        cls.calls.append((vocabulary, uri, language, database))
+        if uri == 'unknown':
+            return None
+        if uri == 'error':
+            lookup_failed()
+            return None
+        return f'{uri}@{language}'
+
+    @classmethod
+    @cached
+    def get_children(cls, vocabulary, uri, database=None):
+        cls.calls.append((vocabulary, uri, None, database))
+        return [f'{uri}/a', f'{uri}/b']
+
+    @classmethod
+    @cached
+    def get_children_labels(cls, vocabulary, uri, database=None):
+        cls.calls.append((vocabulary, uri, None, database))
+        return [
+            cls.get_label(vocabulary, child)
+            for child in [uri, 'error'] + cls.get_children(vocabulary, uri)
+        ]
+
+@pytest.fixture
+def shared_backend():
+    backend = MemoryCacheBackend()
+    VocabularyCache.configure(config={}, backend=backend)
+    DummyReader.calls = []
+    yield backend
+    VocabularyCache.configure(config={}, backend=None)
+
+class TestVocabularyCache(object):
+
+    def test_repeated_lookup_is_cached(self, shared_backend):
+        """Vérifie qu'une même recherche n'interroge la base qu'une fois."""
+        assert DummyReader.get_label('voc', 'uri', language='fr') == 'uri@fr'
+        assert DummyReader.get_label(vocabulary='voc', uri='uri', language='fr') == 'uri@fr'
+        assert len(DummyReader.calls) == 1
+        assert DummyReader.get_label('voc', 'uri', language='en') == 'uri@en'
+        assert len(DummyReader.calls) == 2
+        assert VocabularyCache.stats()['hits'] == 1
+
+    def test_negative_results_are_cached(self, shared_backend):
+        """Vérifie que l'absence de résultat est également mise en cache."""
+        assert DummyReader.get_label('voc', 'unknown') is None
+        assert DummyReader.get_label('voc', 'unknown') is None
+        assert len(DummyReader.calls) == 1
+
+    def test_failed_lookups_are_not_cached(self, shared_backend):
+        """Vérifie que le résultat d'une recherche en échec n'est pas mis en cache."""
+        assert DummyReader.get_label('voc', 'error') is None
+        assert DummyReader.get_label('voc', 'error') is None
+        assert len(DummyReader.calls) == 2
+        VocabularyCache.clear()
+        assert DummyReader.get_label('voc', 'error') is None
+        assert len(DummyReader.calls) == 3
+
+    def test_lookups_depending_on_failed_lookups_are_not_cached(self, shared_backend):
+        """Vérifie qu'une recherche qui dépend d'une recherche en échec n'est pas mise en cache."""
+        DummyReader.get_children_labels('voc', 'uri')
+        DummyReader.get_children_labels('voc', 'uri')
+        # the other lookups are cached
+        assert DummyReader.calls.count(('voc', 'uri', None, None)) == 4
+        assert DummyReader.calls.count(('voc', 'error', None, None)) == 2
+        assert len(DummyReader.calls) == 8
+
+    def test_track_lookups(self, shared_backend):
+        """Vérifie que l'échec d'une recherche est signalé au bloc qui l'englobe, et à lui seul."""
+        with track_lookups() as outer:
+            with track_lookups() as inner:
+                assert DummyReader.get_label('voc', 'uri') == 'uri@None'
+            assert not inner.failed
+            with track_lookups() as inner:
+                DummyReader.get_label('voc', 'error')
+            assert inner.failed
+        assert outer.failed
+        with track_lookups() as other:
+            DummyReader.get_label('voc', 'uri')
+        assert not other.failed
+
+    def test_other_database_is_not_cached(self, shared_backend):
+        """Vérifie que les recherches sur une autre base ne sont pas mises en cache."""
+        DummyReader.get_label('voc', 'uri', database='postgresql://other')
+        DummyReader.get_label('voc', 'uri', database='postgresql://other')
+        assert len(DummyReader.calls) == 2
+
+    def test_cached_lists_are_not_altered_by_callers(self, shared_backend):
+        """Vérifie que la modification d'un résultat par l'appelant n'affecte pas le cache."""
+        children = DummyReader.get_children('voc', 'uri')
+        children.append('uri/c')
+        assert DummyReader.get_children('voc', 'uri') == ['uri/a', 'uri/b']
+
+    def test_bump_generation_invalidates_vocabulary(self, shared_backend):
+        """Vérifie que le changement de génération invalide le cache du seul vocabulaire concerné."""
+        DummyReader.get_label('voc', 'uri')
+        DummyReader.get_label('other', 'uri')
+        assert VocabularyCache.bump_generation('voc') == 1
+        DummyReader.get_label('voc', 'uri')
+        DummyReader.get_label('other', 'uri')
+        assert len(DummyReader.calls) == 3
+
+    def test_second_level_is_shared_between_workers(self, shared_backend):
+        """Vérifie qu'un autre processus profite du cache partagé et de ses générations."""
+        DummyReader.get_label('voc', 'uri')
+        # a fresh in-process cache, as in another worker
+        VocabularyCache.clear()
+        DummyReader.get_label('voc', 'uri')
+        assert len(DummyReader.calls) == 1
+
+        # reload from another worker
+        shared_backend.incr('ckanext-ecospheres:vocabulary:voc:generation')
+        VocabularyCache.clear()
+        DummyReader.get_label('voc', 'uri')
+        assert len(DummyReader.calls) == 2
+
+    def test_disabled_cache(self, shared_backend):
+        """Vérifie que le cache peut être désactivé."""
+        VocabularyCache.configure(config={
+            'ckanext.ecospheres.vocabulary_cache.enabled': 'false'
+        }, backend=shared_backend)
+        DummyReader.get_label('voc', 'uri')
+        DummyReader.get_label('voc', 'uri')
+        assert len(DummyReader.calls) == 2
+
+    def test_size_limit(self, shared_backend):
+        """Vérifie que le cache local ne dépasse pas la taille configurée."""
+        VocabularyCache.configure(config={}, backend=None, size=2)
+        for uri in ('a', 'b', 'c'):
+            DummyReader.get_label('voc', uri)
+        assert VocabularyCache.stats()['size'] == 2
+        DummyReader.get_label('voc', 'a')
+        assert len(DummyReader.calls) == 4
+
+LABELS = [
+    {'uri': 'ex:a', 'language': 'fr', 'label': 'A fr'},
+    {'uri': 'ex:a', 'language': 'en', 'label': 'A en'},
+    {'uri': 'ex:b', 'language': 'de', 'label': 'B de'},
+    {'uri': 'ex:c', 'language': 'fr', 'label': 'C fr'},
+]
+HIERARCHY = [
+    {'parent': 'ex:a', 'child': 'ex:b'},
+    {'parent': 'ex:a', 'child': 'ex:c'},
+]
+SYNONYMS = [
+    {'uri': 'ex:b', 'synonym': 'other:b'},
+    {'uri': 'ex:c', 'synonym': 'other:b'},
+]
+
+class TestVocabularySnapshot(object):
+
+    def test_labels(self):
+        """Vérifie que la recherche de labels suit les mêmes règles de repli que la base."""
+        snapshot = VocabularySnapshot(LABELS, default_language='en')
+        assert snapshot.get_label('ex:a', language='fr') == 'A fr'
+        assert snapshot.get_label('ex:a', language='de') == 'A en'
+        assert snapshot.get_label('ex:a') == 'A en'
+        assert snapshot.get_label('ex:b', language='fr') == 'B de'
+        assert snapshot.get_label('ex:z') is None
+        assert snapshot.is_known_uri('ex:c')
+        assert not snapshot.is_known_uri('ex:z')
+        assert len(snapshot) == 3
+
+    def test_hierarchy_and_synonyms(self):
+        """Vérifie les recherches de parents, d'enfants et de synonymes."""
+        snapshot = VocabularySnapshot(LABELS, HIERARCHY, SYNONYMS)
+        assert snapshot.get_children('ex:a') == ['ex:b', 'ex:c']
+        assert snapshot.get_children(['ex:a', 'ex:b']) == ['ex:b', 'ex:c']
+        assert snapshot.get_parents('ex:b') == ['ex:a']
+        assert snapshot.get_parents('ex:a') == []
+        assert snapshot.get_synonyms('ex:b') == ['other:b']
+        assert snapshot.get_uri_from_synonym('other:b') == 'ex:b'
+        assert snapshot.get_uri_from_synonym('other:z') is None
+        assert snapshot.memory_size() > 0
+
+    def test_preloaded_vocabulary_is_read_from_memory(self, shared_backend):
+        """Vérifie qu'un vocabulaire préchargé n'interroge plus la base, et qu'il est reconstruit après un rechargement."""
+        builds = []
+
+        def builder():
+            builds.append(1)
+            return VocabularySnapshot(LABELS, default_language='en')
+
+        VocabularyCache.preload('voc', builder)
+        assert DummyReader.get_label('voc', 'ex:a', language='fr') == 'A fr'
+        assert DummyReader.get_label('other', 'ex:a', language='fr') == 'ex:a@fr'
+        assert len(DummyReader.calls) == 1
+        assert len(builds) == 1
+
+        VocabularyCache.bump_generation('voc')
+        assert DummyReader.get_label('voc', 'ex:c') == 'C fr'
+        assert len(builds) == 2
+        assert len(DummyReader.calls) == 1
+
+    def test_lookups_fall_back_on_database_during_preload(self, shared_backend):
+        """Vérifie que, tant que le premier instantané n'est pas construit, les recherches interrogent la base sans déclencher une autre construction."""
+        builds = []
+
+        def builder():
+            builds.append(1)
+            assert VocabularyCache.snapshot('voc') is None
+            assert DummyReader.get_label('voc', 'ex:a', language='fr') == 'ex:a@fr'
+            return VocabularySnapshot(LABELS, default_language='en')
+
+        VocabularyCache.preload('voc', builder)
+        assert len(builds) == 1
+        assert len(DummyReader.calls) == 1
+        assert VocabularyCache.snapshot('voc') is not None
+        assert VocabularyCache.snapshot('voc').get_label('ex:a', language='fr') == 'A fr'
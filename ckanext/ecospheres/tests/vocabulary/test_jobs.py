@@ -0,0 +1,110 @@
+from builtins import object
+from datetime import datetime
+
+import pytest
+
+from ckanext.ecospheres.vocabulary import jobs
+from ckanext.ecospheres.vocabulary.jobs import (
+    VocabularyLoadJobs, job_groups, job_status, load_job_table
+)
+from ckanext.ecospheres.vocabulary.loader import DB, Session
+from ckanext.ecospheres.vocabulary.parser.httpcache import HttpCache
+from ckanext.ecospheres.vocabulary.registry import registry_table
+
+GROUP = ['insee_official_geographic_code', 'ecospheres_territory']
+
+@pytest.fixture
+def offline_jobs(tmp_path):
+    HttpCache.configure(cache_dir=tmp_path, offline=True)
+    yield
+    HttpCache.configure()
+    with Session() as s:
+        for table, column in (
+            (load_job_table, load_job_table.c.vocabulary),
+            (registry_table, registry_table.c.name)
+        ):
+            s.execute(table.delete().where(column.in_(GROUP)))
+
+class TestJobStatus(object):
+
+    def test_finished_job(self):
+        """Vérifie le calcul de la durée de chaque étape d'un chargement terminé."""
+        status = job_status(
+            {
+                'vocabulary': 'ecospheres_theme', 'phase': 'done',
+                'job_id': 'abc', 'rows': 120, 'inserted': 3, 'deleted': 1,
+                'error': None,
+                'enqueued': datetime(2023, 5, 1, 10, 0, 0),
+                'started': datetime(2023, 5, 1, 10, 0, 5),
+                'parsed': datetime(2023, 5, 1, 10, 1, 5),
+                'finished': datetime(2023, 5, 1, 10, 1, 7, 500000),
+                'updated': datetime(2023, 5, 1, 10, 1, 7, 500000),
+            }
+        )
+        assert status['waiting'] == 5
+        assert status['parsing'] == 60
+        assert status['loading'] == 2.5
+        assert status['started'] == '2023-05-01T10:00:05'
+        assert status['rows'] == 120
+
+    def test_running_job(self):
+        """Vérifie que la durée de l'étape en cours est calculée jusqu'à l'instant présent."""
+        status = job_status(
+            {
+                'vocabulary': 'ogc_epsg', 'phase': 'parsing',
+                'job_id': 'abc', 'rows': None, 'inserted': None,
+                'deleted': None, 'error': None,
+                'enqueued': datetime(2023, 5, 1, 10, 0, 0),
+                'started': datetime(2023, 5, 1, 10, 0, 5),
+                'parsed': None, 'finished': None,
+                'updated': datetime(2023, 5, 1, 10, 0, 5),
+            },
+            now=datetime(2023, 5, 1, 10, 0, 35)
+        )
+        assert status['waiting'] == 5
+        assert status['parsing'] == 30
+        assert status['loading'] is None
+        assert status['finished'] is None
+
+class TestVocabularyLoadJobs(object):
+
+    def test_job_groups(self):
+        """Vérifie que les vocabulaires sont chargés par le même job que ceux dont ils dépendent."""
+        assert job_groups(
+            [
+                'ecospheres_theme', 'ecospheres_territory',
+                'insee_official_geographic_code', 'ogc_epsg'
+            ]
+        ) == [
+            ['ecospheres_theme'],
+            ['insee_official_geographic_code', 'ecospheres_territory'],
+            ['ogc_epsg']
+        ]
+        assert job_groups(['ecospheres_territory']) == [['ecospheres_territory']]
+
+    def test_claim_failure(self):
+        """Vérifie qu'un vocabulaire dont le job n'a pas pu être enregistré est signalé en échec."""
+        report = VocabularyLoadJobs.enqueue(
+            ['ecospheres_theme', 'unknown'],
+            database='postgresql://nobody@127.0.0.1:1/nothing'
+        )
+        assert report == {
+            'queued': [], 'skipped': [], 'failed': ['ecospheres_theme'],
+            'unknown': ['unknown']
+        }
+
+    @pytest.mark.skipif(
+        not (DB or '').startswith('postgresql'),
+        reason='the job table requires PostgreSQL'
+    )
+    def test_dependencies_share_the_job(self, offline_jobs):
+        """Vérifie qu'un vocabulaire et celui dont il dépend sont chargés par un même job."""
+        report = VocabularyLoadJobs.enqueue(GROUP)
+        assert report['queued'] == GROUP
+        # without CKAN's job queue, the job is run by a local worker
+        jobs._local_executor.shutdown(wait=True)
+        jobs._local_executor = None
+        status = {job['vocabulary']: job for job in VocabularyLoadJobs.status(GROUP)}
+        assert status[GROUP[0]]['job_id'] == status[GROUP[1]]['job_id']
+        assert all(job['phase'] == 'failed' for job in status.values())
+        assert 'not in the HTTP cache' in status[GROUP[0]]['error']
@@ -0,0 +1,265 @@
+from builtins import object
+from decimal import Decimal
+
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from ckanext.ecospheres.vocabulary import loader
+from ckanext.ecospheres.vocabulary.loader import (
+    CopyStream, check_source, copy_rows, copy_value, diff_rows, source_skippable,
+    _apply_diff, _check_unchanged, _diff_table, _load_cluster, _staging_table,
+    rollback_vocab, DB, PREVIOUS_SCHEMA, STAGING_SCHEMA
+)
+from ckanext.ecospheres.vocabulary.parser.model import (
+    VocabularyAltLabelTable, VocabularyDataCluster, SQL_SCHEMA
+)
+
+ROWS = [
+    {'uri': 'ex:a', 'language': 'fr', 'label': 'A'},
+    {'uri': 'ex:b', 'language': None, 'label': 'B\tavec\\des\ncaractères spéciaux'},
+    {'uri': 'ex:c', 'language': 'en', 'label': 1.5},
+]
+
+def _label_table():
+    return sqlalchemy.Table(
+        'voc_label', sqlalchemy.MetaData(),
+        sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column('uri', sqlalchemy.String, nullable=False),
+        sqlalchemy.Column('language', sqlalchemy.String),
+        sqlalchemy.Column('label', sqlalchemy.String, nullable=False),
+    )
+
+class TestCopyStream(object):
+
+    def test_copy_value(self):
+        """Vérifie l'encodage des valeurs au format texte de COPY."""
+        assert copy_value(None) == '\\N'
+        assert copy_value('a\tb\\c\nd\re') == 'a\\tb\\\\c\\nd\\re'
+        assert copy_value(12.5) == '12.5'
+
+    def test_stream(self):
+        """Vérifie que les lignes sont encodées par paquets, quelle que soit la taille des lectures."""
+        expected = (
+            'ex:a\tfr\tA\n'
+            'ex:b\t\\N\tB\\tavec\\\\des\\ncaractères spéciaux\n'
+            'ex:c\ten\t1.5\n'
+        )
+        stream = CopyStream(ROWS, ['uri', 'language', 'label'], chunk_size=2)
+        assert stream.read() == expected
+        assert stream.count == 3
+
+        stream = CopyStream(ROWS, ['uri', 'language', 'label'], chunk_size=2)
+        parts = []
+        while data := stream.read(5):
+            assert len(data) <= 5
+            parts.append(data)
+        assert ''.join(parts) == expected
+
+class TestCopyRows(object):
+
+    def test_batched_inserts(self):
+        """Vérifie le chargement par lots pour les bases autres que PostgreSQL."""
+        engine = sqlalchemy.create_engine('sqlite://')
+        table = _label_table()
+        table.create(engine)
+        session = sessionmaker(bind=engine)()
+        assert copy_rows(session, table, iter(ROWS), chunk_size=2) == 3
+        session.commit()
+        res = session.execute(
+            sqlalchemy.select([table.c.uri, table.c.language]).order_by(table.c.id)
+        )
+        assert res.fetchall() == [('ex:a', 'fr'), ('ex:b', None), ('ex:c', 'en')]
+        session.close()
+
+class TestStagingTable(object):
+
+    def test_staging_table(self):
+        """Vérifie que la table de travail est définie dans le schéma dédié, avec des index dont le nom ne dépend pas du schéma."""
+        table = VocabularyAltLabelTable('somevoc').sql
+        staging_table = _staging_table(table)
+        assert staging_table.schema == STAGING_SCHEMA
+        assert staging_table.name == table.name
+        assert table.schema == 'public'
+        names = sorted(
+            str(CreateIndex(index).compile(dialect=postgresql.dialect())).split()[2]
+            for index in staging_table.indexes
+        )
+        assert names == [
+            'ix_somevoc_altlabel_label',
+            'ix_somevoc_altlabel_uri',
+            'somevoc_altlabel_uri_language_idx'
+        ]
+
+class TestDiff(object):
+
+    def test_diff_rows(self):
+        """Vérifie que seules les lignes modifiées sont à insérer ou supprimer."""
+        current = [
+            (1, 'ex:a', 'fr', 'A'),
+            (2, 'ex:b', None, 'B'),
+            (3, 'ex:b', None, 'B'),
+            (4, 'ex:d', 'fr', 'D'),
+        ]
+        rows = [
+            {'uri': 'ex:a', 'language': 'fr', 'label': 'A'},
+            {'uri': 'ex:b', 'language': None, 'label': 'B'},
+            {'uri': 'ex:d', 'language': 'en', 'label': 'D'},
+        ]
+        diff = diff_rows('voc_label', current, rows, ['uri', 'language', 'label'])
+        assert diff.inserted == [{'uri': 'ex:d', 'language': 'en', 'label': 'D'}]
+        assert sorted(diff.deleted) == [3, 4]
+        assert diff.as_dict() == {'inserted': 1, 'deleted': 2, 'unchanged': 2}
+        assert diff
+
+        diff = diff_rows('voc_label', current[:2], rows[:2], ['uri', 'language', 'label'])
+        assert not diff
+        assert diff.ratio == 0
+
+    def test_numeric_values(self):
+        """Vérifie que les valeurs numériques lues dans la base sont reconnues."""
+        diff = diff_rows(
+            'voc_spatial', [(1, 'ex:a', Decimal('1.5'), Decimal('2'))],
+            [{'uri': 'ex:a', 'westlimit': 1.5, 'eastlimit': 2.0}],
+            ['uri', 'westlimit', 'eastlimit']
+        )
+        assert not diff
+
+    def test_apply_diff(self):
+        """Vérifie que l'application des différences donne le même contenu qu'un rechargement complet."""
+        engine = sqlalchemy.create_engine('sqlite://')
+        table = _label_table()
+        table.create(engine)
+        session = sessionmaker(bind=engine)()
+        copy_rows(session, table, ROWS)
+        new_rows = [ROWS[0], ROWS[2], {'uri': 'ex:d', 'language': 'fr', 'label': 'D'}]
+        diff = _diff_table(session, table, new_rows)
+        assert diff.as_dict() == {'inserted': 1, 'deleted': 1, 'unchanged': 2}
+        _apply_diff(session, table, diff)
+        session.commit()
+        res = session.execute(
+            sqlalchemy.select([table.c.uri]).order_by(table.c.uri)
+        )
+        assert [uri for uri, in res] == ['ex:a', 'ex:c', 'ex:d']
+        assert not _diff_table(session, table, new_rows)
+        session.close()
+
+    def test_missing_table(self):
+        """Vérifie qu'aucune différence n'est calculée pour une table absente de la base."""
+        engine = sqlalchemy.create_engine('sqlite://')
+        session = sessionmaker(bind=engine)()
+        assert _diff_table(session, _label_table(), ROWS) is None
+        session.close()
+
+postgresql_only = pytest.mark.skipif(
+    not (DB or '').startswith('postgresql'),
+    reason='requires a PostgreSQL database'
+)
+
+def _labels_cluster(*uris):
+    cluster = VocabularyDataCluster('voctest')
+    for uri in uris:
+        cluster.label.add(uri, 'fr', uri.upper())
+    return cluster
+
+def _labels(schema_name):
+    engine = sqlalchemy.create_engine(DB)
+    with engine.connect() as connection:
+        res = connection.execute(
+            f'SELECT uri FROM {schema_name}.voctest_label ORDER BY uri'
+        )
+        return [uri for uri, in res]
+
+@pytest.fixture
+def voctest():
+    yield 'voctest'
+    engine = sqlalchemy.create_engine(DB)
+    with engine.begin() as connection:
+        for schema_name in (SQL_SCHEMA, PREVIOUS_SCHEMA, STAGING_SCHEMA):
+            for kind in ('label', 'altlabel'):
+                connection.execute(
+                    f'DROP TABLE IF EXISTS {schema_name}.voctest_{kind} CASCADE'
+                )
+
+@postgresql_only
+class TestRollback(object):
+
+    def test_rollback_after_incremental_update(self, voctest):
+        """Vérifie que l'annulation d'une mise à jour incrémentale restaure les données antérieures à celle-ci."""
+        _load_cluster(voctest, _labels_cluster('ex:a', 'ex:b', 'ex:c'),
+            incremental=False, blue_green=True)
+        _load_cluster(voctest, _labels_cluster('ex:a', 'ex:b', 'ex:d'),
+            incremental=False, blue_green=True)
+        assert _labels(PREVIOUS_SCHEMA) == ['ex:a', 'ex:b', 'ex:c']
+        stats = _load_cluster(
+            voctest, _labels_cluster('ex:a', 'ex:b', 'ex:d', 'ex:e')
+        )
+        assert stats['mode'] == 'incremental'
+        assert _labels(SQL_SCHEMA) == ['ex:a', 'ex:b', 'ex:d', 'ex:e']
+        assert _labels(PREVIOUS_SCHEMA) == ['ex:a', 'ex:b', 'ex:d']
+        assert rollback_vocab(voctest)
+        assert _labels(SQL_SCHEMA) == ['ex:a', 'ex:b', 'ex:d']
+        # the restored tables can be updated again
+        stats = _load_cluster(
+            voctest, _labels_cluster('ex:a', 'ex:b', 'ex:d', 'ex:f')
+        )
+        assert stats['mode'] == 'incremental'
+        assert _labels(SQL_SCHEMA) == ['ex:a', 'ex:b', 'ex:d', 'ex:f']
+        assert _labels(PREVIOUS_SCHEMA) == ['ex:a', 'ex:b', 'ex:d']
+
+    def test_no_snapshot_without_changes(self, voctest):
+        """Vérifie que la génération précédente est conservée si la mise à jour incrémentale ne change rien."""
+        _load_cluster(voctest, _labels_cluster('ex:a', 'ex:b'),
+            incremental=False, blue_green=True)
+        _load_cluster(voctest, _labels_cluster('ex:a', 'ex:c'),
+            incremental=False, blue_green=True)
+        stats = _load_cluster(voctest, _labels_cluster('ex:a', 'ex:c'))
+        assert stats == {
+            'mode': 'incremental', 'changed': False,
+            'tables': {
+                'voctest_label': {'inserted': 0, 'deleted': 0, 'unchanged': 2},
+                'voctest_altlabel': {'inserted': 0, 'deleted': 0, 'unchanged': 0}
+            }
+        }
+        assert _labels(PREVIOUS_SCHEMA) == ['ex:a', 'ex:b']
+
+class TestCheckSource(object):
+
+    def test_source_skippable(self):
+        """Vérifie quels vocabulaires peuvent être ignorés lorsque leur source n'a pas changé."""
+        assert source_skippable('ecospheres_territory')
+        assert not source_skippable('ecospheres_theme')
+        assert not source_skippable('ogc_epsg')
+
+    def test_not_skippable_sources_are_not_fetched(self, monkeypatch):
+        """Vérifie que la source des vocabulaires qui seront de toute façon rechargés n'est pas téléchargée."""
+        fetched = []
+
+        def fetch_source_info(url, **kwargs):
+            fetched.append(url)
+            return {'url': url, 'hash': 'abc'}
+
+        monkeypatch.setattr(loader, 'fetch_source_info', fetch_source_info)
+        assert check_source('ecospheres_theme') == (None, False)
+        assert check_source('ogc_epsg') == (None, False)
+        assert fetched == []
+        assert _check_unchanged('ecospheres_territory', skip_unchanged=False) == (
+            (None, False), False
+        )
+        assert fetched == []
+
+    def test_worker_check(self, monkeypatch):
+        """Vérifie qu'un processus n'ignore un vocabulaire que si aucune de ses dépendances n'est rechargée."""
+        monkeypatch.setattr(
+            loader, 'check_source',
+            lambda name, database=None, **kwargs: ({'hash': 'abc'}, True)
+        )
+        assert _check_unchanged('ecospheres_territory') == (
+            ({'hash': 'abc'}, True), True
+        )
+        assert _check_unchanged(
+            'ecospheres_territory', run={'insee_official_geographic_code'}
+        ) == (({'hash': 'abc'}, True), False)
@@ -0,0 +1,75 @@
+from builtins import object
+
+from ckanext.ecospheres.vocabulary.index import VocabularyIndex
+from ckanext.ecospheres.vocabulary.pipeline import (
+    LoadScheduler, parse_vocabularies, vocabulary_host
+)
+
+def _skip_second(name):
+    return f'checked {name}', name.endswith('-2')
+
+class TestLoadScheduler(object):
+
+    def test_declared_dependencies(self):
+        """Vérifie que les territoires Ecosphères sont chargés après les vocabulaires de l'Insee et de l'UE."""
+        assert set(VocabularyIndex.dependencies('ecospheres_territory')) == {
+            'insee_official_geographic_code', 'eu_administrative_territory_unit'
+        }
+        order = LoadScheduler(
+            [
+                'ecospheres_territory', 'ecospheres_theme',
+                'insee_official_geographic_code', 'eu_administrative_territory_unit'
+            ]
+        ).order()
+        assert order.index('ecospheres_territory') > order.index('insee_official_geographic_code')
+        assert order.index('ecospheres_territory') > order.index('eu_administrative_territory_unit')
+
+    def test_order(self):
+        """Vérifie que l'ordre initial est conservé tant qu'il respecte les dépendances."""
+        scheduler = LoadScheduler(
+            ['a', 'b', 'c', 'd'],
+            dependencies={'a': ['c'], 'c': ['d', 'unknown'], 'd': ['c']}
+        )
+        assert scheduler.order() == ['d', 'c', 'a', 'b']
+
+    def test_ready(self):
+        """Vérifie qu'un vocabulaire n'est prêt qu'une fois ses dépendances chargées ou en échec."""
+        scheduler = LoadScheduler(
+            ['a', 'b', 'c'], dependencies={'a': ['b', 'c'], 'b': ['unknown']}
+        )
+        assert scheduler.add('a', 'result-a') == []
+        assert scheduler.add('b', 'result-b') == [('b', 'result-b')]
+        assert scheduler.done('b') == []
+        assert scheduler.done('c') == [('a', 'result-a')]
+        assert scheduler.flush() == []
+
+    def test_flush(self):
+        """Vérifie que les vocabulaires en attente peuvent être récupérés en fin de traitement."""
+        scheduler = LoadScheduler(['a', 'b'], dependencies={'a': ['b']})
+        assert scheduler.add('a', 'result-a') == []
+        assert scheduler.flush() == [('a', 'result-a')]
+
+class TestParseVocabularies(object):
+
+    def test_host(self):
+        """Vérifie l'identification du serveur distant d'un vocabulaire."""
+        assert vocabulary_host('ecospheres_territory') == 'raw.githubusercontent.com'
+
+    def test_failures(self):
+        """Vérifie qu'une erreur dans un processus est renvoyée comme un échec critique."""
+        results = dict(parse_vocabularies(['unknown-1', 'unknown-2'], jobs=2))
+        assert set(results) == {'unknown-1', 'unknown-2'}
+        assert not results['unknown-1']
+        assert isinstance(results['unknown-1'].log[-1], ValueError)
+
+    def test_check(self):
+        """Vérifie que les processus peuvent vérifier un vocabulaire avant de l'analyser."""
+        results = {
+            name: (result, info) for name, result, info in parse_vocabularies(
+                ['unknown-1', 'unknown-2'], jobs=2, check=_skip_second
+            )
+        }
+        assert set(results) == {'unknown-1', 'unknown-2'}
+        assert isinstance(results['unknown-1'][0].log[-1], ValueError)
+        assert results['unknown-1'][1] == 'checked unknown-1'
+        assert results['unknown-2'] == (None, 'checked unknown-2')
@@ -0,0 +1,145 @@
+from builtins import object
+
+import pytest
+
+from ckanext.ecospheres.vocabulary.cache import (
+    VocabularyCache, MemoryCacheBackend, lookup_failed
+)
+from ckanext.ecospheres.vocabulary.plan import (
+    ResolutionPlan, ResolutionPlans, ResolutionStep, STRATEGIES
+)
+from ckanext.ecospheres.vocabulary.reader import VocabularyReader
+
+class DummyStep(ResolutionStep):
+    """Étape factice qui résout les valeurs à partir d'un dictionnaire."""
+
+    __slots__ = ('matches', 'calls')
+
+    def __init__(self, vocabulary, strategy, matches, numeric_only=False):
+        super().__init__(vocabulary, strategy, numeric_only=numeric_only)
+        self.matches = matches
+        self.calls = []
+
+    def resolve(self, value):
+        if not self.applies(value):
+            return
+        self.calls.append([value])
+        return self.matches.get(value)
+
+    def resolve_many(self, values):
+        values = [value for value in values if self.applies(value)]
+        self.calls.append(values)
+        return {
+            value: self.matches[value] for value in values
+            if value in self.matches
+        }
+
+FULL_PROFILE = {
+    'uris': 10, 'fragment_uris': 10, 'numeric_fragment_uris': 0,
+    'synonyms': True, 'regexps': True
+}
+
+class TestResolutionPlans(object):
+
+    def test_impossible_steps_are_skipped(self):
+        """Vérifie que les stratégies qui ne peuvent rien trouver ne font pas partie du plan."""
+        steps = ResolutionPlans.build_steps(
+            ['full', 'plain', 'numeric', 'empty'],
+            profiles={
+                'full': FULL_PROFILE,
+                'plain': {
+                    'uris': 10, 'fragment_uris': 0, 'numeric_fragment_uris': 0,
+                    'synonyms': False, 'regexps': False
+                },
+                'numeric': {
+                    'uris': 10, 'fragment_uris': 10, 'numeric_fragment_uris': 10,
+                    'synonyms': False, 'regexps': False
+                },
+                'empty': {
+                    'uris': 0, 'fragment_uris': 0, 'numeric_fragment_uris': 0,
+                    'synonyms': False, 'regexps': False
+                },
+            }
+        )
+        assert [step.key for step in steps] == [
+            ('full', 'uri'), ('plain', 'uri'), ('numeric', 'uri'),
+            ('full', 'id_fragment'), ('numeric', 'id_fragment'),
+            ('full', 'synonym'),
+            ('full', 'label'), ('plain', 'label'), ('numeric', 'label'),
+            ('full', 'regexp'),
+        ]
+        assert steps[4].numeric_only
+        assert not steps[4].applies('abc')
+        assert steps[4].applies('75')
+        assert not steps[3].numeric_only
+
+    def test_unknown_profile_keeps_all_steps(self):
+        """Vérifie que toutes les stratégies sont conservées quand le vocabulaire n'a pas pu être décrit."""
+        steps = ResolutionPlans.build_steps(
+            ['voc'], strategies=['uri', 'label'], profiles={'voc': None}
+        )
+        assert [step.key for step in steps] == [('voc', 'uri'), ('voc', 'label')]
+
+    def test_profile_of_unavailable_vocabulary(self, monkeypatch):
+        """Vérifie qu'une erreur de base de données ne fait pas perdre les étapes d'un vocabulaire."""
+        VocabularyCache.configure(config={}, backend=MemoryCacheBackend())
+
+        def table_exists(cls, table_sql, database=None):
+            lookup_failed()
+
+        monkeypatch.setattr(VocabularyReader, 'table_exists', classmethod(table_exists))
+        try:
+            assert VocabularyReader.get_vocabulary_profile('voc') is None
+            steps = ResolutionPlans.build_steps(['voc'], strategies=['uri', 'label'])
+            assert [step.key for step in steps] == [('voc', 'uri'), ('voc', 'label')]
+
+            # once the database is available, the profile is read again
+            monkeypatch.setattr(
+                VocabularyReader, 'table_exists',
+                classmethod(lambda cls, table_sql, database=None: False)
+            )
+            assert VocabularyReader.get_vocabulary_profile('voc')['uris'] == 0
+            assert not ResolutionPlans.build_steps(['voc'], strategies=['uri', 'label'])
+        finally:
+            VocabularyCache.configure(config={}, backend=None)
+
+    def test_id_fragment_values(self):
+        """Vérifie que la recherche par identifiant n'est tentée que pour des valeurs admissibles."""
+        step = ResolutionStep('voc', 'id_fragment')
+        assert step.applies('abc-12_x')
+        assert not step.applies('a b')
+        assert not step.applies('http://example.org/a')
+
+class TestResolutionPlan(object):
+
+    def test_precedence_and_stats(self):
+        """Vérifie que les étapes sont appliquées dans l'ordre et que leurs succès sont comptabilisés."""
+        first = DummyStep('voc', 'uri', {'a': 'ex:a'})
+        second = DummyStep('voc', 'label', {'a': 'ex:other', 'b': 'ex:b'})
+        plan = ResolutionPlan(('theme',), [first, second])
+        assert plan.resolve('a') == 'ex:a'
+        assert plan.resolve('b') == 'ex:b'
+        assert plan.resolve('c') is None
+        assert plan.stats.as_dict() == {
+            'resolved': {'voc:uri': 1, 'voc:label': 1},
+            'unresolved': 1
+        }
+
+    def test_batch_resolution(self):
+        """Vérifie que la résolution par lots donne les mêmes résultats et n'interroge que les valeurs non résolues."""
+        first = DummyStep('voc', 'uri', {'a': 'ex:a'})
+        second = DummyStep('voc', 'label', {'a': 'ex:other', 'b': 'ex:b'})
+        plan = ResolutionPlan(('theme',), [first, second])
+        assert plan.resolve_many(['a', 'b', 'c', 'a', '']) == {'a': 'ex:a', 'b': 'ex:b'}
+        assert first.calls == [['a', 'b', 'c']]
+        assert second.calls == [['b', 'c']]
+        assert plan.stats.as_dict() == {
+            'resolved': {'voc:uri': 1, 'voc:label': 1},
+            'unresolved': 1
+        }
+
+    def test_strategies(self):
+        """Vérifie que les stratégies inconnues sont refusées."""
+        assert STRATEGIES[0] == 'uri'
+        with pytest.raises(ValueError):
+            ResolutionStep('voc', 'anything')
@@ -0,0 +1,118 @@
+from builtins import object
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from ckanext.ecospheres.vocabulary.parser.httpcache import HttpCache
+from ckanext.ecospheres.vocabulary.registry import (
+    VocabularyRegistry, fetch_source_info, source_unchanged
+)
+
+CONTENT = b'<rdf:RDF/>'
+
+class _SourceHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(CONTENT)))
+        self.end_headers()
+        self.wfile.write(CONTENT)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def source_url():
+    server = HTTPServer(('127.0.0.1', 0), _SourceHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/vocabulary.rdf'
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def session():
+    engine = sqlalchemy.create_engine('sqlite://')
+
+    @sqlalchemy.event.listens_for(engine, 'connect')
+    def attach(connection, record):
+        connection.execute("ATTACH DATABASE ':memory:' AS public")
+
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+class TestVocabularyRegistry(object):
+
+    def test_record(self, session):
+        """Vérifie l'enregistrement des chargements successifs d'un vocabulaire."""
+        assert VocabularyRegistry.names(session) is None
+        source = {'url': 'http://example.org', 'etag': '"v1"', 'hash': 'abc'}
+        entry = VocabularyRegistry.record(
+            session, 'voc', 'loaded', source=source,
+            rows={'voc_label': 2}, changed=True, load_duration=1.5
+        )
+        assert entry['generation'] == 1
+        assert entry['source_hash'] == 'abc'
+        assert entry['rows'] == {'voc_label': 2}
+        entry = VocabularyRegistry.record(session, 'voc', 'failed', error='boom')
+        assert entry['status'] == 'failed'
+        assert entry['generation'] == 1
+        assert entry['source_hash'] == 'abc'
+        assert entry['loaded'] is not None
+        entry = VocabularyRegistry.record(session, 'voc', 'rolled back', changed=True)
+        assert entry['generation'] == 2
+        assert entry['source_hash'] is None
+        VocabularyRegistry.record(session, 'other', 'failed', error='boom')
+        assert VocabularyRegistry.names(session) == ['voc']
+
+    def test_existing_tables(self, session):
+        """Vérifie que les vocabulaires déjà chargés sont inscrits à la création du registre."""
+        session.execute('CREATE TABLE public.voc_label (id INTEGER)')
+        session.execute('CREATE TABLE public.voc_altlabel (id INTEGER)')
+        VocabularyRegistry.create(session)
+        assert VocabularyRegistry.names(session) == ['voc']
+        assert VocabularyRegistry.get(session, 'voc')['source_hash'] is None
+
+class TestSource(object):
+
+    def test_fetch_source_info(self, source_url, tmp_path):
+        """Vérifie le calcul de l'empreinte de la source."""
+        HttpCache.configure(cache_dir=tmp_path)
+        try:
+            source = fetch_source_info(source_url)
+            assert source['hash'] == hashlib.sha256(CONTENT).hexdigest()
+            assert source['etag'] == '"v1"'
+            entry = {
+                'source_url': source_url, 'source_etag': '"v1"',
+                'source_hash': source['hash'], 'loaded': 'yesterday'
+            }
+            # served from the cache after a conditional request
+            assert fetch_source_info(source_url, proxies={}) == source
+            assert source_unchanged(entry, source)
+        finally:
+            HttpCache.configure()
+
+    def test_source_unchanged(self):
+        """Vérifie les cas où un vocabulaire doit être rechargé."""
+        entry = {
+            'source_url': 'http://example.org', 'source_hash': 'abc',
+            'loaded': 'yesterday'
+        }
+        source = {'url': 'http://example.org', 'hash': 'abc'}
+        assert source_unchanged(entry, source)
+        assert not source_unchanged(entry, dict(source, hash='def'))
+        assert not source_unchanged(entry, dict(source, url='http://example.com'))
+        assert not source_unchanged(dict(entry, source_hash=None), source)
+        assert not source_unchanged(dict(entry, loaded=None), source)
+        assert not source_unchanged(None, source)
+        assert not source_unchanged(entry, None)
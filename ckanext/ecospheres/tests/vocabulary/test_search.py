@@ -0,0 +1,40 @@
+from builtins import object
+
+from ckanext.ecospheres.vocabulary.search import (
+    SearchMemo, current_memo, search_scope
+)
+
+class TestSearchMemo(object):
+
+    def test_negative_results_are_memoized(self):
+        """Vérifie que l'absence de résultat est mémorisée et comptabilisée."""
+        memo = SearchMemo(size=10, ttl=60)
+        assert memo.get('key') is memo.MISSING
+        memo.set('key', None)
+        assert memo.get('key') is None
+        assert memo.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+    def test_size_and_ttl_limits(self):
+        """Vérifie que la taille et la durée de vie des résultats sont bornées."""
+        memo = SearchMemo(size=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            memo.set(key, key)
+        assert memo.get('a') is memo.MISSING
+        assert memo.get('c') == 'c'
+
+        memo = SearchMemo(size=2, ttl=0)
+        memo.set('a', 'a')
+        assert memo.get('a') is memo.MISSING
+
+    def test_scopes(self):
+        """Vérifie que chaque périmètre (moissonnage) dispose de son propre mémo, réutilisé d'un appel à l'autre."""
+        process_memo = current_memo()
+        with search_scope('job-1') as memo:
+            assert current_memo() is memo
+            assert memo is not process_memo
+            memo.set('key', 'value')
+        assert current_memo() is process_memo
+        with search_scope('job-1') as memo:
+            assert memo.get('key') == 'value'
+        with search_scope('job-2') as memo:
+            assert memo.get('key') is memo.MISSING
@@ -0,0 +1,129 @@
+from builtins import object
+from collections import Counter
+
+import pytest
+
+from ckanext.ecospheres.vocabulary import unmatched
+from ckanext.ecospheres.vocabulary.loader import DB, Session
+from ckanext.ecospheres.vocabulary.unmatched import (
+    MAX_FLUSH_FAILURES, UnmatchedValues, UnmatchedValuesReport,
+    current_collector, unmatched_scope, unmatched_value_table
+)
+
+class DummyStore:
+    """Stockage factice des rapports."""
+
+    def __init__(self, fail=False):
+        self.reports = []
+        self.fail = fail
+
+    def __call__(self, harvest_job_id, counter, database=None):
+        if self.fail:
+            return False
+        self.reports.append((harvest_job_id, Counter(counter)))
+        return True
+
+class TestUnmatchedValues(object):
+
+    def test_values_are_counted(self):
+        """Vérifie que les valeurs sans correspondance sont comptées par chemin et valeur."""
+        store = DummyStore()
+        collector = UnmatchedValues('job-1', store=store)
+        collector.add('theme', 'Agriculture')
+        collector.add(('theme',), 'Agriculture')
+        collector.add(['resource', 'format'], 'SHP')
+        assert collector.counter == Counter({
+            (('theme',), 'Agriculture'): 2,
+            (('resource', 'format'), 'SHP'): 1
+        })
+
+        collector.flush()
+        assert store.reports == [('job-1', Counter({
+            (('theme',), 'Agriculture'): 2,
+            (('resource', 'format'), 'SHP'): 1
+        }))]
+        assert not collector.counter
+
+        collector.flush()
+        assert len(store.reports) == 1
+
+    def test_flush_interval(self):
+        """Vérifie que les comptes ne sont stockés qu'à intervalles réguliers, sauf si c'est explicitement demandé."""
+        store = DummyStore()
+        collector = UnmatchedValues('job-1', store=store)
+        collector.add('theme', 'Agriculture')
+        collector.flush(force=False)
+        assert not store.reports
+        collector.flush()
+        assert len(store.reports) == 1
+
+    def test_failed_flush_keeps_counts(self):
+        """Vérifie que les comptes sont conservés si leur stockage échoue."""
+        store = DummyStore(fail=True)
+        collector = UnmatchedValues('job-1', store=store)
+        collector.add('theme', 'Agriculture')
+        collector.flush()
+        collector.add('theme', 'Agriculture')
+        assert collector.counter[(('theme',), 'Agriculture')] == 2
+
+    def test_failed_flushes_are_bounded(self):
+        """Vérifie que des comptes qui ne peuvent pas être stockés sont abandonnés après plusieurs essais."""
+        store = DummyStore(fail=True)
+        collector = UnmatchedValues('job-1', store=store)
+        collector.add('theme', 'Agriculture')
+        for _ in range(MAX_FLUSH_FAILURES - 1):
+            collector.flush()
+        assert collector.counter[(('theme',), 'Agriculture')] == 1
+        collector.flush()
+        assert not collector.counter
+        store.fail = False
+        collector.add('theme', 'Agriculture')
+        collector.flush()
+        assert store.reports == [('job-1', Counter({(('theme',), 'Agriculture'): 1}))]
+
+    def test_scope(self):
+        """Vérifie que chaque moissonnage dispose de son propre compteur, réutilisé d'un appel à l'autre."""
+        assert current_collector() is None
+        with unmatched_scope('test-job-1') as collector:
+            assert current_collector() is collector
+            collector.add('theme', 'Agriculture')
+        assert current_collector() is None
+        with unmatched_scope('test-job-1') as same_collector:
+            assert same_collector is collector
+            assert collector.counter[(('theme',), 'Agriculture')] == 1
+        with unmatched_scope('test-job-2') as other_collector:
+            assert other_collector is not collector
+        for job_id in ('test-job-1', 'test-job-2'):
+            unmatched._COLLECTORS.pop(job_id, None)
+
+@pytest.mark.skipif(
+    not (DB or '').startswith('postgresql'),
+    reason='the report table requires PostgreSQL'
+)
+class TestUnmatchedValuesReport(object):
+
+    @pytest.fixture
+    def job_id(self):
+        yield 'test-unmatched-job'
+        with Session() as s:
+            s.execute(
+                unmatched_value_table.delete().where(
+                    unmatched_value_table.c.harvest_job_id == 'test-unmatched-job'
+                )
+            )
+
+    def test_store(self, job_id):
+        """Vérifie le stockage de valeurs identiques une fois converties en texte, et de valeurs très longues."""
+        long_value = 'x' * 10000
+        assert UnmatchedValuesReport.store(job_id, Counter({
+            (('a', 'b'), 1): 2,
+            (('a/b',), '1'): 3,
+            (('c',), long_value): 1
+        }))
+        assert UnmatchedValuesReport.store(job_id, Counter({(('c',), long_value): 1}))
+        report = UnmatchedValuesReport.read(job_id)
+        assert report['total'] == 7
+        assert report['fields'] == {
+            'a/b': [{'value': '1', 'count': 5}],
+            'c': [{'value': long_value, 'count': 2}]
+        }
@@ -0,0 +1,732 @@
+"""
+Cache for vocabulary lookups.
+
+Vocabulary data only changes when a vocabulary is (re)loaded
+with :py:func:`ckanext.ecospheres.vocabulary.loader.load_vocab`,
+so the results of :py:class:`ckanext.ecospheres.vocabulary.reader.VocabularyReader`
+lookups can safely be reused until then. The cache has two levels:
+
+* an in-process LRU cache, which answers most lookups
+  without leaving the worker ;
+* an optional second-level cache shared by all workers,
+  stored in the Redis instance CKAN already requires, so
+  that warm results survive restarts and benefit every
+  process.
+
+Every cache key contains the *generation* of the vocabulary,
+ie a counter that is bumped each time the vocabulary is
+loaded. When the second-level cache is enabled, generations
+are stored in Redis, thus a single ``load_vocab`` run
+invalidates the cached lookups of all workers at once.
+
+Frequently used vocabularies can also be preloaded as a whole,
+see :py:meth:`VocabularyCache.preload`. Their labels, hierarchy
+and synonyms are then kept in memory as a :py:class:`VocabularySnapshot`.
+
+The following configuration options are available:
+
+``ckanext.ecospheres.vocabulary_cache.enabled`` (default ``true``)
+    Set to ``false`` to disable the cache altogether.
+``ckanext.ecospheres.vocabulary_cache.redis`` (default ``false``)
+    Use Redis as a shared second-level cache.
+``ckanext.ecospheres.vocabulary_cache.size`` (default ``10000``)
+    Maximum number of lookups kept by the in-process cache.
+``ckanext.ecospheres.vocabulary_cache.local_ttl`` (default ``300``)
+    How long, in seconds, the in-process cache keeps a result.
+``ckanext.ecospheres.vocabulary_cache.redis_ttl`` (default ``86400``)
+    How long, in seconds, Redis keeps a result.
+``ckanext.ecospheres.vocabulary_cache.generation_ttl`` (default ``10``)
+    How long, in seconds, a worker trusts the generation it
+    last read from Redis. This is the maximum delay for a
+    reload to be seen by all workers.
+
+Examples
+--------
+>>> from ckanext.ecospheres.vocabulary.cache import (
+...     VocabularyCache, MemoryCacheBackend
+... )
+>>> VocabularyCache.configure(backend=MemoryCacheBackend())
+>>> VocabularyCache.bump_generation('eu_theme')
+1
+
+"""
+import copy
+import functools
+import inspect
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ckanext-ecospheres:vocabulary'
+
+_MISSING = object()
+
+def _get_config():
+    try:
+        from ckan.plugins.toolkit import config
+        return config
+    except Exception:
+        return {}
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes', 'on', '1')
+    return bool(value)
+
+class MemoryCacheBackend:
+    """In-memory stand-in for the Redis second-level cache.
+
+    It mimics the few Redis commands used by
+    :py:class:`VocabularyCache`. As it lives in the current
+    process, it is mostly meant for tests.
+
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, None))
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (0, None))
+            value = int(value) + 1
+            self._data[key] = (str(value), expires)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class RedisCacheBackend:
+    """Second-level cache stored in Redis.
+
+    Parameters
+    ----------
+    client : redis.Redis, optional
+        Redis client. If not provided, a connection to
+        the Redis instance configured for CKAN is opened.
+
+    """
+
+    def __init__(self, client=None):
+        if client is None:
+            from ckan.lib.redis import connect_to_redis
+            client = connect_to_redis()
+        self._client = client
+
+    def get(self, key):
+        value = self._client.get(key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, value, ex=ttl or None)
+
+    def incr(self, key):
+        return int(self._client.incr(key))
+
+    def clear(self):
+        for key in self._client.scan_iter(f'{KEY_PREFIX}:*'):
+            self._client.delete(key)
+
+class VocabularyCache:
+    """Two-level cache for vocabulary lookups.
+
+    This class is not meant to be instantiated, all
+    its methods are class methods. The configuration is
+    read from the CKAN configuration file on first use, unless
+    :py:meth:`VocabularyCache.configure` was called before.
+
+    """
+
+    ENABLED = True
+    BACKEND = None
+    SIZE = 10000
+    LOCAL_TTL = 300
+    REDIS_TTL = 86400
+    GENERATION_TTL = 10
+
+    _configured = False
+    _lock = threading.RLock()
+    _local = OrderedDict()
+    _generations = {}
+    _stats = {'hits': 0, 'misses': 0}
+    _snapshots = {}
+    _snapshot_builders = {}
+    _rebuilding = set()
+
+    @classmethod
+    def configure(cls, config=None, backend=_MISSING, **options):
+        """Set up the cache.
+
+        Parameters
+        ----------
+        config : dict, optional
+            CKAN configuration. If not provided,
+            :py:data:`ckan.plugins.toolkit.config` is used.
+        backend : MemoryCacheBackend or RedisCacheBackend or None, optional
+            Explicit second-level backend. ``None`` disables
+            the second-level cache. If not provided, it
+            depends on the configuration.
+        **options
+            Explicit values for the class attributes
+            ``ENABLED``, ``SIZE``, ``LOCAL_TTL``, ``REDIS_TTL``
+            and ``GENERATION_TTL``, which take precedence over
+            the configuration.
+
+        """
+        if config is None:
+            config = _get_config()
+        prefix = 'ckanext.ecospheres.vocabulary_cache'
+        with cls._lock:
+            cls.ENABLED = _as_bool(config.get(f'{prefix}.enabled', True))
+            cls.SIZE = int(config.get(f'{prefix}.size', 10000))
+            cls.LOCAL_TTL = float(config.get(f'{prefix}.local_ttl', 300))
+            cls.REDIS_TTL = int(config.get(f'{prefix}.redis_ttl', 86400))
+            cls.GENERATION_TTL = float(config.get(f'{prefix}.generation_ttl', 10))
+            for option, value in options.items():
+                setattr(cls, option.upper(), value)
+
+            if backend is _MISSING:
+                backend = None
+                if cls.ENABLED and _as_bool(config.get(f'{prefix}.redis', False)):
+                    try:
+                        backend = RedisCacheBackend()
+                    except Exception as e:
+                        logger.error(
+                            'Could not connect to Redis, the second-level '
+                            'vocabulary cache is disabled. {0}'.format(str(e))
+                        )
+            cls.BACKEND = backend
+            cls._local.clear()
+            cls._generations.clear()
+            cls._snapshots.clear()
+            cls._snapshot_builders.clear()
+            cls._stats = {'hits': 0, 'misses': 0}
+            cls._configured = True
+
+    @classmethod
+    def _ensure_configured(cls):
+        if not cls._configured:
+            cls.configure()
+
+    @classmethod
+    def generation(cls, vocabulary):
+        """Return the current generation of a vocabulary.
+
+        Parameters
+        ----------
+        vocabulary : str
+            Name of the vocabulary, ie its ``name``
+            property in ``vocabularies.yaml``.
+
+        Returns
+        -------
+        int
+
+        """
+        cls._ensure_configured()
+        now = time.monotonic()
+        with cls._lock:
+            generation, checked = cls._generations.get(vocabulary, (0, None))
+            if cls.BACKEND is None or (
+                checked is not None and now - checked < cls.GENERATION_TTL
+            ):
+                return generation
+        try:
+            generation = int(
+                cls.BACKEND.get(f'{KEY_PREFIX}:{vocabulary}:generation') or 0
+            )
+        except Exception as e:
+            logger.error(
+                'Failed to read the generation of vocabulary "{0}" from '
+                'the second-level cache. {1}'.format(vocabulary, str(e))
+            )
+        with cls._lock:
+            cls._generations[vocabulary] = (generation, now)
+        return generation
+
+    @classmethod
+    def bump_generation(cls, vocabulary):
+        """Invalidate all cached lookups for a vocabulary.
+
+        This should be called whenever the vocabulary
+        data is modified in the database.
+
+        Parameters
+        ----------
+        vocabulary : str
+            Name of the vocabulary, ie its ``name``
+            property in ``vocabularies.yaml``.
+
+        Returns
+        -------
+        int
+            The new generation of the vocabulary.
+
+        """
+        cls._ensure_configured()
+        with cls._lock:
+            generation = cls._generations.get(vocabulary, (0, None))[0] + 1
+        if cls.BACKEND is not None:
+            try:
+                generation = cls.BACKEND.incr(
+                    f'{KEY_PREFIX}:{vocabulary}:generation'
+                )
+            except Exception as e:
+                logger.error(
+                    'Failed to bump the generation of vocabulary "{0}" in '
+                    'the second-level cache. {1}'.format(vocabulary, str(e))
+                )
+        with cls._lock:
+            cls._generations[vocabulary] = (generation, time.monotonic())
+            for key in [k for k in cls._local if k[0] == vocabulary]:
+                del cls._local[key]
+        return generation
+
+    @classmethod
+    def get(cls, vocabulary, key):
+        """Get a cached value.
+
+        Parameters
+        ----------
+        vocabulary : str
+            Name of the vocabulary.
+        key : str
+            Key identifying the lookup within
+            the vocabulary.
+
+        Returns
+        -------
+        object
+            The cached value, or the module's ``_MISSING``
+            sentinel when there is none. As ``None`` is a
+            legitimate cached value, the sentinel should be
+            tested with ``is``.
+
+        """
+        cls._ensure_configured()
+        full_key = (vocabulary, cls.generation(vocabulary), key)
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._local.get(full_key)
+            if entry is not None:
+                value, expires = entry
+                if expires >= now:
+                    cls._local.move_to_end(full_key)
+                    cls._stats['hits'] += 1
+                    return _copy(value)
+                del cls._local[full_key]
+
+        if cls.BACKEND is not None:
+            try:
+                raw = cls.BACKEND.get(cls._redis_key(full_key))
+            except Exception as e:
+                logger.error(
+                    'Failed to read from the second-level vocabulary '
+                    'cache. {0}'.format(str(e))
+                )
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                cls._store_local(full_key, value)
+                with cls._lock:
+                    cls._stats['hits'] += 1
+                return _copy(value)
+
+        with cls._lock:
+            cls._stats['misses'] += 1
+        return _MISSING
+
+    @classmethod
+    def set(cls, vocabulary, key, value):
+        """Store a value in the cache.
+
+        Parameters
+        ----------
+        vocabulary : str
+            Name of the vocabulary.
+        key : str
+            Key identifying the lookup within
+            the vocabulary.
+        value : object
+            JSON-serializable value.
+
+        """
+        cls._ensure_configured()
+        full_key = (vocabulary, cls.generation(vocabulary), key)
+        cls._store_local(full_key, _copy(value))
+        if cls.BACKEND is not None:
+            try:
+                cls.BACKEND.set(
+                    cls._redis_key(full_key),
+                    json.dumps(value, ensure_ascii=False),
+                    ttl=cls.REDIS_TTL
+                )
+            except Exception as e:
+                logger.error(
+                    'Failed to write into the second-level vocabulary '
+                    'cache. {0}'.format(str(e))
+                )
+
+    @classmethod
+    def preload(cls, vocabulary, builder):
+        """Keep an in-memory snapshot of a vocabulary.
+
+        Once a vocabulary has been preloaded, the lookups
+        implemented by :py:class:`VocabularySnapshot` are
+        answered from memory. The snapshot is rebuilt with
+        the same `builder` when the generation of the
+        vocabulary changes.
+
+        Parameters
+        ----------
+        vocabulary : str
+            Name of the vocabulary, ie its ``name``
+            property in ``vocabularies.yaml``.
+        builder : callable
+            Function without arguments returning a
+            :py:class:`VocabularySnapshot`, or ``None`` if
+            the vocabulary data is not available.
+
+        Returns
+        -------
+        VocabularySnapshot or None
+
+        """
+        cls._ensure_configured()
+        # until the first build is done, the requests fall back
+        # on the database instead of building their own snapshot
+        with cls._lock:
+            cls._snapshot_builders[vocabulary] = builder
+            cls._rebuilding.add(vocabulary)
+        try:
+            return cls._build_snapshot(vocabulary, builder)
+        finally:
+            with cls._lock:
+                cls._rebuilding.discard(vocabulary)
+
+    @classmethod
+    def snapshot(cls, vocabulary):
+        """Return the up-to-date snapshot of a preloaded vocabulary.
+
+        Parameters
+        ----------
+        vocabulary : str
+            Name of the vocabulary, ie its ``name``
+            property in ``vocabularies.yaml``.
+
+        Returns
+        -------
+        VocabularySnapshot or None
+            ``None`` if the vocabulary wasn't preloaded, or
+            while its snapshot is being rebuilt.
+
+        """
+        with cls._lock:
+            builder = cls._snapshot_builders.get(vocabulary)
+            if builder is None:
+                return None
+            generation, snapshot = cls._snapshots.get(vocabulary, (None, None))
+        if generation == cls.generation(vocabulary):
+            return snapshot
+        with cls._lock:
+            if vocabulary in cls._rebuilding:
+                return None
+            cls._rebuilding.add(vocabulary)
+        try:
+            return cls._build_snapshot(vocabulary, builder)
+        finally:
+            with cls._lock:
+                cls._rebuilding.discard(vocabulary)
+
+    @classmethod
+    def _build_snapshot(cls, vocabulary, builder):
+        # the generation is read first, so that a reload happening
+        # while the snapshot is built will trigger a new build
+        generation = cls.generation(vocabulary)
+        snapshot = builder()
+        with cls._lock:
+            cls._snapshots[vocabulary] = (generation, snapshot)
+        return snapshot
+
+    @classmethod
+    def clear(cls):
+        """Empty the in-process cache.
+
+        The second-level cache is left untouched, use
+        :py:meth:`VocabularyCache.bump_generation` to
+        invalidate it.
+
+        """
+        with cls._lock:
+            cls._local.clear()
+            cls._generations.clear()
+            cls._snapshots.clear()
+
+    @classmethod
+    def stats(cls):
+        """Return the hit and miss counters of the current process.
+
+        Returns
+        -------
+        dict
+            A dictionnary with keys ``hits``, ``misses``
+            and ``size`` (number of lookups in the in-process
+            cache).
+
+        """
+        with cls._lock:
+            return dict(cls._stats, size=len(cls._local))
+
+    @classmethod
+    def _store_local(cls, full_key, value):
+        with cls._lock:
+            cls._local[full_key] = (value, time.monotonic() + cls.LOCAL_TTL)
+            cls._local.move_to_end(full_key)
+            while len(cls._local) > cls.SIZE:
+                cls._local.popitem(last=False)
+
+    @staticmethod
+    def _redis_key(full_key):
+        vocabulary, generation, key = full_key
+        return f'{KEY_PREFIX}:{vocabulary}:{generation}:{key}'
+
+class VocabularySnapshot:
+    """In-memory copy of the labels, hierarchy and synonyms of a vocabulary.
+
+    Its methods mirror the :py:class:`VocabularyReader` methods
+    with the same names, minus the ``vocabulary`` and ``database``
+    parameters.
+
+    Parameters
+    ----------
+    labels : list(dict)
+        Content of the label table.
+    hierarchy : list(dict), optional
+        Content of the hierarchy table, if the
+        vocabulary has one.
+    synonyms : list(dict), optional
+        Content of the synonym table, if the
+        vocabulary has one.
+    default_language : str, optional
+        Language of the labels used when there is none
+        in the requested language.
+
+    """
+
+    def __init__(self, labels, hierarchy=None, synonyms=None, default_language=None):
+        self.default_language = default_language
+        self._labels = {}
+        for row in labels:
+            self._labels.setdefault(sys.intern(row['uri']), []).append(
+                (row.get('language'), row.get('label'))
+            )
+        self._parents = {}
+        self._children = {}
+        for row in hierarchy or ():
+            parent = sys.intern(row['parent'])
+            child = sys.intern(row['child'])
+            self._parents.setdefault(child, set()).add(parent)
+            self._children.setdefault(parent, set()).add(child)
+        self._synonyms = {}
+        self._synonym_uris = {}
+        for row in synonyms or ():
+            uri = sys.intern(row['uri'])
+            self._synonyms.setdefault(uri, set()).add(row['synonym'])
+            self._synonym_uris.setdefault(row['synonym'], uri)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def is_known_uri(self, uri):
+        return isinstance(uri, str) and uri in self._labels
+
+    def get_label(self, uri, language=None):
+        labels = self._labels.get(uri) if isinstance(uri, str) else None
+        if not labels:
+            return
+        for expected in (language, self.default_language):
+            if expected:
+                for label_language, label in labels:
+                    if label_language == expected and label:
+                        return label
+        return labels[0][1] or None
+
+    def get_parents(self, uri):
+        return self._related(self._parents, uri)
+
+    def get_children(self, uri):
+        return self._related(self._children, uri)
+
+    def get_synonyms(self, uri):
+        if not isinstance(uri, str):
+            return []
+        return sorted(self._synonyms.get(uri, ()))
+
+    def get_uri_from_synonym(self, synonym):
+        if not isinstance(synonym, str):
+            return
+        return self._synonym_uris.get(synonym)
+
+    def memory_size(self):
+        """Approximate memory used by the snapshot, in bytes."""
+        return _deep_sizeof(self.__dict__)
+
+    @staticmethod
+    def _related(index, uri):
+        uris = uri if isinstance(uri, list) else [uri]
+        related = set()
+        for item in uris:
+            if isinstance(item, str):
+                related.update(index.get(item, ()))
+        return sorted(related)
+
+def _deep_sizeof(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            _deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+def _copy(value):
+    if isinstance(value, (list, dict)):
+        return copy.deepcopy(value)
+    return value
+
+def _json_default(obj):
+    return getattr(obj, '__name__', str(obj))
+
+_lookup_state = threading.local()
+
+def lookup_failed():
+    """Mark the current lookup as failed.
+
+    :py:class:`VocabularyReader` methods call this function
+    when they catch an error and return a default value. The
+    result of a failed lookup - and of the lookups that depend
+    on it - is not cached, so that the vocabulary is queried
+    again once the database is available.
+
+    """
+    _lookup_state.failed = True
+
+class LookupOutcome:
+    """Outcome of the lookups run within :py:func:`track_lookups`.
+
+    Attributes
+    ----------
+    failed : bool
+        ``True`` if some lookup failed, see :py:func:`lookup_failed`.
+
+    """
+
+    __slots__ = ('failed',)
+
+    def __init__(self):
+        self.failed = False
+
+@contextmanager
+def track_lookups():
+    """Tell if the lookups run within the block failed.
+
+    Results computed from a failed lookup shall not be kept,
+    whatever the cache. A failure is also reported to the
+    enclosing block, if any.
+
+    Yields
+    ------
+    LookupOutcome
+        Its ``failed`` attribute is set when
+        the block exits.
+
+    """
+    outer_failed = getattr(_lookup_state, 'failed', False)
+    _lookup_state.failed = False
+    outcome = LookupOutcome()
+    try:
+        yield outcome
+    finally:
+        outcome.failed = _lookup_state.failed
+        _lookup_state.failed = outer_failed or outcome.failed
+
+def cached(func):
+    """Decorator caching the results of a :py:class:`VocabularyReader` method.
+
+    The decorated method must have a ``vocabulary`` parameter
+    and may have a ``database`` parameter. Lookups on another
+    database than the main CKAN one are never cached.
+
+    Negative results (``None``, empty lists, ``False``)
+    are cached as well, unless the lookup failed, see
+    :py:func:`lookup_failed`.
+
+    If the vocabulary was preloaded with
+    :py:meth:`VocabularyCache.preload` and its
+    :py:class:`VocabularySnapshot` implements the method,
+    the result is read from the snapshot.
+
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(cls, *args, **kwargs):
+        VocabularyCache._ensure_configured()
+        if not VocabularyCache.ENABLED:
+            return func(cls, *args, **kwargs)
+
+        arguments = signature.bind(cls, *args, **kwargs)
+        arguments.apply_defaults()
+        parameters = dict(arguments.arguments)
+        parameters.pop('cls', None)
+        vocabulary = parameters.pop('vocabulary', None)
+        if not vocabulary or parameters.pop('database', None):
+            return func(cls, *args, **kwargs)
+
+        snapshot = VocabularyCache.snapshot(vocabulary)
+        if snapshot is not None and hasattr(snapshot, func.__name__):
+            return getattr(snapshot, func.__name__)(**parameters)
+
+        key = '{0}:{1}'.format(
+            func.__name__,
+            json.dumps(
+                parameters, sort_keys=True,
+                ensure_ascii=False, default=_json_default
+            )
+        )
+        value = VocabularyCache.get(vocabulary, key)
+        if value is _MISSING:
+            with track_lookups() as outcome:
+                value = func(cls, *args, **kwargs)
+            if not outcome.failed:
+                VocabularyCache.set(vocabulary, key, value)
+        return value
+
+    return wrapper
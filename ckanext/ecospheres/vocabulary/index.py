@@ -90,7 +90,7 @@ Or just one:
 
 """
 
-import yaml, json
+import yaml, json, time
 from pathlib import Path
 from rdflib import (
     Graph, URIRef, Literal, SKOS, RDF
@@ -215,6 +215,28 @@ class VocabularyIndex:
         else:
             raise ValueError(f"unknown vocabulary '{name}'")
     
+    @classmethod
+    def dependencies(cls, name):
+        """Return the vocabularies that should be loaded before the given one.
+
+        Dependencies are listed by the ``depends_on``
+        property in ``vocabularies.yaml``.
+
+        Returns
+        -------
+        list(str)
+
+        Raises
+        ------
+        ValueError
+            If the vocabulary doesn't exist.
+
+        """
+        dependencies = cls.get(name, 'depends_on') or []
+        if isinstance(dependencies, str):
+            dependencies = [dependencies]
+        return list(dependencies)
+
     @classmethod
     def parser(cls, name):
         """Return the parser to use for the given vocabulary.
@@ -291,10 +313,61 @@ class VocabularyIndex:
             params.update(kwargs)
             params.update(VocabularyIndex.params(name))
             parser = VocabularyIndex.parser(name)
-            return parser.__call__(**params)
+            start = time.perf_counter()
+            result = parser.__call__(**params)
+            result.duration = time.perf_counter() - start
+            return result
         else:
             raise ValueError(f"unknown vocabulary '{name}'")
 
+    @classmethod
+    def stream(cls, name, chunk_size=None, update=False, **kwargs):
+        """Parse a vocabulary in streaming mode, if its parser allows it.
+
+        See :py:mod:`ckanext.ecospheres.vocabulary.parser.stream`.
+
+        Parameters
+        ----------
+        name : str
+            Name of the vocabulary.
+        chunk_size : int, optional
+            Number of rows of the chunks. If not provided,
+            the parser's default is used.
+        update : bool, default False
+            Force update of vocabulary properties from the
+            ``vocabularies.yaml`` file.
+        **kwargs : str
+            Keyword parameters passed down to :py:func:`requests.get`,
+            such as authentification info, proxy mapping, etc.
+
+        Returns
+        -------
+        tuple or None
+            The parsing result, as a
+            :py:class:`ckanext.ecospheres.vocabulary.parser.stream.VocabularyStreamingResult`
+            object, and the generator of the chunks of rows.
+            ``None`` if the parser of the vocabulary
+            doesn't have a streaming mode.
+
+        Raises
+        ------
+        ValueError
+            If the vocabulary doesn't exist.
+
+        """
+        VocabularyIndex(update)
+        if not name in VocabularyIndex.names():
+            raise ValueError(f"unknown vocabulary '{name}'")
+        stream = getattr(VocabularyIndex.parser(name), 'stream', None)
+        if stream is None:
+            return
+        params = {'name': name, 'url': None}
+        params.update(kwargs)
+        params.update(VocabularyIndex.params(name))
+        if chunk_size:
+            params['chunk_size'] = chunk_size
+        return stream(**params)
+
     @classmethod
     def load_and_dump(cls, name, update=False, permissive=False, **kwargs):
         """Load and dump data as JSON for the given vocabulary.
@@ -335,7 +408,7 @@ class VocabularyIndex:
         return res
 
     @classmethod
-    def load_and_dump_all(cls, update=False, permissive=False, **kwargs):
+    def load_and_dump_all(cls, update=False, permissive=False, jobs=1, **kwargs):
         """Load and dump data as JSON for all available vocabularies.
 
         Parameters
@@ -349,6 +422,10 @@ class VocabularyIndex:
             error at all).
             If ``True`` the vocabulary data is dumped as long
             as no critical error occurred.
+        jobs : int, default 1
+            Number of vocabularies fetched and parsed at the
+            same time, by a pool of processes. See
+            :py:func:`ckanext.ecospheres.vocabulary.pipeline.parse_vocabularies`.
         **kwargs : str
             Keyword parameters passed down to :py:func:`requests.get`,
             such as authentification info, proxy mapping, etc.
@@ -364,6 +441,14 @@ class VocabularyIndex:
         """
         VocabularyIndex(update)
         store = {}
+        if jobs > 1:
+            from ckanext.ecospheres.vocabulary.pipeline import parse_vocabularies
+            for name, result in parse_vocabularies(
+                list(VocabularyIndex.names()), jobs=jobs, dump=True,
+                update=update, permissive=permissive, **kwargs
+            ):
+                store[name] = result
+            return store
         for name in VocabularyIndex.names():
             store[name] = VocabularyIndex.load_and_dump(
                 name, update=update, permissive=permissive, **kwargs
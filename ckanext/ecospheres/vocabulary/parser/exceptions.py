@@ -88,6 +88,25 @@ class UnexpectedDataError(VocabularyParsingError):
 
     """
 
+class TrigSyntaxError(UnexpectedDataError):
+    """Critical error raised when some TriG data can't be read.
+    
+    Parameters
+    ----------
+    message : str
+        Short description of the error.
+    detail : str, optional
+        The data where the error was met.
+
+    Attributes
+    ----------
+    message : str
+        Description of the error.
+    detail : str
+        The data where the error was met.
+
+    """
+
 class NoVocabularyDataError(VocabularyParsingError):
     """Error to be logged by vocabulary parsers when no vocabulary data was found in the fetched content.
     
@@ -112,3 +131,34 @@ class NoVocabularyDataError(VocabularyParsingError):
             message = 'could not find any vocabulary data in fetched content'
         super().__init__(message=message, detail=detail)
 
+
+class OfflineCacheMissError(VocabularyParsingError):
+    """Error raised when some data is not in the HTTP cache while working offline.
+
+    See :py:class:`ckanext.ecospheres.vocabulary.parser.httpcache.HttpCache`.
+
+    Parameters
+    ----------
+    url : str
+        The requested URL.
+    message : str, optional
+        Short description of the error.
+    detail : str, optional
+        More informations about the error.
+
+    Attributes
+    ----------
+    url : str
+        The requested URL.
+    message : str
+        Description of the error.
+    detail : str
+        More informations about the error.
+
+    """
+
+    def __init__(self, url, message=None, detail=None):
+        self.url = url
+        if not message:
+            message = f'"{url}" is not in the HTTP cache (offline mode)'
+        super().__init__(message=message, detail=detail)
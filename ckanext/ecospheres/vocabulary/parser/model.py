@@ -1,5 +1,6 @@
 
-import json, sqlalchemy
+import functools, itertools, json, sqlalchemy
+from collections.abc import Mapping
 from pathlib import Path
 
 from ckanext import __path__ as ckanext_path
@@ -152,16 +153,96 @@ class ClusterReferenceConstraint(ClusterConstraint):
 class InvalidConstraintError(Exception):
     """Exception raised when trying to set up an invalid constraint."""
 
-class VocabularyDataRow(dict):
+class VocabularyDataRow(Mapping):
     """Row of a vocabulary data table.
     
-    A :py:class:`VocabularyDataRow` object is a dictionnary
+    A :py:class:`VocabularyDataRow` object is a mapping
     whose keys are the names of the table fields and the values
     the data to store in said fields.
 
+    This is an abstract class. Rows are built by
+    :py:meth:`VocabularyDataTable.build_row`, as instances
+    of a subclass specific to the table fields, that stores
+    the values in slots rather than in a dictionnary. Such
+    a row takes up less than a third of the memory of the
+    equivalent dictionnary.
+
+    The values of the fields may be modified, but fields
+    can't be added or removed. Use ``dict(row)`` to get an
+    actual dictionnary.
+
+    Attributes
+    ----------
+    fields : tuple(str)
+        Names of the fields.
+
     """
+    __slots__ = ()
+    fields = ()
+    _slots = {}
+
+    def __init__(self, *values):
+        # missing values are None, extra values are ignored
+        for slot, value in itertools.zip_longest(
+            self._slots.values(), values[:len(self.fields)]
+        ):
+            slot.__set__(self, value)
+
+    def __getitem__(self, field):
+        return self._slots[field].__get__(self)
+
+    def __setitem__(self, field, value):
+        self._slots[field].__set__(self, value)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __contains__(self, field):
+        return field in self._slots
+
+    def get(self, field, default=None):
+        if field in self._slots:
+            return self[field]
+        return default
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return tuple(self.values()) == tuple(other.values())
+        return dict(self) == other
 
-class DataValidationAnomaly(VocabularyDataRow):
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return _build_row, (self.fields, tuple(self.values()))
+
+@functools.lru_cache(maxsize=None)
+def _row_class(fields):
+    # slots can't be named after the fields, which may
+    # not be identifiers or conflict with Mapping methods
+    row_class = type(
+        'VocabularyDataRow', (VocabularyDataRow,),
+        {
+            '__slots__': tuple(f'_{i}' for i in range(len(fields))),
+            '__module__': __name__,
+            'fields': fields,
+        }
+    )
+    row_class._slots = {
+        field: getattr(row_class, f'_{i}')
+        for i, field in enumerate(fields)
+    }
+    return row_class
+
+def _build_row(fields, values):
+    return _row_class(fields)(*values)
+
+class DataValidationAnomaly(dict):
     """Anomaly detected during validation.
 
     The dictionnary is the invalid row itself.
@@ -221,6 +302,24 @@ class DataValidationResponse(list):
                 json.dumps(s, ensure_ascii=False, indent=4)
             )
 
+def _row_key(row, fields):
+    return tuple(row[f] for f in fields)
+
+def _build_index(rows, fields):
+    # None if some values are not hashable
+    try:
+        return {_row_key(row, fields) for row in rows}
+    except TypeError:
+        return None
+
+def _update_indexes(indexes, row):
+    for fields, index in indexes.items():
+        if index is not None:
+            try:
+                index.add(_row_key(row, fields))
+            except TypeError:
+                indexes[fields] = None
+
 class VocabularyDataTable(list):
     """Pseudo table with vocabulary data.
     
@@ -275,6 +374,14 @@ class VocabularyDataTable(list):
         The name of the PostgreSQL schema
         (namespace) to be used the table.
 
+    Notes
+    -----
+    Lookups by field values (:py:meth:`VocabularyDataTable.exists`,
+    and thus the validation of unique constraints) rely on hash
+    indexes of the rows' values, built on first use for each set
+    of fields, then maintained when rows are added. Rows should
+    not be modified once added to the table.
+
     """
 
     def __init__(
@@ -380,8 +487,9 @@ class VocabularyDataTable(list):
         Keywords parameters should use the fields' names
         or the function will return ``False``.
 
-        This method may be really slow on huge tables, since
-        there's no indexation.
+        Unless `start` or `stop` is provided, this
+        method uses a hash index of the values of the
+        fields, so it takes constant time.
 
         This method treats ``None`` as any other value.
 
@@ -418,21 +526,119 @@ class VocabularyDataTable(list):
         """
         if not self or not all(field in self.fields for field in row_part):
             return False
-        
-        if start is None:
-            start = 0
-        if stop is None:
-            stop = len(self)
-        table = self[start:stop]
 
+        if start is None and stop is None:
+            fields = tuple(sorted(row_part))
+            index = self._index(fields)
+            if index is not None:
+                try:
+                    return tuple(row_part[f] for f in fields) in index
+                except TypeError:
+                    # unhashable values
+                    pass
+        
         return any(
             all(
                 row_part[field] == row[field]
                 for field in row_part
             ) 
-            for row in table
+            for row in self[start:stop]
         )
 
+    def _index(self, fields):
+        """Return the hash index of the values of some fields.
+
+        Parameters
+        ----------
+        fields : tuple(str)
+            Names of the fields.
+
+        Returns
+        -------
+        set(tuple) or None
+            The tuples of the values of the fields in all rows
+            of the table, or ``None`` if some values are not
+            hashable.
+
+        """
+        indexes = self.__dict__.setdefault('_indexes', {})
+        if not fields in indexes:
+            indexes[fields] = _build_index(self, fields)
+        return indexes[fields]
+
+    def _update_indexes(self, rows):
+        indexes = self.__dict__.get('_indexes')
+        if indexes:
+            for row in rows:
+                _update_indexes(indexes, row)
+
+    def _clear_indexes(self):
+        self.__dict__.pop('_indexes', None)
+
+    def __getstate__(self):
+        # indexes are rebuilt when needed
+        state = dict(self.__dict__)
+        state.pop('_indexes', None)
+        return state
+
+    def append(self, row):
+        super().append(row)
+        self._update_indexes((row,))
+
+    def extend(self, rows):
+        rows = list(rows)
+        super().extend(rows)
+        self._update_indexes(rows)
+
+    def __iadd__(self, rows):
+        self.extend(rows)
+        return self
+
+    def insert(self, index, row):
+        super().insert(index, row)
+        self._update_indexes((row,))
+
+    def remove(self, row):
+        super().remove(row)
+        self._clear_indexes()
+
+    def pop(self, *args):
+        row = super().pop(*args)
+        self._clear_indexes()
+        return row
+
+    def clear(self):
+        super().clear()
+        self._clear_indexes()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._clear_indexes()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._clear_indexes()
+
+    def __imul__(self, value):
+        result = super().__imul__(value)
+        self._clear_indexes()
+        return result
+
+    def _discard(self, positions):
+        """Delete rows, in a single pass.
+
+        Parameters
+        ----------
+        positions : set(int)
+            Positions of the rows to delete.
+
+        """
+        if positions:
+            self[:] = [
+                row for idx, row in enumerate(self)
+                if not idx in positions
+            ]
+
     def validate(self, delete=True):
         """Validate the table data.
 
@@ -500,35 +706,48 @@ class VocabularyDataTable(list):
         if not self.constraints:
             return anomalies
 
-        for idx in range(len(self)):
-            row = self[idx]
+        # hash indexes of the values of the previous rows
+        # for each set of fields checked so far
+        previous = {}
+        invalid = set()
+
+        for idx, row in enumerate(self):
             for constraint in self.constraints:
                 if isinstance(constraint, TableNotNullConstraint):
                     if row[constraint] in (None, ''):
                         anomalies.append(
                             DataValidationAnomaly(row, self.name, constraint)
                         )
+                        invalid.add(idx)
                 if isinstance(constraint, TableUniqueConstraint):
-                    t = {
-                        f: row[f] for f in constraint
+                    fields = tuple(
+                        f for f in constraint
                         if constraint.none_as_value
                         or not row[f] is None
-                    }
-                    if self.exists(t, stop=idx):
+                    )
+                    if not fields in previous:
+                        previous[fields] = _build_index(
+                            itertools.islice(self, idx), fields
+                        )
+                    index = previous[fields]
+                    try:
+                        exists = _row_key(row, fields) in index
+                    except TypeError:
+                        # unhashable values, or no index
+                        exists = self.exists(
+                            {f: row[f] for f in fields}, stop=idx
+                        )
+                    if exists:
                         anomalies.append(
                             DataValidationAnomaly(row, self.name, constraint)
                         )
+                        invalid.add(idx)
+            _update_indexes(previous, row)
 
         if delete:
-            for anomalie in anomalies:
-                self.reverse()
-                if anomalie in self:
-                    # row might have been deleted already if more than
-                    # one anomaly
-                    self.remove(anomalie)
-                    # for completely duplicated lines, this will leave only
-                    # the last one of the reversed table
-                self.reverse()
+            # only the invalid rows themselves are deleted, for
+            # completely duplicated lines the first one is kept
+            self._discard(invalid)
 
         return anomalies
 
@@ -583,19 +802,14 @@ class VocabularyDataTable(list):
         VocabularyDataRow
 
         """
-        row = {f: None for f in self.fields}
-        if data:
-            data = list(data)
-            data.reverse()
-            for field in self.fields:
-                if not data:
-                    break
-                row[field] = data.pop()
+        row_class = _row_class(self.fields)
         if kwdata:
+            values = dict(zip(self.fields, data))
             for field, value in kwdata.items():
-                if field in row:
-                    row[field] = value
-        return row
+                if field in row_class._slots:
+                    values[field] = value
+            data = [values.get(field) for field in self.fields]
+        return row_class(*data)
 
     def add(self, *data, **kwdata):
         """Add some data to the table.
@@ -1317,7 +1531,10 @@ class VocabularyDataCluster(dict):
 
         if not self.constraints:
             return anomalies
-        
+
+        # positions of the invalid rows of each table
+        invalid = {}
+
         for constraint in self.constraints:
 
             if isinstance(constraint, ClusterReferenceConstraint):
@@ -1326,8 +1543,12 @@ class VocabularyDataCluster(dict):
                     constraint.referenced_fields[idx]: constraint.referencing_fields[idx]
                         for idx in range(len(constraint.referenced_fields))
                 }
+                referencing_table = constraint.referencing_table
+                table_invalid = invalid.setdefault(
+                    constraint.referenced_table.name, set()
+                )
 
-                for row in constraint.referenced_table:
+                for idx, row in enumerate(constraint.referenced_table):
                     row_part = {
                         fields_map[field]: value
                         for field, value in row.items()
@@ -1336,7 +1557,18 @@ class VocabularyDataCluster(dict):
                             or value is not None
                         )
                     }
-                    if row_part and not constraint.referencing_table.exists(row_part):
+                    if not row_part:
+                        continue
+                    # hash join against the values of the referencing
+                    # table, the index is built once for each set of fields
+                    fields = tuple(sorted(row_part))
+                    index = referencing_table._index(fields)
+                    try:
+                        exists = _row_key(row_part, fields) in index
+                    except TypeError:
+                        # unhashable values, or no index
+                        exists = referencing_table.exists(row_part)
+                    if not exists:
                         anomalies.append(
                             DataValidationAnomaly(
                                 row,
@@ -1344,13 +1576,11 @@ class VocabularyDataCluster(dict):
                                 constraint
                             )
                         )
+                        table_invalid.add(idx)
 
         if delete:
-            for anomalie in anomalies:
-                if anomalie in self[anomalie.table_name]:
-                    # row might have been deleted already if more than
-                    # one anomaly
-                    self[anomalie.table_name].remove(anomalie)
+            for table_name, positions in invalid.items():
+                self[table_name]._discard(positions)
 
         for table in self.values():
             anomalies += table.validate(delete=delete)
@@ -1553,5 +1783,5 @@ class VocabularyDataCluster(dict):
                 base_path.mkdir()
         path = base_path / f'{self.vocabulary}.json'
         with open(path, 'w', encoding='utf-8') as target:
-            json.dump(self, target, ensure_ascii=False, indent=4)
+            json.dump(self, target, ensure_ascii=False, indent=4, default=dict)
 
@@ -135,12 +135,14 @@ object:
 
 import re, json, zipfile
 from lxml import etree
-from rdflib import URIRef, Literal, Dataset, RDF
+from rdflib import URIRef, Literal, RDF
 from io import BytesIO
+from contextlib import nullcontext
 
-from ckanext.ecospheres.vocabulary.parser import utils, exceptions
+from ckanext.ecospheres.vocabulary.parser import utils, exceptions, trig
 from ckanext.ecospheres.vocabulary.parser.utils import VocabularyGraph
 from ckanext.ecospheres.vocabulary.parser.result import VocabularyParsingResult
+from ckanext.ecospheres.vocabulary.parser.stream import streaming_parser
 
 
 EPSG_NAMESPACES = {
@@ -148,11 +150,18 @@ EPSG_NAMESPACES = {
     'epsg': 'urn:x-ogp:spec:schema-xsd:EPSG:2.2:dataset'
 }
 
+EPSG_CACHE_MAX_AGE = 30 * 24 * 3600
+"""Delay, in seconds, before a cached EPSG CRS definition is revalidated."""
+
 IGN_NAMESPACES = {
     'xmlns': 'http://www.isotc211.org/2005/gmx',
     'gml': 'http://www.opengis.net/gml'
 }
 
+INSEE_GEO = 'http://rdf.insee.fr/def/geo#'
+
+INSEE_COG_GRAPH = 'http://rdf.insee.fr/graphes/geo/cog'
+
 IANA_NAMESPACES = {
     'xmlns': 'http://www.iana.org/assignments'
 }
@@ -161,7 +170,9 @@ def basic_rdf(
     name, url, format='xml', schemes=None, 
     languages=None, rdf_types=None, recursive=False,
     hierarchy=False, uri_property=None, regexp_property=None,
-    translation_scheme=None, _result=None, **kwargs
+    translation_scheme=None, crawl_workers=utils.CRAWL_WORKERS,
+    crawl_host_concurrency=utils.CRAWL_HOST_CONCURRENCY,
+    crawl_delay=utils.CRAWL_DELAY, _result=None, **kwargs
 ):
     """Build a vocabulary cluster from RDF data using simple SKOS vocabulary.
 
@@ -211,6 +222,16 @@ def basic_rdf(
         URI of a scheme from Ecospheres' register that might
         provide additionnal translations for the vocabulary
         labels.
+    crawl_workers : int, default 8
+        When `recursive` is ``True``, maximum number of
+        vocabulary URIs fetched at the same time.
+    crawl_host_concurrency : int, default 4
+        When `recursive` is ``True``, maximum number of
+        vocabulary URIs of the same host fetched at the
+        same time.
+    crawl_delay : float, default 0.1
+        When `recursive` is ``True``, minimum delay, in
+        seconds, between two requests sent to the same host.
     
     Returns
     -------
@@ -221,73 +242,99 @@ def basic_rdf(
     result = _result if _result is not None else VocabularyParsingResult(name)
     
     pile = [url]
-    uris = []
-    labels = []
-    relationships = []
-    regexp = []
+    # dictionaries are used as insertion-ordered sets,
+    # so that membership tests don't depend on the size
+    # of the vocabulary
+    uris = {}
+    labels = {}
+    relationships = {}
+    regexp = {}
     if uri_property:
         map_uris = {}
 
-    while pile:
-        uri = pile.pop()
-
-        try:
-            rdf_data = utils.fetch_data(uri, format='text', **kwargs)
-            graph = VocabularyGraph()
-            graph.parse(data=rdf_data, format=format)
-        except Exception as error:
-            if uri == url:
-                result.exit(error)
-                return result
-            result.log_error(error)
-            continue
+    # URIs are fetched in the background ahead of their
+    # turn, but handled in the same order as if they were
+    # fetched one at a time, so the first label found for
+    # an URI doesn't depend on the response times. Only the
+    # top of the pile is fetched ahead, the pages waiting
+    # to be handled would otherwise pile up in memory
+    workers = crawl_workers if recursive else 1
+    window = max(workers or 1, 1) * 4
+    submitted = set()
+    with utils.ConcurrentFetcher(
+        workers=workers,
+        host_concurrency=crawl_host_concurrency,
+        delay=crawl_delay, format='text', **kwargs
+    ) as fetcher:
+        while pile:
+            position = len(pile) - 1
+            while len(submitted) < window and position >= 0:
+                if not pile[position] in submitted:
+                    fetcher.submit(pile[position])
+                    submitted.add(pile[position])
+                position -= 1
+
+            uri = pile.pop()
+            submitted.discard(uri)
+
+            try:
+                rdf_data = fetcher.result(uri)
+                graph = VocabularyGraph()
+                graph.parse(data=rdf_data, format=format)
+                # the triples are walked once, then all
+                # queries are dictionary lookups
+                index = graph.index(properties=[uri_property, regexp_property])
+            except Exception as error:
+                if uri == url:
+                    result.exit(error)
+                    return result
+                result.log_error(error)
+                continue
         
-        new_uris = graph.find_vocabulary_items(
-            schemes=schemes, rdf_types=rdf_types
-        ) # uri should be one of those if it's a concept
+            new_uris = index.find_vocabulary_items(
+                schemes=schemes, rdf_types=rdf_types
+            ) # uri should be one of those if it's a concept
         
-        for new_uri in new_uris:
-            new_uri = str(new_uri)
-
-            if uri_property:
-                res_uri = graph.value(URIRef(new_uri), URIRef(uri_property))
-                if res_uri and (
-                    isinstance(res_uri, URIRef) or
-                    isinstance(res_uri, Literal) 
-                    and res_uri.datatype == URIRef('http://purl.org/dc/terms/URI')
-                ):
-                    map_uris[new_uri] = str(res_uri)
-
-            if not new_uri in uris:
-                uris.append(new_uri)
-                if recursive and not new_uri == url:
-                    pile.append(new_uri)
-                    # this means that if a label is
-                    # found from the current URI, any
-                    # label returned when the function will
-                    # interrogate the new URI will be seen as
-                    # an alternative label, even if a "better"
-                    # property is holding the label
-
-            new_labels = graph.find_labels(new_uri, languages=languages)
-            for new_label in new_labels:
-                label_row = (new_uri, new_label.language, str(new_label))
-                if not label_row in labels:
-                    labels.append(label_row)
-
-            if hierarchy:
-                children = graph.find_children(new_uri)
-                for child in children:
-                    child = str(child)
-                    if not (new_uri, child) in relationships:
-                        relationships.append((new_uri, child))
+            for new_uri in new_uris:
+                new_uri = str(new_uri)
+
+                if uri_property:
+                    res_uris = index.find_values(new_uri, uri_property)
+                    res_uri = res_uris[0] if res_uris else None
+                    if res_uri and (
+                        isinstance(res_uri, URIRef) or
+                        isinstance(res_uri, Literal) 
+                        and res_uri.datatype == URIRef('http://purl.org/dc/terms/URI')
+                    ):
+                        map_uris[new_uri] = str(res_uri)
+
+                if not new_uri in uris:
+                    uris[new_uri] = None
+                    if recursive and not new_uri == url:
+                        pile.append(new_uri)
+                        # this means that if a label is
+                        # found from the current URI, any
+                        # label returned when the function will
+                        # interrogate the new URI will be seen as
+                        # an alternative label, even if a "better"
+                        # property is holding the label
+
+                new_labels = index.find_labels(new_uri, languages=languages)
+                for new_label in new_labels:
+                    label_row = (new_uri, new_label.language, str(new_label))
+                    labels.setdefault(label_row)
+
+                if hierarchy:
+                    children = index.find_children(new_uri)
+                    for child in children:
+                        child = str(child)
+                        relationships.setdefault((new_uri, child))
             
-            if regexp_property:
-                new_regexp = graph.objects(URIRef(new_uri), URIRef(regexp_property))
-                for exp in new_regexp:
-                    exp = str(exp)
-                    if not (new_uri, exp) in regexp:
-                        regexp.append((new_uri, exp))
+                if regexp_property:
+                    new_regexp = index.find_values(new_uri, regexp_property)
+                    for exp in new_regexp:
+                        exp = str(exp)
+                        regexp.setdefault((new_uri, exp))
 
     if uri_property:
         new_labels = []
@@ -306,12 +353,17 @@ def basic_rdf(
         relationships = new_relationships
         uris = new_uris
 
+    # each label accounts for one occurrence of its URI,
+    # as URIs mapped with `uri_property` may be duplicated
+    labelled = {}
     for label in labels:
         result.add_label(*label)
-        if label[0] in uris:
-            uris.remove(label[0])
+        labelled[label[0]] = labelled.get(label[0], 0) + 1
 
     for uri in uris:
+        if labelled.get(uri):
+            labelled[uri] -= 1
+            continue
         result.log_error(
             exceptions.UnexpectedDataError(
                 'missing label', detail=uri
@@ -349,7 +401,9 @@ def basic_rdf(
             name=name, url=translation_scheme, format='json-ld',
             languages=languages, recursive=True,
             uri_property='http://www.w3.org/2004/02/skos/core#exactMatch',
-            _result=result, **kwargs
+            crawl_workers=crawl_workers,
+            crawl_host_concurrency=crawl_host_concurrency,
+            crawl_delay=crawl_delay, _result=result, **kwargs
         )
 
     return result
@@ -562,9 +616,18 @@ def iogp_epsg(name, url, **kwargs):
 
     return result
 
-def ogc_epsg(name, url, limit=None, **kwargs):
+def ogc_epsg(
+    name, url, limit=None, checkpoint=True, crawl_workers=utils.CRAWL_WORKERS,
+    crawl_host_concurrency=utils.CRAWL_HOST_CONCURRENCY,
+    crawl_delay=utils.CRAWL_DELAY, cache_max_age=EPSG_CACHE_MAX_AGE, **kwargs
+):
     """Build a vocabulary cluster from the OGC's EPSG coordinates reference systems register's data.
 
+    CRS definitions are fetched concurrently, but handled
+    in the order of the register. The data extracted from
+    each of them is stored in a checkpoint file, so that
+    an interrupted parsing resumes where it stopped.
+
     Parameters
     ----------
     vocabulary : str
@@ -576,9 +639,26 @@ def ogc_epsg(name, url, limit=None, **kwargs):
     limit : int, optional
         Maximum number of CRS whose data should be fetched
         (one query by CRS). If ``None``, all listed CRS
-        URIs are queried. In that case, execution takes
-        approximatively 2 hours, with around 7k HTTP requests
-        and parsing of each XML response.
+        URIs are queried, ie around 7k HTTP requests.
+    checkpoint : bool or str, default True
+        If ``True``, the progress of the parsing is stored
+        in the default checkpoint file of the vocabulary,
+        see :py:meth:`ckanext.ecospheres.vocabulary.parser.utils.Checkpoint.default_path`.
+        It may also be the path of the file to use. If
+        ``False``, there is no checkpoint.
+    crawl_workers : int, default 8
+        Maximum number of CRS definitions fetched
+        at the same time.
+    crawl_host_concurrency : int, default 4
+        Maximum number of CRS definitions of the same
+        host fetched at the same time.
+    crawl_delay : float, default 0.1
+        Minimum delay, in seconds, between two requests
+        sent to the same host.
+    cache_max_age : float, default 30 days
+        CRS definitions fetched less than `cache_max_age`
+        seconds ago are read from the HTTP cache without
+        even asking the server whether they changed.
 
     Returns
     -------
@@ -587,8 +667,6 @@ def ogc_epsg(name, url, limit=None, **kwargs):
     """
     result = VocabularyParsingResult(name)
 
-    runs = 0
-
     try:
         raw_data = utils.fetch_data(url, format='bytes', **kwargs)
         main_tree = etree.parse(BytesIO(raw_data))
@@ -597,68 +675,115 @@ def ogc_epsg(name, url, limit=None, **kwargs):
         result.exit(error)
         return result
 
-    for elem in main_root:
+    crs_urls = [elem.text for elem in main_root]
+    if limit:
+        crs_urls = crs_urls[:limit]
+
+    if checkpoint is True:
+        checkpoint = utils.Checkpoint.default_path(name)
+
+    with (
+        utils.Checkpoint(checkpoint, url) if checkpoint else nullcontext()
+    ) as progress:
+        # the fetcher runs a bit ahead of the loop, without
+        # holding thousands of pending responses in memory
+        window = max(crawl_workers or 1, 1) * 4
+
+        with utils.ConcurrentFetcher(
+            workers=crawl_workers, host_concurrency=crawl_host_concurrency,
+            delay=crawl_delay, format='bytes', max_age=cache_max_age, **kwargs
+        ) as fetcher:
+
+            pending = [
+                crs_url for crs_url in crs_urls
+                if progress is None or not crs_url in progress
+            ]
+            for crs_url in pending[:window]:
+                fetcher.submit(crs_url)
+            submitted = window
+
+            for crs_url in crs_urls:
+
+                crs_data = progress.get(crs_url) if progress else None
+
+                if crs_data is None:
+                    if submitted < len(pending):
+                        fetcher.submit(pending[submitted])
+                        submitted += 1
+                    try:
+                        raw_crs_data = fetcher.result(crs_url)
+                        crs_data = _epsg_crs_data(raw_crs_data)
+                    except Exception as error:
+                        result.log_error(error)
+                        continue
+                    if progress:
+                        progress.add(crs_url, crs_data)
 
-        runs += 1
-        if limit and runs > limit:
-            break
+                valid = True
 
-        crs_url = elem.text
+                label = crs_data['name']
+                if not label:
+                    result.log_error(
+                        exceptions.UnexpectedDataError('missing name', detail=crs_url),
+                    )
+                    valid = False
 
-        try:
-            raw_crs_data = utils.fetch_data(crs_url, format='bytes', **kwargs)
-            crs_tree = etree.parse(BytesIO(raw_crs_data))
-            crs_root = crs_tree.getroot()
-        except Exception as error:
-            result.log_error(error)
-            continue
-        
-        valid = True
+                identifier = crs_data['identifier']
+                if not identifier:
+                    result.log_error(
+                        exceptions.UnexpectedDataError('missing identifier', detail=crs_url),
+                    )
+                    valid = False
 
-        label = crs_root.xpath('gml:name/text()', namespaces=EPSG_NAMESPACES)
-        if not label:
-            result.log_error(
-                exceptions.UnexpectedDataError('missing name', detail=crs_url),
-            )
-            valid = False
+                code_space = crs_data['code_space'] or 'EPSG'
+                # since code space is always EPSG for now, it's assumed to be
+                # EPSG as well if missing in the future
 
-        identifier = crs_root.xpath('gml:identifier/text()', namespaces=EPSG_NAMESPACES)
-        if not identifier:
-            result.log_error(
-                exceptions.UnexpectedDataError('missing identifier', detail=crs_url),
-            )
-            valid = False
-        
-        code_space = crs_root.xpath('gml:identifier/@codeSpace',
-            namespaces=EPSG_NAMESPACES) or 'EPSG'
-        # since code space is always EPSG for now, it's assumed to be
-        # EPSG as well if missing in the future
+                if valid:
+                    result.add_label(
+                        uri=crs_url,
+                        label=f'{code_space} {identifier} : {label}'
+                    )
+                    # alternative labels: 'code:identifier', name
+                    # alone and identifier alone
+                    result.add_label(
+                        uri=crs_url,
+                        label=f'{code_space}:{identifier}'
+                    )
+                    result.add_label(
+                        uri=crs_url,
+                        label=f'{label}'
+                    )
+                    result.add_label(
+                        uri=crs_url,
+                        label=f'{identifier}'
+                    )
 
-        if valid:
-            result.add_label(
-                uri=crs_url,
-                label=f'{code_space[0]} {identifier[0]} : {label[0]}'
-            )
-            # alternative labels: 'code:identifier', name
-            # alone and identifier alone
-            result.add_label(
-                uri=crs_url,
-                label=f'{code_space[0]}:{identifier[0]}'
-            )
-            result.add_label(
-                uri=crs_url,
-                label=f'{label[0]}'
-            )
-            result.add_label(
-                uri=crs_url,
-                label=f'{identifier[0]}'
-            )
+        if progress:
+            progress.complete()
 
     if not result.data:
         result.exit(exceptions.NoVocabularyDataError())
 
     return result
 
+def _epsg_crs_data(raw_crs_data):
+    """Extract the name, identifier and code space from a CRS definition.
+
+    Missing values are ``None``.
+
+    """
+    crs_root = etree.parse(BytesIO(raw_crs_data)).getroot()
+    data = {}
+    for key, path in (
+        ('name', 'gml:name/text()'),
+        ('identifier', 'gml:identifier/text()'),
+        ('code_space', 'gml:identifier/@codeSpace')
+    ):
+        values = crs_root.xpath(path, namespaces=EPSG_NAMESPACES)
+        data[key] = str(values[0]) if values else None
+    return data
+
 def ecospheres_territory(name, url, **kwargs):
     """Build a vocabulary cluster with Ecospheres' territories.
 
@@ -781,11 +906,14 @@ def ecospheres_territory(name, url, **kwargs):
     return result
 
 
-def insee_official_geographic_code(name, url, rdf_types=None, **kwargs):
+@streaming_parser
+def insee_official_geographic_code(result, name, url, rdf_types=None, **kwargs):
     """Build a vocabulary cluster with Insee's official geographic code data.
 
-    This vocabulary is HUGE, loading it takes a lot
-    of time (around 1h45).
+    This vocabulary is HUGE. The TriG data is read as
+    a stream (see :py:mod:`ckanext.ecospheres.vocabulary.parser.trig`),
+    and only the values of the needed properties are kept,
+    so loading it takes a few minutes.
 
     The cluster build by this parser contains an additional
     ``[name]_hierarchy (parent, child)`` table where a child
@@ -797,6 +925,9 @@ def insee_official_geographic_code(name, url, rdf_types=None, **kwargs):
     labels table. Only one of them will carry the alternative
     labels and hierarchy information.
 
+    This is a streaming parser (see
+    :py:mod:`ckanext.ecospheres.vocabulary.parser.stream`).
+
     Parameters
     ----------
     name : str
@@ -813,10 +944,14 @@ def insee_official_geographic_code(name, url, rdf_types=None, **kwargs):
 
     Returns
     -------
-    VocabularyParsingResult
+    VocabularyStreamingResult
 
     Notes
     -----
+    Items are considered in the order of the file. When
+    `rdf_types` is provided, an item is kept if any of its
+    classes is listed.
+
     Terrorial entities will be registered more than once 
     if they have multiple URIs (usually one with an UUID
     and one with a geographic code). Labels for all available
@@ -824,81 +959,109 @@ def insee_official_geographic_code(name, url, rdf_types=None, **kwargs):
     are carried by the UUID-based URI.
 
     """
-    result = VocabularyParsingResult(name)
+    nom = f'{INSEE_GEO}nom'
+    rdf_type = str(RDF.type)
+    properties = {
+        f'{INSEE_GEO}{key}': key for key in (
+            'nomSansArticle', 'nomEntier', 'codeINSEE', 'subdivisionDirecteDe'
+        )
+    }
+    properties['http://www.w3.org/2002/07/owl#sameAs'] = 'sameAs'
+    # only the needed values are kept, in plain
+    # dictionaries, while the quads are read
+    names = []
+    typed = set()
+    values = {key: {} for key in properties.values()}
+    rdf_types = set(rdf_types or ())
 
     try:
         content = utils.fetch_data(url, format='bytes', **kwargs)
         zip_data = zipfile.ZipFile(BytesIO(content))
-        dataset = Dataset()
         with zip_data.open(zip_data.namelist()[0]) as src:
             # assuming there is only one file in the archive
-            dataset.parse(file=src, format='trig')
-        graph = dataset.graph('http://rdf.insee.fr/graphes/geo/cog')
+            for s, p, o, g in trig.iter_quads(
+                src, graphs=[INSEE_COG_GRAPH],
+                predicates=[nom, rdf_type, *properties]
+            ):
+                if p == nom:
+                    names.append((s, _trig_value(o)))
+                elif p == rdf_type:
+                    if o in rdf_types:
+                        typed.add(s)
+                else:
+                    values[properties[p]].setdefault(s, []).append(
+                        _trig_value(o)
+                    )
     except Exception as error:
         result.exit(error)
-        return result
+        return
+    del content, zip_data
 
     result.data.hierarchy_table()
     result.data.synonym_table()
 
-    relationships = []
-    uris = []
-
-    for uuid, label in graph.subject_objects(URIRef('http://rdf.insee.fr/def/geo#nom')):
-        if not rdf_types or str(graph.value(uuid, RDF.type)) in rdf_types:
-            result.add_label(str(uuid), language='fr', label=str(label))
-            uris.append(uuid)
-
-    for item in result.data.label:
-        uri = item['uri']
-        label = item['label']
-
-        for altlabel in graph.objects(
-            URIRef(uri), URIRef('http://rdf.insee.fr/def/geo#nomSansArticle')
-        ):
-            if str(altlabel) != label:
-                result.add_label(uri, language='fr', label=str(altlabel))
-
-        for altlabel in graph.objects(
-            URIRef(uri), URIRef('http://rdf.insee.fr/def/geo#nomEntier')
-        ):
-            if str(altlabel) != label:
-                result.add_label(uri, language='fr', label=str(altlabel))
+    # items whose properties should be explored, in the
+    # order of their registration in the labels' table
+    items = []
+    uris = set()
+    relationships = {}
+
+    for uuid, label in names:
+        if not rdf_types or uuid in typed:
+            if result.add_label(
+                uuid, language='fr', label=label
+            ) and not uuid in uris:
+                items.append((uuid, label))
+            uris.add(uuid)
+        yield from result.chunks()
+    del names, typed
+
+    i = 0
+    while i < len(items):
+        uri, label = items[i]
+        i += 1
+
+        for altlabel in values['nomSansArticle'].get(uri, ()):
+            if altlabel != label:
+                result.add_label(uri, language='fr', label=altlabel)
+
+        for altlabel in values['nomEntier'].get(uri, ()):
+            if altlabel != label:
+                result.add_label(uri, language='fr', label=altlabel)
         
-        for insee_code in graph.objects(
-            URIRef(uri), URIRef('http://rdf.insee.fr/def/geo#codeINSEE')
-        ):
-            result.add_label(uri, language='fr', label=str(insee_code))
-
-        for parent in graph.objects(
-                URIRef(uri), URIRef('http://rdf.insee.fr/def/geo#subdivisionDirecteDe')
-        ):
-            if parent in uris and not (str(parent), uri) in relationships:
-                relationships.append((str(parent), uri))
-
-        for code_uri in graph.objects(
-            URIRef(uri), URIRef('http://www.w3.org/2002/07/owl#sameAs')
-        ):
-            if not code_uri in uris:
-                result.add_label(str(code_uri), language='fr', label=label)
-                uris.append(code_uri)
-                result.data.synonym.add(str(code_uri), uri)
-                result.data.synonym.add(uri, str(code_uri))
-
-    for relationship in relationships:
-        result.data.hierarchy.add(*relationship)
-
-    # skipping validation as it's already quite long
-    # response = result.data.validate()
-    # if not response:
-    #     for anomaly in response:
-    #         result.log_error(exceptions.InvalidDataError(anomaly))
-
-    if not result.data:
-        result.exit(exceptions.NoVocabularyDataError())
+        for insee_code in values['codeINSEE'].get(uri, ()):
+            result.add_label(uri, language='fr', label=insee_code)
 
-    return result
+        for parent in values['subdivisionDirecteDe'].get(uri, ()):
+            relationships[(parent, uri)] = None
 
+        for code_uri in values['sameAs'].get(uri, ()):
+            if not code_uri in uris:
+                result.add_label(code_uri, language='fr', label=label)
+                items.append((code_uri, label))
+                uris.add(code_uri)
+                result.add_row('synonym', code_uri, uri)
+                result.add_row('synonym', uri, code_uri)
+
+        yield from result.chunks()
+
+    # parents are only known once all items have been registered
+    for parent, child in relationships:
+        if parent in uris:
+            result.add_row('hierarchy', parent, child)
+    yield from result.chunks(flush=True)
+
+    # in streaming mode, the rows have already been emitted
+    # and the tables are empty
+    response = result.data.validate()
+    if not response:
+        for anomaly in response:
+            result.log_error(exceptions.InvalidDataError(anomaly))
+
+
+def _trig_value(term):
+    # literals' lexical form, or IRI
+    return term.value if isinstance(term, trig.Literal) else term
 
 def ign_crs(name, url, **kwargs):
     """Build a vocabulary cluster from IGN's coordinates reference systems register.
@@ -54,6 +54,9 @@ class VocabularyParsingResult:
     ----------
     vocabulary : str
         Name of the vocabulary.
+    duration : float or None
+        Duration of the parsing, in seconds, when
+        it was measured.
 
     """
     def __init__(self, vocabulary):
@@ -61,6 +64,7 @@ class VocabularyParsingResult:
         self._log = []
         self._data = VocabularyDataCluster(vocabulary)
         self.vocabulary = vocabulary
+        self.duration = None
 
     def exit(self, error=None):
         """Declare a critical parsing failure.
@@ -0,0 +1,224 @@
+"""Streaming vocabulary parsers.
+
+Parsers for very large vocabularies may emit their rows by
+chunks, so the loader can store them while the parsing goes on
+and the whole vocabulary is never held in memory.
+
+Such a parser is a generator function decorated with
+:py:func:`streaming_parser`. Its first argument is a
+:py:class:`VocabularyStreamingResult` object, the other ones are
+the same as for any parser. Rows are added with the
+:py:meth:`VocabularyStreamingResult.add_row` and
+:py:meth:`VocabularyStreamingResult.add_label` methods, and
+the chunks of rows that are ready are yielded regularly:
+
+    >>> @streaming_parser
+    ... def some_parser(result, name, url, **kwargs):
+    ...     for uri, label in fetch_items(url):
+    ...         result.add_label(uri, language='fr', label=label)
+    ...         yield from result.chunks()
+    ...     yield from result.chunks(flush=True)
+
+Critical failures are declared as usual with
+:py:meth:`VocabularyParsingResult.exit`, then the generator
+should return.
+
+The decorated function is a regular parser, that returns
+a :py:class:`VocabularyStreamingResult` holding all the data.
+Its ``stream`` attribute gives access to the streaming mode:
+
+    >>> result, chunks = some_parser.stream('somevoc', url, chunk_size=10000)
+    >>> for table, rows in chunks:
+    ...     pass
+
+Once the chunks have been consumed, the tables of the
+cluster are empty, but the result still holds the errors
+log and the number of rows of each table
+(:py:attr:`VocabularyStreamingResult.rows`).
+
+"""
+
+import functools
+from collections import Counter
+
+from ckanext.ecospheres.vocabulary.parser import exceptions
+from ckanext.ecospheres.vocabulary.parser.model import (
+    DataValidationAnomaly, TableNotNullConstraint
+)
+from ckanext.ecospheres.vocabulary.parser.result import VocabularyParsingResult
+
+CHUNK_SIZE = 10000
+"""Default number of rows of the chunks emitted by streaming parsers."""
+
+class VocabularyStreamingResult(VocabularyParsingResult):
+    """Parsing result whose tables are emitted by chunks.
+
+    Parameters
+    ----------
+    vocabulary : str
+        Name of the vocabulary, ie its ``name``
+        property in ``vocabularies.yaml``.
+    chunk_size : int, optional
+        Number of rows of a table above which they
+        are emitted. If ``None``, rows are only emitted
+        when explicitly flushed.
+
+    Attributes
+    ----------
+    vocabulary : str
+        Name of the vocabulary.
+    chunk_size : int or None
+        Number of rows of the chunks.
+    rows : collections.Counter
+        Number of rows added to each table,
+        including the rows already emitted.
+
+    """
+
+    def __init__(self, vocabulary, chunk_size=CHUNK_SIZE):
+        super().__init__(vocabulary)
+        self.chunk_size = chunk_size
+        self.rows = Counter()
+        self._chunks = []
+        self._label_languages = {}
+
+    def add_row(self, table_name, *data, **kwdata):
+        """Add a row to a table of the cluster.
+
+        Contrary to :py:meth:`VocabularyDataTable.add`,
+        rows are not validated against the table constraints.
+
+        Parameters
+        ----------
+        table_name : str
+            Name of the table. The vocabulary name
+            prefix may be omitted.
+        *data, **kwdata
+            See :py:meth:`VocabularyDataTable.add`.
+
+        Returns
+        -------
+        VocabularyDataRow
+
+        """
+        if not table_name in self._data:
+            table_name = f'{self.vocabulary}_{table_name}'
+        table = self._data[table_name]
+        row = table.build_row(*data, **kwdata)
+        self._append(table, row)
+        return row
+
+    def _append(self, table, row):
+        table.append(row)
+        self.rows[table.name] += 1
+        if self.chunk_size and len(table) >= self.chunk_size:
+            self._chunks.append((table, list(table)))
+            table.clear()
+
+    def add_label(self, *data, **kwdata):
+        """Declare a label.
+
+        Labels are stored in the labels' table or the
+        alternative labels' table with the same rules
+        as :py:meth:`VocabularyDataCluster.add_label`,
+        but the decision doesn't depend on the rows that
+        are still in the table, so emitting chunks doesn't
+        change anything.
+
+        Returns
+        -------
+        bool
+            ``False`` if the label was not registered because
+            the URI or the label was missing.
+
+        """
+        row = self._data.label.build_row(*data, **kwdata)
+        for field in ('uri', 'label'):
+            if row.get(field) in (None, ''):
+                self.log_error(
+                    exceptions.InvalidDataError(
+                        DataValidationAnomaly(
+                            row, self._data.label.name,
+                            TableNotNullConstraint(field)
+                        )
+                    )
+                )
+                return False
+        languages = self._label_languages.setdefault(row['uri'], set())
+        # as with the unique constraint of the labels' table,
+        # a label without language conflicts with any label
+        if languages and (
+            row['language'] is None or row['language'] in languages
+        ):
+            # labels and alternative labels have the same fields
+            self._append(self._data.altlabel, row)
+        else:
+            languages.add(row['language'])
+            self._append(self._data.label, row)
+        return True
+
+    def chunks(self, flush=False):
+        """Yield the chunks of rows that are ready.
+
+        Parameters
+        ----------
+        flush : bool, default False
+            If ``True``, all rows not emitted yet are
+            yielded, whatever the chunk size. This should
+            be used at the end of the parsing.
+
+        Yields
+        ------
+        tuple(VocabularyDataTable, list(VocabularyDataRow))
+            A table and some of its rows.
+
+        """
+        if flush and self.chunk_size:
+            for table in self._data.values():
+                if table:
+                    self._chunks.append((table, list(table)))
+                    table.clear()
+        while self._chunks:
+            yield self._chunks.pop(0)
+
+def streaming_parser(chunks):
+    """Build a vocabulary parser from a streaming parser.
+
+    Parameters
+    ----------
+    chunks : function
+        Generator function taking a :py:class:`VocabularyStreamingResult`
+        object and the parser arguments, and yielding chunks of
+        rows.
+
+    Returns
+    -------
+    function
+        A parser, whose ``stream`` attribute is a function taking
+        the parser arguments plus a `chunk_size` keyword argument,
+        and returning the parsing result and the generator of chunks.
+
+    """
+
+    @functools.wraps(chunks)
+    def parser(name, url, **kwargs):
+        result = VocabularyStreamingResult(name, chunk_size=None)
+        for _ in chunks(result, name, url, **kwargs):
+            pass
+        if not result._exit and not result.rows:
+            result.exit(exceptions.NoVocabularyDataError())
+        return result
+
+    def stream(name, url, chunk_size=CHUNK_SIZE, **kwargs):
+        result = VocabularyStreamingResult(name, chunk_size=chunk_size)
+
+        def generate():
+            yield from chunks(result, name, url, **kwargs)
+            yield from result.chunks(flush=True)
+            if not result._exit and not result.rows:
+                result.exit(exceptions.NoVocabularyDataError())
+
+        return result, generate()
+
+    parser.stream = stream
+    return parser
@@ -0,0 +1,405 @@
+"""Streaming reader for TriG-encoded RDF data.
+
+rdflib can only parse TriG data into a :py:class:`rdflib.Dataset`,
+which holds every quad of the file in memory along with several
+indexes. For registers weighing hundreds of megabytes, where only
+a few properties are needed, :py:func:`iter_quads` reads the data
+incrementally and yields the quads one by one, so the caller can
+keep what it needs in plain dictionaries.
+
+Terms are plain Python objects:
+
+* IRIs are :py:class:`str`, resolved against the base IRI,
+  with prefixed names expanded.
+* Blank nodes are :py:class:`str` starting with ``'_:'``.
+* Literals are :py:class:`Literal` named tuples.
+
+Examples
+--------
+>>> with open('cog.trig', 'rb') as src:
+...     for s, p, o, g in iter_quads(
+...         src, graphs=['http://rdf.insee.fr/graphes/geo/cog'],
+...         predicates=['http://rdf.insee.fr/def/geo#nom']
+...     ):
+...         print(s, o.value)
+
+"""
+
+import io
+import re
+import sys
+from collections import namedtuple
+from urllib.parse import urljoin
+
+from ckanext.ecospheres.vocabulary.parser.exceptions import TrigSyntaxError
+
+RDF_NS = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+XSD_NS = 'http://www.w3.org/2001/XMLSchema#'
+
+READ_SIZE = 1 << 20
+"""Number of characters read from the source at once."""
+
+READ_MARGIN = 1024
+"""Number of characters that should follow a token in the buffer.
+
+Unless the end of the data was reached, tokens that end
+closer to the end of the buffer may continue beyond it, so
+more data is read before they are considered.
+
+"""
+
+Literal = namedtuple('Literal', ('value', 'language', 'datatype'))
+Literal.__doc__ = """RDF literal.
+
+Attributes
+----------
+value : str
+    Lexical form of the literal.
+language : str or None
+    Language tag.
+datatype : str or None
+    IRI of the datatype.
+
+"""
+
+# whitespaces and comments are skipped before each
+# token. There is only one way to match them (one
+# whitespace at a time, comments up to the end of the
+# line), else a token that doesn't match would make
+# the regular expression backtrack exponentially
+_TOKENS = re.compile(
+    r'(?:\s|#[^\r\n]*(?![^\r\n]))*(?:'
+    r'<(?P<iri>[^<>"{}|^`\x00-\x20]*)>'
+    r'|"""(?P<long2>(?:[^"\\]|\\.|"(?!""))*)"""'
+    r"|'''(?P<long1>(?:[^'\\]|\\.|'(?!''))*)'''"
+    r'|"(?P<string2>(?:[^"\\\r\n]|\\.)*)"'
+    r"|'(?P<string1>(?:[^'\\\r\n]|\\.)*)'"
+    r'|@(?P<langtag>[A-Za-z]+(?:-[A-Za-z0-9]+)*)'
+    r'|(?P<datatype>\^\^)'
+    r'|_:(?P<bnode>[\w\-.]*[\w\-])'
+    r'|(?P<double>[+-]?(?:\d+\.\d*[eE][+-]?\d+|\.\d+[eE][+-]?\d+|\d+[eE][+-]?\d+))'
+    r'|(?P<decimal>[+-]?\d*\.\d+)'
+    r'|(?P<integer>[+-]?\d+)'
+    r'|(?P<pname>(?:[^\W\d][\w\-.]*)?:(?:(?:[\w\-:%]|\\.)(?:(?:[\w\-:%.]|\\.)*(?:[\w\-:%]|\\.))?)?)'
+    r'|(?P<keyword>[A-Za-z]+)'
+    r'|(?P<punct>\[\s*\]|[{}()\[\].;,])'
+    r'|(?P<end>\Z))'
+)
+
+_ESCAPES = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))', re.S)
+
+_ECHARS = {
+    't': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f',
+    '"': '"', "'": "'", '\\': '\\'
+}
+
+def _unescape_char(match):
+    code = match.group(1) or match.group(2)
+    if code:
+        return chr(int(code, 16))
+    char = match.group(3)
+    return _ECHARS.get(char, char)
+
+def _unescape(value):
+    if '\\' in value:
+        return _ESCAPES.sub(_unescape_char, value)
+    return value
+
+def _tokens(src):
+    """Yield the ``(kind, value)`` tokens of a text stream."""
+    buffer = ''
+    position = 0
+    eof = False
+    finditer = _TOKENS.finditer
+    while True:
+        data = src.read(READ_SIZE)
+        buffer = buffer[position:] + data
+        position = 0
+        eof = not data
+        # unless the end of the data was reached, tokens
+        # ending in the last characters of the buffer are
+        # left for later, as they may continue beyond it
+        limit = len(buffer) if eof else len(buffer) - READ_MARGIN
+        for m in finditer(buffer, position):
+            if m.start() != position:
+                break
+            end = m.end()
+            if end > limit:
+                break
+            kind = m.lastgroup
+            value = m.group(kind)
+            if kind == 'end':
+                return
+            if kind == 'punct':
+                if len(value) > 1:
+                    value = '[]'
+            elif not value and not eof and kind in ('string2', 'string1') \
+                and buffer.startswith(('"""', "\'\'\'"), m.start(kind) - 1):
+                # beginning of a long string
+                break
+            position = end
+            yield kind, value
+        if eof:
+            raise TrigSyntaxError(
+                'unexpected character',
+                detail=buffer[position:position + 50].strip()
+            )
+
+class _Reader:
+
+    def __init__(self, src, graphs=None, predicates=None):
+        self.tokens = _tokens(src)
+        self.graphs = set(graphs) if graphs is not None else None
+        self.predicates = set(predicates) if predicates is not None else None
+        self.prefixes = {}
+        self.base = None
+        self.bnodes = 0
+        self.graph = None
+        self.token = None
+        self.quads = []
+        self.next()
+
+    def next(self):
+        token = self.token
+        self.token = next(self.tokens, (None, None))
+        return token
+
+    def error(self, message):
+        kind, value = self.token
+        return TrigSyntaxError(
+            message, detail=f'{kind} {value!r}' if kind else 'end of data'
+        )
+
+    def expect(self, punct):
+        if self.token != ('punct', punct):
+            raise self.error(f'"{punct}" expected')
+        self.next()
+
+    def emit(self, s, p, o):
+        if (self.graphs is None or self.graph in self.graphs) and (
+            self.predicates is None or p in self.predicates
+        ):
+            self.quads.append((s, p, o, self.graph))
+
+    def new_bnode(self):
+        self.bnodes += 1
+        return f'_:b{self.bnodes}'
+
+    def iri(self, value):
+        value = _unescape(value)
+        if self.base and not ':' in value:
+            value = urljoin(self.base, value)
+        return sys.intern(value)
+
+    def pname(self, value):
+        prefix, local = value.split(':', 1)
+        if not prefix in self.prefixes:
+            raise self.error(f'unknown prefix "{prefix}"')
+        if '\\' in local:
+            local = re.sub(r'\\(.)', r'\1', local)
+        return sys.intern(self.prefixes[prefix] + local)
+
+    def read(self):
+        """Read one directive or block, yield after each statement.
+
+        Graph blocks are yielded from statement by statement,
+        so that their quads don't pile up until the end of
+        the block.
+
+        """
+        kind, value = self.token
+        if kind == 'langtag' and value in ('prefix', 'base'):
+            self.next()
+            self.directive(value)
+            self.expect('.')
+        elif kind == 'keyword' and value.lower() in ('prefix', 'base'):
+            self.next()
+            self.directive(value.lower())
+        elif kind == 'keyword' and value.lower() == 'graph':
+            self.next()
+            yield from self.wrapped_graph(self.label())
+        elif self.token == ('punct', '{'):
+            yield from self.wrapped_graph(None)
+        elif kind in ('iri', 'pname', 'bnode') or self.token == ('punct', '[]'):
+            label = self.label()
+            if self.token == ('punct', '{'):
+                yield from self.wrapped_graph(label)
+            else:
+                self.predicate_object_list(label)
+                self.expect('.')
+                yield
+        else:
+            self.triples()
+            self.expect('.')
+            yield
+
+    def directive(self, name):
+        if name == 'prefix':
+            kind, value = self.next()
+            if kind != 'pname' or not value.endswith(':'):
+                raise self.error('prefix name expected')
+            iri_kind, iri = self.next()
+            if iri_kind != 'iri':
+                raise self.error('IRI expected')
+            self.prefixes[value[:-1]] = self.iri(iri)
+        else:
+            kind, value = self.next()
+            if kind != 'iri':
+                raise self.error('IRI expected')
+            self.base = self.iri(value)
+
+    def label(self):
+        kind, value = self.next()
+        if kind == 'iri':
+            return self.iri(value)
+        if kind == 'pname':
+            return self.pname(value)
+        if kind == 'bnode':
+            return f'_:{value}'
+        if (kind, value) == ('punct', '[]'):
+            return self.new_bnode()
+        raise self.error('graph name or subject expected')
+
+    def wrapped_graph(self, name):
+        self.expect('{')
+        previous, self.graph = self.graph, name
+        while self.token != ('punct', '}'):
+            self.triples()
+            yield
+            if self.token == ('punct', '.'):
+                self.next()
+            elif self.token != ('punct', '}'):
+                raise self.error('"." or "}" expected')
+        self.next()
+        self.graph = previous
+
+    def triples(self):
+        if self.token == ('punct', '['):
+            subject = self.blank_node_property_list()
+            if self.token[0] is not None and not self.token in (
+                ('punct', '.'), ('punct', '}')
+            ):
+                self.predicate_object_list(subject)
+        else:
+            self.predicate_object_list(self.subject())
+
+    def subject(self):
+        if self.token == ('punct', '('):
+            return self.collection()
+        return self.label()
+
+    def predicate_object_list(self, subject):
+        while True:
+            predicate = self.verb()
+            while True:
+                self.emit(subject, predicate, self.object())
+                if self.token != ('punct', ','):
+                    break
+                self.next()
+            if self.token != ('punct', ';'):
+                return
+            while self.token == ('punct', ';'):
+                self.next()
+            if self.token in (('punct', '.'), ('punct', ']'), ('punct', '}')):
+                return
+
+    def verb(self):
+        kind, value = self.next()
+        if kind == 'iri':
+            return self.iri(value)
+        if kind == 'pname':
+            return self.pname(value)
+        if (kind, value) == ('keyword', 'a'):
+            return RDF_NS + 'type'
+        raise self.error('predicate expected')
+
+    def object(self):
+        kind, value = self.token
+        if kind in ('string2', 'string1', 'long2', 'long1'):
+            self.next()
+            value = _unescape(value)
+            kind, tag = self.token
+            if kind == 'langtag':
+                self.next()
+                return Literal(value, tag.lower(), None)
+            if kind == 'datatype':
+                self.next()
+                return Literal(value, None, self.label())
+            return Literal(value, None, None)
+        if kind in ('integer', 'decimal', 'double'):
+            self.next()
+            return Literal(value, None, XSD_NS + kind)
+        if kind == 'keyword' and value in ('true', 'false'):
+            self.next()
+            return Literal(value, None, XSD_NS + 'boolean')
+        if self.token == ('punct', '['):
+            return self.blank_node_property_list()
+        if self.token == ('punct', '('):
+            return self.collection()
+        return self.label()
+
+    def blank_node_property_list(self):
+        self.expect('[')
+        node = self.new_bnode()
+        self.predicate_object_list(node)
+        self.expect(']')
+        return node
+
+    def collection(self):
+        self.expect('(')
+        head = node = RDF_NS + 'nil'
+        while self.token != ('punct', ')'):
+            if self.token[0] is None:
+                raise self.error('")" expected')
+            item = self.object()
+            new_node = self.new_bnode()
+            if node == RDF_NS + 'nil':
+                head = new_node
+            else:
+                self.emit(node, RDF_NS + 'rest', new_node)
+            self.emit(new_node, RDF_NS + 'first', item)
+            node = new_node
+        self.next()
+        if node != RDF_NS + 'nil':
+            self.emit(node, RDF_NS + 'rest', RDF_NS + 'nil')
+        return head
+
+def iter_quads(src, graphs=None, predicates=None, encoding='utf-8'):
+    """Read TriG data and yield its quads.
+
+    Parameters
+    ----------
+    src : file-like object
+        Binary or text stream holding TriG (or Turtle) data.
+    graphs : list(str or None), optional
+        IRIs of the graphs whose quads should be yielded.
+        ``None`` stands for the default graph. If not
+        provided, the quads of all graphs are yielded.
+    predicates : list(str), optional
+        IRIs of the predicates whose quads should be yielded.
+        If not provided, all quads are yielded.
+    encoding : str, default 'utf-8'
+        Encoding of binary streams.
+
+    Yields
+    ------
+    tuple(str, str, str or Literal, str or None)
+        Subject, predicate, object and graph name of
+        a quad. The graph name is ``None`` for the
+        default graph.
+
+    Raises
+    ------
+    TrigSyntaxError
+        If the data is not valid TriG. Quads read before
+        the error was met are yielded nonetheless.
+
+    """
+    if not isinstance(src, io.TextIOBase):
+        src = io.TextIOWrapper(src, encoding=encoding)
+    reader = _Reader(src, graphs=graphs, predicates=predicates)
+    while reader.token[0] is not None:
+        for _ in reader.read():
+            if reader.quads:
+                yield from reader.quads
+                reader.quads.clear()
@@ -1,11 +1,28 @@
 """Utilitary functions for vocabulary parsing."""
 
-import requests
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, checkpoints are not locked
+    fcntl = None
+
 from rdflib import (
     Graph, URIRef, Literal, SKOS, RDF, RDFS,
     DCTERMS as DCT, FOAF
 )
 
+from ckanext.ecospheres.vocabulary.parser.httpcache import HttpCache
+
+logger = logging.getLogger(__name__)
+
 LABELS_ARE_VALUES_OF = [
     SKOS.prefLabel, DCT.title, RDFS.label, FOAF.name,
     SKOS.altLabel, DCT.identifier, SKOS.notation,
@@ -41,9 +58,32 @@ object of a triple whose predicate is one of these properties.
 
 """
 
-def fetch_data(url, format='json', **kwargs):
+REQUEST_KWARGS = (
+    'params', 'data', 'json', 'headers', 'cookies',
+    'files', 'auth', 'timeout', 'allow_redirects',
+    'proxies', 'verify', 'stream', 'cert'
+)
+"""Keyword parameters of :py:func:`requests.get`."""
+
+CRAWL_WORKERS = 8
+"""Default number of URLs fetched at the same time by a :py:class:`ConcurrentFetcher`."""
+
+CRAWL_HOST_CONCURRENCY = 4
+"""Default number of URLs of the same host fetched at the same time by a :py:class:`ConcurrentFetcher`."""
+
+CRAWL_DELAY = 0.1
+"""Default minimum delay, in seconds, between two requests sent to the same host by a :py:class:`ConcurrentFetcher`."""
+
+CHECKPOINT_MAX_AGE = 7 * 24 * 3600
+"""Default delay, in seconds, after which a :py:class:`Checkpoint` is considered stale."""
+
+def fetch_data(url, format='json', max_age=None, **kwargs):
     """Uses the requests module to get some data.
 
+    Requests go through the on-disk HTTP cache, with
+    retries and timeouts, see
+    :py:class:`ckanext.ecospheres.vocabulary.parser.httpcache.HttpCache`.
+
     This function will raise any possible HTTP error,
     JSON parsing error, etc. so the vocabulary parser can
     either:
@@ -78,6 +118,10 @@ def fetch_data(url, format='json', **kwargs):
         The URL to request to.
     format : {'json', 'text', 'bytes'}, optional
         The expected format for the result.
+    max_age : float, optional
+        If provided, data that was stored in the HTTP
+        cache less than `max_age` seconds ago is used
+        without sending any request.
     **kwargs
         Any nammed parameter to pass to the
         :py:func:`requests.get` function.
@@ -89,16 +133,7 @@ def fetch_data(url, format='json', **kwargs):
         `format` parameter.
 
     """
-    clean_kwargs = {
-        key: value for key, value in kwargs.items()
-        if key in (
-            'params', 'data', 'json', 'headers', 'cookies',
-            'files', 'auth', 'timeout', 'allow_redirects',
-            'proxies', 'verify', 'stream', 'cert'
-        )
-    }
-
-    response = requests.get(url, **clean_kwargs)
+    response = HttpCache.get(url, max_age=max_age, **request_kwargs(**kwargs))
     response.raise_for_status()
 
     if format == 'text':
@@ -109,8 +144,495 @@ def fetch_data(url, format='json', **kwargs):
     
     return response.json()
 
+def request_kwargs(**kwargs):
+    """Keep the keyword parameters accepted by :py:func:`requests.get`.
+
+    Vocabulary parsers receive all the properties of the
+    vocabulary, most of which are meaningless for :py:mod:`requests`.
+
+    Returns
+    -------
+    dict
+
+    """
+    return {
+        key: value for key, value in kwargs.items()
+        if key in REQUEST_KWARGS
+    }
+
+class ConcurrentFetcher:
+    """Fetch data from several URLs at once, with :py:func:`fetch_data`.
+
+    URLs are submitted as soon as they are known, and
+    fetched in the background by a pool of threads, while
+    the caller handles the results in the order it likes.
+    It is meant to be used as a context manager, so that
+    pending requests are cancelled when the caller is done:
+
+        >>> with ConcurrentFetcher(**kwargs) as fetcher:
+        ...     for url in urls:
+        ...         fetcher.submit(url)
+        ...     for url in urls:
+        ...         data = fetcher.result(url)
+
+    Parameters
+    ----------
+    workers : int, default :py:data:`CRAWL_WORKERS`
+        Maximum number of URLs fetched at the same time.
+    host_concurrency : int, default :py:data:`CRAWL_HOST_CONCURRENCY`
+        Maximum number of URLs of the same host
+        fetched at the same time.
+    delay : float, default :py:data:`CRAWL_DELAY`
+        Minimum delay, in seconds, between the start
+        of two requests sent to the same host.
+    format : {'json', 'text', 'bytes'}, optional
+        The expected format for the results.
+    **kwargs
+        Any nammed parameter to pass to :py:func:`fetch_data`.
+
+    """
+
+    def __init__(
+        self, workers=CRAWL_WORKERS, host_concurrency=CRAWL_HOST_CONCURRENCY,
+        delay=CRAWL_DELAY, format='text', **kwargs
+    ):
+        self.delay = delay or 0
+        self.host_concurrency = max(host_concurrency or 1, 1)
+        self.format = format
+        self.kwargs = kwargs
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(workers or 1, 1),
+            thread_name_prefix='ecospheres-vocabulary-fetch'
+        )
+        self._futures = {}
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Cancel the pending requests and release the threads."""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=False)
+
+    def submit(self, url):
+        """Start fetching an URL, unless it's already pending.
+
+        Parameters
+        ----------
+        url : str
+
+        """
+        if not url in self._futures:
+            self._futures[url] = self._executor.submit(self._fetch, url)
+
+    def result(self, url):
+        """Wait for the data of an URL and return it.
+
+        The URL is submitted if it wasn't already. Once
+        returned, the result is forgotten, so calling this
+        method again for the same URL will fetch it again.
+
+        Parameters
+        ----------
+        url : str
+
+        Returns
+        -------
+        dict or list or str or bytes
+            See :py:func:`fetch_data`.
+
+        Raises
+        ------
+        Exception
+            Any exception raised by :py:func:`fetch_data`.
+
+        """
+        self.submit(url)
+        return self._futures.pop(url).result()
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if not host in self._hosts:
+                self._hosts[host] = (
+                    threading.Semaphore(self.host_concurrency),
+                    threading.Lock(),
+                    [0.0]
+                )
+            return self._hosts[host]
+
+    def _fetch(self, url):
+        semaphore, lock, next_start = self._host(url)
+        with semaphore:
+            if self.delay:
+                # requests to the same host start one
+                # at a time, at least `delay` seconds apart
+                with lock:
+                    wait = next_start[0] - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                    next_start[0] = time.monotonic() + self.delay
+            return fetch_data(url, format=self.format, **self.kwargs)
+
+class Checkpoint:
+    """Progress of a long parsing, so an interrupted one can resume.
+
+    The items parsed so far are stored in a JSON lines file,
+    one item by line, and each new item is written as soon
+    as it is added. The first line identifies the source
+    of the data, the format version and the creation
+    time of the file, which is ignored if it was built from
+    another source, with another format or is stale. It is
+    meant to be used as a context manager:
+
+        >>> with Checkpoint(Checkpoint.default_path('ogc_epsg'), url) as progress:
+        ...     for item_url in item_urls:
+        ...         data = progress.get(item_url)
+        ...         if data is None:
+        ...             data = parse_item(item_url)
+        ...             progress.add(item_url, data)
+        ...     progress.complete()
+
+    Once the parsing is complete, the file is removed.
+
+    The checkpoint is locked while it is open, with an exclusive
+    lock on a ``.lock`` file next to it. If another process holds
+    the lock - for instance when the same vocabulary is loaded
+    twice at the same time - the checkpoint is disabled: nothing
+    is read or written.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the checkpoint file.
+    source : str
+        Identifier of the source of the data,
+        usually its URL.
+    max_age : float, default :py:data:`CHECKPOINT_MAX_AGE`
+        Checkpoint files created more than `max_age`
+        seconds ago are ignored.
+
+    Attributes
+    ----------
+    path : pathlib.Path
+        Path of the checkpoint file.
+    source : str
+        Identifier of the source of the data.
+    resumed : int
+        Number of items read from an existing checkpoint file.
+    locked : bool
+        ``False`` if another process holds the checkpoint,
+        which is then disabled.
+
+    """
+
+    VERSION = 1
+    """Version of the file format."""
+
+    def __init__(self, path, source, max_age=CHECKPOINT_MAX_AGE):
+        self.path = Path(path)
+        self.source = source
+        self.resumed = 0
+        self.locked = False
+        self._items = {}
+        self._file = None
+        self._lock_file = None
+        self._complete = False
+        self._created = time.time()
+        if not self._lock():
+            logger.warning(
+                'Checkpoint "{0}" is used by another process, '
+                'the parsing will not be resumable'.format(self.path)
+            )
+            return
+        try:
+            with open(self.path, encoding='utf-8') as src:
+                header = json.loads(src.readline() or 'null')
+                if self._valid_header(header, max_age):
+                    self._created = header['created']
+                    for line in src:
+                        try:
+                            key, data = json.loads(line)
+                        except ValueError:
+                            # last line of an interrupted run
+                            break
+                        self._items[key] = data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(
+                'Invalid checkpoint file "{0}". {1}'.format(self.path, str(e))
+            )
+        self.resumed = len(self._items)
+        if self.resumed:
+            logger.info(
+                'Resuming from checkpoint "{0}", {1} items already parsed'.format(
+                    self.path, self.resumed
+                )
+            )
+
+    def _valid_header(self, header, max_age):
+        if not isinstance(header, dict) or header.get('source') != self.source:
+            return False
+        if header.get('version') != self.VERSION:
+            return False
+        created = header.get('created')
+        if not isinstance(created, (int, float)):
+            return False
+        if max_age is not None and time.time() - created > max_age:
+            logger.info(f'Checkpoint "{self.path}" is stale, it is ignored')
+            return False
+        return True
+
+    def _lock(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._lock_file = open(self.path.with_suffix('.lock'), 'a')
+            if fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+            logger.debug(f'Failed to lock checkpoint "{self.path}". {e}')
+            return False
+        self.locked = True
+        return True
+
+    @classmethod
+    def default_path(cls, name):
+        """Return the default checkpoint path for a vocabulary.
+
+        Checkpoints are stored in the ``checkpoints``
+        subdirectory of the HTTP cache directory.
+
+        Parameters
+        ----------
+        name : str
+            Name of the vocabulary.
+
+        Returns
+        -------
+        pathlib.Path
+
+        """
+        HttpCache._ensure_configured()
+        return HttpCache.CACHE_DIR / 'checkpoints' / f'{name}.jsonl'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        """Return the data of a parsed item, or ``None``."""
+        return self._items.get(key)
+
+    def add(self, key, data):
+        """Record a parsed item.
+
+        Parameters
+        ----------
+        key : str
+            Identifier of the item.
+        data : dict or list or str or int or float or None
+            JSON-serializable data of the item.
+
+        """
+        self._items[key] = data
+        if not self.locked:
+            return
+        try:
+            if self._file is None:
+                # the file is rebuilt, so the
+                # header and items are consistent
+                self._file = open(self.path, 'w', encoding='utf-8')
+                self._write(
+                    {
+                        'source': self.source, 'version': self.VERSION,
+                        'created': self._created
+                    }
+                )
+                for item in self._items.items():
+                    self._write(list(item))
+            else:
+                self._write([key, data])
+        except Exception as e:
+            logger.warning(
+                'Failed to write checkpoint "{0}". {1}'.format(self.path, str(e))
+            )
+
+    def _write(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=False))
+        self._file.write('\n')
+        self._file.flush()
+
+    def complete(self):
+        """Declare the parsing complete, the file will be removed."""
+        self._complete = True
+
+    def close(self):
+        """Close the checkpoint file, and remove it if the parsing is complete."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._complete and self.locked:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        if self._lock_file is not None:
+            # closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+        self.locked = False
+
 class VocabularyGraph(Graph):
-    """RDF graph holding vocabulary data."""
+    """RDF graph holding vocabulary data.
+
+    Queries rely on a :py:class:`VocabularyGraphIndex`, built
+    from the graph's triples the first time it's needed.
+    The graph should not be modified afterwards, except by
+    :py:meth:`parse`, which resets the index.
+
+    """
+
+    _index = None
+
+    def parse(self, *args, **kwargs):
+        self._index = None
+        return super().parse(*args, **kwargs)
+
+    def index(self, properties=None):
+        """Return the index of the graph.
+
+        Parameters
+        ----------
+        properties : list(str or rdflib.term.URIRef), optional
+            Additional RDF properties whose values should
+            be indexed, for :py:meth:`VocabularyGraphIndex.find_values`.
+
+        Returns
+        -------
+        VocabularyGraphIndex
+
+        """
+        properties = [URIRef(p) for p in properties or () if p]
+        if self._index is None or not self._index.covers(properties):
+            self._index = VocabularyGraphIndex(self, properties=properties)
+        return self._index
+
+    def find_vocabulary_items(self, schemes=None, rdf_types=None):
+        """Return a list of all vocabulary items' URIs found in the given graph.
+
+        See :py:meth:`VocabularyGraphIndex.find_vocabulary_items`.
+
+        """
+        return self.index().find_vocabulary_items(
+            schemes=schemes, rdf_types=rdf_types
+        )
+
+    def find_labels(self, uri, languages=None):
+        """Return all available labels for given URI.
+
+        See :py:meth:`VocabularyGraphIndex.find_labels`.
+
+        """
+        return self.index().find_labels(uri, languages=languages)
+
+    def find_parents(self, uri):
+        """Return all broader concepts for the given URI.
+
+        See :py:meth:`VocabularyGraphIndex.find_parents`.
+
+        """
+        return self.index().find_parents(uri)
+
+    def find_children(self, uri):
+        """Return all narrower concepts for the given URI.
+
+        See :py:meth:`VocabularyGraphIndex.find_children`.
+
+        """
+        return self.index().find_children(uri)
+
+class VocabularyGraphIndex:
+    """Index of the triples of a vocabulary graph.
+
+    The triples are walked only once, and the values of the
+    properties used to identify vocabulary items, their labels
+    and their hierarchy are stored in dictionaries, so that
+    each query is a few dictionary lookups instead of a
+    pattern query against the RDF store.
+
+    Parameters
+    ----------
+    graph : rdflib.graph.Graph
+        Some RDF graph.
+    properties : list(rdflib.term.URIRef), optional
+        Additional RDF properties whose values should
+        be indexed, for instance the property providing
+        regular expressions for a vocabulary.
+
+    Attributes
+    ----------
+    objects : dict(rdflib.term.URIRef, dict)
+        For each indexed property, the list of
+        objects of each subject.
+    subjects : dict(rdflib.term.URIRef, dict)
+        For each indexed property, the list of
+        subjects of each object.
+
+    """
+
+    def __init__(self, graph, properties=None):
+        self.properties = set(properties or ())
+        tracked = set(self.properties)
+        tracked.update(
+            (RDF.type, SKOS.inScheme), CONCEPTS_ARE_SUBJECTS_OF,
+            CONCEPTS_ARE_OBJECTS_OF
+        )
+        for label_property in LABELS_ARE_VALUES_OF:
+            tracked.update(_path_steps(label_property))
+        self.objects = {p: {} for p in tracked}
+        self.subjects = {p: {} for p in tracked}
+        for s, p, o in graph.triples((None, None, None)):
+            if p in tracked:
+                self.objects[p].setdefault(s, []).append(o)
+                self.subjects[p].setdefault(o, []).append(s)
+
+    def covers(self, properties):
+        """Tell whether the values of the given properties are indexed."""
+        return all(p in self.objects for p in properties)
+
+    def find_values(self, uri, property):
+        """Return the values of a property for given URI.
+
+        Parameters
+        ----------
+        uri : str or rdflib.term.URIRef
+            URI of a vocabulary item.
+        property : str or rdflib.term.URIRef
+            URI of some RDF property. It should have been
+            listed in the `properties` of the index.
+
+        Returns
+        -------
+        list(rdflib.term.Identifier)
+
+        """
+        return list(self.objects[URIRef(property)].get(URIRef(uri), ()))
 
     def find_vocabulary_items(self, schemes=None, rdf_types=None):
         """Return a list of all vocabulary items' URIs found in the given graph.
@@ -123,8 +645,6 @@ class VocabularyGraph(Graph):
 
         Parameters
         ----------
-        graph : rdflib.graph.Graph
-            Some RDF graph.
         schemes : list(str or rdflib.term.URIRef), optional
             A list of schemes' URIs. If provided, only the
             concepts from the listed schemes are considered.
@@ -135,35 +655,34 @@ class VocabularyGraph(Graph):
 
         Returns
         -------
-        list(str)
+        list(rdflib.term.Identifier)
 
         """
         if rdf_types:
             types_uris = []
             for rdf_type in rdf_types:
-                types_uris += [
-                    s for s in self.subjects(RDF.type, URIRef(rdf_type))
-                ]
+                types_uris += self.subjects[RDF.type].get(URIRef(rdf_type), [])
         
         if schemes:
             schemes_uris = []
             for scheme in schemes:
-                schemes_uris += [
-                    s for s in self.subjects(SKOS.inScheme, URIRef(scheme))
-                ]
+                schemes_uris += self.subjects[SKOS.inScheme].get(URIRef(scheme), [])
         
         if schemes and rdf_types:
+            types_uris = set(types_uris)
             return [uri for uri in schemes_uris if uri in types_uris]
         if schemes:
             return schemes_uris
         if rdf_types:
             return types_uris
         
-        uris = [s for s in self.subjects(RDF.type, SKOS.Concept)]
+        uris = list(self.subjects[RDF.type].get(SKOS.Concept, []))
         for predicate in CONCEPTS_ARE_SUBJECTS_OF:
-            uris += [s for s in self.subjects(predicate)]
+            for s, objects in self.objects[predicate].items():
+                uris += [s] * len(objects)
         for predicate in CONCEPTS_ARE_OBJECTS_OF:
-            uris += [o for o in self.objects(predicate=predicate)]
+            for o, subjects in self.subjects[predicate].items():
+                uris += [o] * len(subjects)
         
         return uris
 
@@ -193,7 +712,13 @@ class VocabularyGraph(Graph):
         labels = []
         uri = URIRef(uri)
         for property in LABELS_ARE_VALUES_OF:
-            for label in self.objects(uri, property):
+            values = [uri]
+            for step in _path_steps(property):
+                values = [
+                    o for value in values
+                    for o in self.objects[step].get(value, ())
+                ]
+            for label in values:
                 if isinstance(label, Literal) and (
                     not languages or label.language in languages 
                 ):
@@ -213,15 +738,11 @@ class VocabularyGraph(Graph):
         list(rdflib.term.URIRef)
 
         """
-        parents = []
         uri = URIRef(uri)
-        for parent in self.subjects(SKOS.narrower, uri):
-            if isinstance(parent, URIRef) and not parent in parents:
-                parents.append(parent)
-        for parent in self.objects(uri, SKOS.broader):
-            if isinstance(parent, URIRef) and not parent in parents:
-                parents.append(parent)
-        return parents
+        return _unique_uris(
+            self.subjects[SKOS.narrower].get(uri, []),
+            self.objects[SKOS.broader].get(uri, [])
+        )
 
     def find_children(self, uri):
         """Return all narrower concepts for the given URI.
@@ -236,13 +757,20 @@ class VocabularyGraph(Graph):
         list(rdflib.term.URIRef)
 
         """
-        children = []
         uri = URIRef(uri)
-        for child in self.subjects(SKOS.broader, uri):
-            if isinstance(child, URIRef) and not child in children:
-                children.append(child)
-        for child in self.objects(uri, SKOS.narrower):
-            if isinstance(child, URIRef) and not child in children:
-                children.append(child)
-        return children
+        return _unique_uris(
+            self.subjects[SKOS.broader].get(uri, []),
+            self.objects[SKOS.narrower].get(uri, [])
+        )
 
+def _path_steps(property):
+    # a property of LABELS_ARE_VALUES_OF may be a sequence path
+    return getattr(property, 'args', None) or [property]
+
+def _unique_uris(*iterables):
+    uris = {}
+    for iterable in iterables:
+        for uri in iterable:
+            if isinstance(uri, URIRef):
+                uris.setdefault(uri)
+    return list(uris)
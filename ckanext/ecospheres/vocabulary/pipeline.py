@@ -0,0 +1,265 @@
+"""
+Parallel fetching and parsing of vocabularies.
+
+Vocabularies are fetched and parsed by a pool of processes,
+while the parsing results are handed to the caller as soon as
+they are available:
+
+>>> for name, result in parse_vocabularies(names, jobs=4):
+...     pass
+
+Each remote host only serves :py:data:`HOST_CONCURRENCY`
+vocabularies at the same time, whatever the size of the pool.
+
+Some vocabularies should only be loaded after others (see
+the ``depends_on`` property in ``vocabularies.yaml``).
+:py:class:`LoadScheduler` orders the loading of the parsed
+vocabularies accordingly.
+
+"""
+
+import logging
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from urllib.parse import urlparse
+
+from ckanext.ecospheres.vocabulary.index import VocabularyIndex
+from ckanext.ecospheres.vocabulary.parser.result import VocabularyParsingResult
+
+logger = logging.getLogger(__name__)
+
+HOST_CONCURRENCY = 2
+"""Maximum number of vocabularies fetched at the same time from a remote host."""
+
+def vocabulary_host(name):
+    """Return the remote host serving a vocabulary's data.
+
+    Returns
+    -------
+    str or None
+        ``None`` for unknown vocabularies and
+        vocabularies without URL.
+
+    """
+    try:
+        url = VocabularyIndex.get(name, 'url')
+    except ValueError:
+        return
+    if url:
+        return urlparse(url).netloc or None
+
+def _parse(name, kwargs):
+    return VocabularyIndex.load(name, **kwargs)
+
+def _dump(name, kwargs):
+    return VocabularyIndex.load_and_dump(name, **kwargs)
+
+def _check_and_run(task, check, name, kwargs):
+    info, skip = check(name)
+    if skip:
+        return None, info
+    try:
+        result = task(name, kwargs)
+    except Exception as error:
+        # the outcome of the check is kept
+        result = VocabularyParsingResult(name)
+        result.exit(error)
+    return result, info
+
+def parse_vocabularies(
+    names, jobs=2, host_concurrency=HOST_CONCURRENCY, dump=False,
+    check=None, **kwargs
+):
+    """Fetch and parse vocabularies in a pool of processes.
+
+    Parameters
+    ----------
+    names : list(str)
+        Names of the vocabularies. Vocabularies are
+        submitted in this order.
+    jobs : int, default 2
+        Number of worker processes.
+    host_concurrency : int, default :py:data:`HOST_CONCURRENCY`
+        Maximum number of vocabularies fetched at the
+        same time from a remote host.
+    dump : bool, default False
+        If ``True``, the workers also dump the vocabulary data
+        as JSON, with :py:meth:`VocabularyIndex.load_and_dump`.
+    check : callable, optional
+        Function the workers call with the name of a vocabulary
+        before parsing it, for instance to check if its source
+        changed. It must be picklable and return a tuple
+        ``(info, skip)``. If ``skip`` is ``True``, the
+        vocabulary is not parsed.
+    **kwargs
+        Keyword parameters passed down to :py:meth:`VocabularyIndex.load`
+        or :py:meth:`VocabularyIndex.load_and_dump`.
+
+    Yields
+    ------
+    tuple(str, ckanext.ecospheres.vocabulary.parser.result.VocabularyParsingResult)
+        The name of a vocabulary and its parsing result,
+        in order of completion. If `check` is provided, the
+        tuples have a third item, the ``info`` returned by
+        `check`, and the parsing result is ``None`` for
+        skipped vocabularies.
+
+    """
+    task = _dump if dump else _parse
+    if check is not None:
+        task = partial(_check_and_run, task, check)
+    pending = list(names)
+    running = {}
+    by_host = {}
+
+    def submit():
+        for name in list(pending):
+            if len(running) >= jobs:
+                break
+            host = vocabulary_host(name)
+            if host and by_host.get(host, 0) >= host_concurrency:
+                continue
+            pending.remove(name)
+            if host:
+                by_host[host] = by_host.get(host, 0) + 1
+            logger.debug(f'Fetching vocabulary "{name}"')
+            running[executor.submit(task, name, kwargs)] = (name, host)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        submit()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            results = []
+            for future in done:
+                name, host = running.pop(future)
+                if host:
+                    by_host[host] -= 1
+                info = None
+                try:
+                    result = future.result()
+                    if check is not None:
+                        result, info = result
+                except Exception as error:
+                    result = VocabularyParsingResult(name)
+                    result.exit(error)
+                results.append(
+                    (name, result, info) if check is not None else (name, result)
+                )
+            # the workers are kept busy while the
+            # caller handles the results
+            submit()
+            yield from results
+
+class LoadScheduler:
+    """Order the loading of parsed vocabularies.
+
+    A vocabulary is ready to be loaded once all the
+    vocabularies it depends on are done, ie loaded or
+    failed. Dependencies that are not part of the current
+    run are ignored.
+
+    Parameters
+    ----------
+    names : list(str)
+        Names of the vocabularies of the run.
+    dependencies : dict, optional
+        Dependencies of the vocabularies, by name.
+        If not provided, they are read from the
+        ``depends_on`` property in ``vocabularies.yaml``.
+
+    """
+
+    def __init__(self, names, dependencies=None):
+        if dependencies is None:
+            dependencies = {
+                name: VocabularyIndex.dependencies(name) for name in names
+            }
+        self.dependencies = {
+            name: {
+                dependency for dependency in dependencies.get(name) or ()
+                if dependency in names and dependency != name
+            }
+            for name in names
+        }
+        self._waiting = {}
+        self._done = set()
+
+    def order(self):
+        """List the vocabularies of the run, dependencies first.
+
+        The initial order is kept as long as it
+        doesn't contradict the dependencies.
+
+        Returns
+        -------
+        list(str)
+
+        """
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered or name in visiting:
+                # cycles are ignored
+                return
+            visiting.add(name)
+            for dependency in sorted(
+                self.dependencies[name], key=list(self.dependencies).index
+            ):
+                visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in self.dependencies:
+            visit(name)
+        return ordered
+
+    def add(self, name, result):
+        """Register a parsing result.
+
+        Returns
+        -------
+        list(tuple)
+            The ``(name, result)`` couples that are
+            now ready to be loaded.
+
+        """
+        self._waiting[name] = result
+        return self._ready()
+
+    def done(self, name):
+        """Declare a vocabulary as loaded or failed.
+
+        Returns
+        -------
+        list(tuple)
+            The ``(name, result)`` couples that are
+            now ready to be loaded.
+
+        """
+        self._done.add(name)
+        return self._ready()
+
+    def flush(self):
+        """Return all waiting vocabularies, whatever their dependencies.
+
+        This should only be needed when some dependency
+        never reached the scheduler.
+
+        Returns
+        -------
+        list(tuple)
+
+        """
+        ready = list(self._waiting.items())
+        self._waiting.clear()
+        return ready
+
+    def _ready(self):
+        ready = [
+            (name, result) for name, result in self._waiting.items()
+            if self.dependencies.get(name, set()) <= self._done
+        ]
+        for name, _ in ready:
+            del self._waiting[name]
+        return ready
@@ -0,0 +1,408 @@
+"""
+Resolution plans for the search of vocabulary URIs.
+
+For a metadata field, :py:func:`ckanext.ecospheres.vocabulary.search.search_uri`
+tries several strategies (URI, identifying fragment, synonym,
+label and regular expression matches) on each vocabulary of the
+field. Most of these searches cannot match anything: many
+vocabularies have no synonyms or regular expressions, and the
+identifying fragments of vocabularies with numeric codes can
+only match numeric values.
+
+A :py:class:`ResolutionPlan` is the ordered list of the
+(vocabulary, strategy) steps that can actually match, as
+deduced from the schema and the vocabularies' profiles
+(see :py:meth:`VocabularyReader.get_vocabulary_profile`).
+Steps are run in the same order as the generic cascade,
+so the results are the same. The plans also count which
+steps resolve the values:
+
+>>> plan = ResolutionPlans.get('theme')
+>>> plan.resolve('Agriculture')
+>>> ResolutionPlans.stats()
+
+Plans are compiled again when one of the field's vocabularies
+is reloaded, and at least every ``ckanext.ecospheres.vocabulary_cache.local_ttl``
+seconds.
+
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from ckanext.ecospheres.scheming.registry import SchemaRegistry
+from ckanext.ecospheres.vocabulary.cache import VocabularyCache
+from ckanext.ecospheres.vocabulary.reader import VocabularyReader
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('uri', 'id_fragment', 'synonym', 'label', 'regexp')
+
+ID_FRAGMENT_PATTERN = re.compile('^[a-zA-Z0-9_-]+$')
+
+class ResolutionStep:
+    """One (vocabulary, strategy) step of a resolution plan.
+
+    Parameters
+    ----------
+    vocabulary : str
+        Name of the vocabulary.
+    strategy : {'uri', 'id_fragment', 'synonym', 'label', 'regexp'}
+        The kind of search.
+    numeric_only : bool, default False
+        If ``True``, the step only applies to numeric values.
+        This is used for identifying fragment searches on
+        vocabularies with numeric codes.
+
+    """
+
+    __slots__ = ('vocabulary', 'strategy', 'numeric_only')
+
+    def __init__(self, vocabulary, strategy, numeric_only=False):
+        if not strategy in STRATEGIES:
+            raise ValueError(f'Unknown strategy "{strategy}"')
+        self.vocabulary = vocabulary
+        self.strategy = strategy
+        self.numeric_only = numeric_only
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.vocabulary!r}, {self.strategy!r})'
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ResolutionStep)
+            and self.key == other.key
+            and self.numeric_only == other.numeric_only
+        )
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def key(self):
+        """tuple(str): The vocabulary and strategy of the step."""
+        return (self.vocabulary, self.strategy)
+
+    def applies(self, value):
+        """Can the step match the value?"""
+        if self.strategy == 'id_fragment':
+            return bool(ID_FRAGMENT_PATTERN.match(value)) and (
+                not self.numeric_only or value.isdigit()
+            )
+        return True
+
+    def resolve(self, value):
+        """Search the URI matching a value.
+
+        Returns
+        -------
+        str or None
+
+        """
+        if not self.applies(value):
+            return
+        if self.strategy == 'uri':
+            if VocabularyReader.is_known_uri(self.vocabulary, value):
+                return value
+        elif self.strategy == 'id_fragment':
+            return VocabularyReader.get_uri_from_id_fragment(
+                self.vocabulary, value
+            )
+        elif self.strategy == 'synonym':
+            return VocabularyReader.get_uri_from_synonym(
+                self.vocabulary, value
+            )
+        elif self.strategy == 'label':
+            return VocabularyReader.get_uri_from_label(
+                self.vocabulary, value
+            )
+        elif self.strategy == 'regexp':
+            if uris := VocabularyReader.get_uris_from_regexp(
+                self.vocabulary, [value]
+            ):
+                return uris[0]
+
+    def resolve_many(self, values):
+        """Search the URIs matching a list of values.
+
+        Returns
+        -------
+        dict
+            For each value with a match, the matching URI.
+
+        """
+        values = [value for value in values if self.applies(value)]
+        if not values:
+            return {}
+        if self.strategy == 'uri':
+            return {
+                uri: uri for uri
+                in VocabularyReader.get_known_uris(self.vocabulary, values)
+            }
+        if self.strategy == 'id_fragment':
+            return VocabularyReader.get_uris_from_id_fragments(
+                self.vocabulary, values
+            )
+        if self.strategy == 'synonym':
+            return VocabularyReader.get_uris_from_synonyms(
+                self.vocabulary, values
+            )
+        if self.strategy == 'label':
+            return VocabularyReader.get_uris_from_labels(
+                self.vocabulary, values
+            )
+        if self.strategy == 'regexp':
+            return VocabularyReader.get_uri_by_regexp_term(
+                self.vocabulary, values
+            )
+
+class ResolutionPlan:
+    """Ordered steps for resolving the values of a field.
+
+    Parameters
+    ----------
+    field_path : tuple(str)
+        The path of the field in the metadata schema.
+    steps : list(ResolutionStep)
+        The steps, in order of precedence.
+    stats : ResolutionStats, optional
+        Where the plan should record its results.
+
+    """
+
+    def __init__(self, field_path, steps, stats=None):
+        self.field_path = field_path
+        self.steps = tuple(steps)
+        self.stats = stats if stats is not None else ResolutionStats()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.field_path!r}, {list(self.steps)!r})'
+
+    def resolve(self, value):
+        """Return the URI matching a value, if any.
+
+        Parameters
+        ----------
+        value : str
+            Some metadata value.
+
+        Returns
+        -------
+        str or None
+
+        """
+        for step in self.steps:
+            if uri := step.resolve(value):
+                self.stats.record(step, 1)
+                return uri
+        self.stats.record(None, 1)
+
+    def resolve_many(self, values):
+        """Return the URIs matching a list of values.
+
+        Parameters
+        ----------
+        values : iterable(str)
+            Metadata values.
+
+        Returns
+        -------
+        dict
+            For each value with a match, the matching URI.
+
+        """
+        values = list(dict.fromkeys(value for value in values if value))
+        found = {}
+        for step in self.steps:
+            unresolved = [value for value in values if not value in found]
+            if not unresolved:
+                break
+            matches = step.resolve_many(unresolved)
+            for value in unresolved:
+                if uri := matches.get(value):
+                    found[value] = uri
+            self.stats.record(step, len(found) - len(values) + len(unresolved))
+        self.stats.record(None, len(values) - len(found))
+        return found
+
+class ResolutionStats:
+    """Number of values resolved by each step of a field's plans.
+
+    Attributes
+    ----------
+    resolved : collections.Counter
+        Number of values resolved, by step key (see
+        :py:attr:`ResolutionStep.key`).
+    unresolved : int
+        Number of values without any match.
+
+    """
+
+    def __init__(self):
+        self.resolved = Counter()
+        self.unresolved = 0
+        self._lock = threading.Lock()
+
+    def record(self, step, count):
+        if not count:
+            return
+        with self._lock:
+            if step is None:
+                self.unresolved += count
+            else:
+                self.resolved[step.key] += count
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'resolved': {
+                    '{0}:{1}'.format(*key): count
+                    for key, count in self.resolved.most_common()
+                },
+                'unresolved': self.unresolved
+            }
+
+class ResolutionPlans:
+    """Compiled resolution plans, by field and search options."""
+
+    _PLANS = {}
+    _STATS = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(
+        cls, field_path, check_synonyms=True, check_labels=True,
+        check_regexp=True, check_id_fragment=True
+    ):
+        """Return the resolution plan for a field.
+
+        Parameters
+        ----------
+        field_path : tuple(str) or str
+            The path of the field or subfield in the
+            metadata schema. See
+            :py:func:`ckanext.ecospheres.vocabulary.search.search_uri`.
+        check_synonyms, check_labels, check_regexp, check_id_fragment : bool
+            See :py:func:`ckanext.ecospheres.vocabulary.search.search_uri`.
+
+        Returns
+        -------
+        ResolutionPlan
+
+        """
+        if isinstance(field_path, str):
+            field_path = (field_path,)
+        field_path = tuple(field_path)
+        strategies = [
+            strategy for strategy, checked in zip(
+                STRATEGIES,
+                (True, check_id_fragment, check_synonyms, check_labels, check_regexp)
+            ) if checked
+        ]
+        vocabularies = SchemaRegistry.get().vocabularies(field_path)
+        version = (
+            vocabularies,
+            tuple(VocabularyCache.generation(vocabulary) for vocabulary in vocabularies)
+        )
+        key = (field_path, tuple(strategies))
+        now = time.monotonic()
+        with cls._lock:
+            compiled = cls._PLANS.get(key)
+        if (
+            compiled is not None
+            and compiled[0] == version
+            and now - compiled[1] < VocabularyCache.LOCAL_TTL
+        ):
+            return compiled[2]
+
+        with cls._lock:
+            stats = cls._STATS.setdefault(field_path, ResolutionStats())
+        plan = ResolutionPlan(
+            field_path, cls.build_steps(vocabularies, strategies), stats=stats
+        )
+        logger.debug(f'Resolution plan for field "{field_path}": {plan.steps}')
+        with cls._lock:
+            cls._PLANS[key] = (version, now, plan)
+        return plan
+
+    @classmethod
+    def build_steps(cls, vocabularies, strategies=STRATEGIES, profiles=None):
+        """List the steps that can match something.
+
+        Parameters
+        ----------
+        vocabularies : list(str)
+            Names of the vocabularies, in order of precedence.
+        strategies : list(str), optional
+            Strategies to use, in order of precedence.
+        profiles : dict, optional
+            The profiles of the vocabularies, as returned
+            by :py:meth:`VocabularyReader.get_vocabulary_profile`.
+            If not provided, they are read from the database.
+
+        Returns
+        -------
+        list(ResolutionStep)
+
+        """
+        profiles = dict(profiles or {})
+        for vocabulary in vocabularies:
+            if not vocabulary in profiles:
+                profiles[vocabulary] = VocabularyReader.get_vocabulary_profile(
+                    vocabulary
+                )
+        steps = []
+        for strategy in strategies:
+            for vocabulary in vocabularies:
+                profile = profiles.get(vocabulary)
+                if profile is None:
+                    # unknown profile, the step is kept
+                    steps.append(ResolutionStep(vocabulary, strategy))
+                    continue
+                if not profile.get('uris'):
+                    continue
+                if strategy == 'id_fragment':
+                    if not profile.get('fragment_uris'):
+                        continue
+                    steps.append(
+                        ResolutionStep(
+                            vocabulary, strategy,
+                            numeric_only=(
+                                profile.get('numeric_fragment_uris')
+                                == profile.get('fragment_uris')
+                            )
+                        )
+                    )
+                elif strategy == 'synonym' and not profile.get('synonyms'):
+                    continue
+                elif strategy == 'regexp' and not profile.get('regexps'):
+                    continue
+                else:
+                    steps.append(ResolutionStep(vocabulary, strategy))
+        return steps
+
+    @classmethod
+    def stats(cls):
+        """Return the number of values resolved by each step, by field.
+
+        Returns
+        -------
+        dict
+
+        """
+        with cls._lock:
+            stats = dict(cls._STATS)
+        return {
+            '/'.join(field_path): field_stats.as_dict()
+            for field_path, field_stats in stats.items()
+        }
+
+    @classmethod
+    def clear(cls):
+        """Forget all plans and statistics."""
+        with cls._lock:
+            cls._PLANS.clear()
+            cls._STATS.clear()
@@ -0,0 +1,313 @@
+"""
+Registry of the vocabularies loaded into the database.
+
+The ``vocabulary_registry`` table holds one row per vocabulary,
+maintained by :py:func:`ckanext.ecospheres.vocabulary.loader.load_vocab`:
+
+* ``name`` - name of the vocabulary.
+* ``generation`` - number of loads that changed the data.
+* ``status`` - outcome of the last load, ie ``'loaded'``,
+  ``'unchanged'`` (the source didn't change, the load was skipped),
+  ``'failed'`` or ``'rolled back'``.
+* ``source_url``, ``source_etag``, ``source_last_modified`` and
+  ``source_hash`` - the source the data currently in the
+  database was loaded from, the HTTP validators of the
+  response and the SHA-256 hash of its content.
+* ``rows`` - number of rows by table name.
+* ``parse_duration`` and ``load_duration`` - durations of
+  the phases of the last load, in seconds.
+* ``error`` - error message of the last failed load.
+* ``loaded`` - time of the last successful load (UTC).
+* ``updated`` - time of the last change of the row (UTC).
+
+A vocabulary is considered to be in the database as long
+as its ``loaded`` column is not empty. When the table is
+created, it is filled with the vocabularies whose tables
+already exist.
+
+Functions of this module work within a session opened by
+the caller, see :py:func:`ckanext.ecospheres.vocabulary.loader.Session`.
+
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import (
+    JSON, Column, DateTime, Float, Integer, MetaData, Table, Text,
+    inspect, select
+)
+
+from ckanext.ecospheres.vocabulary.parser.httpcache import HttpCache
+from ckanext.ecospheres.vocabulary.parser.model import SQL_SCHEMA
+from ckanext.ecospheres.vocabulary.parser.utils import request_kwargs
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_TABLE = 'vocabulary_registry'
+"""Name of the registry table."""
+
+metadata = MetaData()
+
+registry_table = Table(
+    REGISTRY_TABLE, metadata,
+    Column('name', Text, primary_key=True),
+    Column('generation', Integer, nullable=False, default=0),
+    Column('status', Text, nullable=False),
+    Column('source_url', Text),
+    Column('source_etag', Text),
+    Column('source_last_modified', Text),
+    Column('source_hash', Text),
+    Column('rows', JSON),
+    Column('parse_duration', Float),
+    Column('load_duration', Float),
+    Column('error', Text),
+    Column('loaded', DateTime),
+    Column('updated', DateTime, nullable=False),
+    schema=SQL_SCHEMA
+)
+
+class VocabularyRegistry:
+    """Access to the registry of the loaded vocabularies."""
+
+    @classmethod
+    def exists(cls, session):
+        """Check if the registry table exists.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.Session
+            An open database session.
+
+        Returns
+        -------
+        bool
+
+        """
+        return inspect(session.connection()).has_table(
+            REGISTRY_TABLE, schema=SQL_SCHEMA
+        )
+
+    @classmethod
+    def create(cls, session):
+        """Create the registry table, if it doesn't exist yet.
+
+        Vocabularies whose labels' table already exists
+        are registered with an unknown source, so they
+        will be fully reloaded next time.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.Session
+            An open database session.
+
+        """
+        if cls.exists(session):
+            return
+        metadata.create_all(
+            session.get_bind(), tables=[registry_table], checkfirst=True
+        )
+        now = datetime.utcnow()
+        names = sorted(
+            table_name[:-len('_label')]
+            for table_name in inspect(session.connection()).get_table_names(
+                schema=SQL_SCHEMA
+            )
+            if table_name.endswith('_label')
+        )
+        for name in names:
+            session.execute(
+                registry_table.insert().values(
+                    name=name, generation=0, status='loaded',
+                    loaded=now, updated=now
+                )
+            )
+        if names:
+            logger.info(
+                'Vocabulary registry created with {0} vocabularies '
+                'already in the database'.format(len(names))
+            )
+
+    @classmethod
+    def get(cls, session, name):
+        """Return the registry entry of a vocabulary.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.Session
+            An open database session.
+        name : str
+            Name of the vocabulary.
+
+        Returns
+        -------
+        dict or None
+            The registry row, or ``None`` if the vocabulary
+            is not registered (or the registry doesn't exist).
+
+        """
+        if not cls.exists(session):
+            return
+        row = session.execute(
+            select([registry_table]).where(registry_table.c.name == name)
+        ).first()
+        if row is not None:
+            return dict(row)
+
+    @classmethod
+    def names(cls, session):
+        """List the vocabularies available in the database.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.Session
+            An open database session.
+
+        Returns
+        -------
+        list(str) or None
+            Sorted names of the vocabularies that were successfully
+            loaded at least once. ``None`` if the registry
+            doesn't exist.
+
+        """
+        if not cls.exists(session):
+            return
+        res = session.execute(
+            select([registry_table.c.name]).where(
+                registry_table.c.loaded.isnot(None)
+            ).order_by(registry_table.c.name)
+        )
+        return [name for name, in res]
+
+    @classmethod
+    def record(
+        cls, session, name, status, source=None, rows=None, changed=False,
+        parse_duration=None, load_duration=None, error=None
+    ):
+        """Record the outcome of a load in the registry.
+
+        The registry table is created if needed.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.Session
+            An open database session.
+        name : str
+            Name of the vocabulary.
+        status : {'loaded', 'unchanged', 'failed', 'rolled back'}
+            Outcome of the load.
+        source : dict, optional
+            Description of the source the data was loaded from,
+            see :py:func:`fetch_source_info`. It replaces the
+            recorded one when the status is ``'loaded'``, or
+            ``'unchanged'``. When the data is rolled back, the
+            recorded source is cleared, since it's unknown.
+        rows : dict, optional
+            Number of rows by table name. Only used when
+            the status is ``'loaded'``.
+        changed : bool, default False
+            ``True`` if the data in the database changed,
+            which increments the generation.
+        parse_duration : float, optional
+            Duration of the parsing, in seconds.
+        load_duration : float, optional
+            Duration of the load, in seconds.
+        error : str, optional
+            Error message, if the load failed.
+
+        Returns
+        -------
+        dict
+            The updated registry row.
+
+        """
+        cls.create(session)
+        now = datetime.utcnow()
+        entry = cls.get(session, name)
+        values = {
+            'status': status,
+            'parse_duration': parse_duration,
+            'load_duration': load_duration,
+            'error': error,
+            'updated': now
+        }
+        if status in ('loaded', 'unchanged'):
+            values['loaded'] = now
+            source = source or {}
+            for key in ('url', 'etag', 'last_modified', 'hash'):
+                if key in source or status == 'loaded':
+                    values[f'source_{key}'] = source.get(key)
+        if status == 'loaded' and rows is not None:
+            values['rows'] = rows
+        if status == 'rolled back':
+            for key in ('url', 'etag', 'last_modified', 'hash'):
+                values[f'source_{key}'] = None
+        generation = entry['generation'] if entry else 0
+        if changed:
+            values['generation'] = generation + 1
+        if entry is None:
+            values.setdefault('generation', generation)
+            session.execute(registry_table.insert().values(name=name, **values))
+        else:
+            session.execute(
+                registry_table.update().where(
+                    registry_table.c.name == name
+                ).values(**values)
+            )
+        return cls.get(session, name)
+
+def fetch_source_info(url, **kwargs):
+    """Fetch the source of a vocabulary and describe it.
+
+    The source is fetched through the HTTP cache (see
+    :py:meth:`ckanext.ecospheres.vocabulary.parser.httpcache.HttpCache.describe`),
+    so it is only downloaded if it changed, and the parser
+    will then find it in the cache. The content is hashed
+    while it is streamed to the cache.
+
+    Parameters
+    ----------
+    url : str
+        URL of the source.
+    **kwargs
+        Keyword parameters passed down to :py:func:`requests.get`,
+        such as authentification info, proxy mapping, etc.
+
+    Returns
+    -------
+    dict
+        A dictionary with keys ``url``, ``etag``, ``last_modified``
+        and ``hash`` (SHA-256 hash of the content).
+
+    """
+    info = HttpCache.describe(url, **request_kwargs(**kwargs))
+    return {
+        'url': url,
+        'etag': info['headers'].get('ETag'),
+        'last_modified': info['headers'].get('Last-Modified'),
+        'hash': info['hash']
+    }
+
+def source_unchanged(entry, source):
+    """Tell if the source of a vocabulary didn't change since its last load.
+
+    Parameters
+    ----------
+    entry : dict or None
+        Registry entry of the vocabulary, see
+        :py:meth:`VocabularyRegistry.get`.
+    source : dict or None
+        Description of the current source, see
+        :py:func:`fetch_source_info`.
+
+    Returns
+    -------
+    bool
+
+    """
+    if not entry or not source or entry.get('loaded') is None:
+        return False
+    if not entry.get('source_hash') or entry.get('source_url') != source.get('url'):
+        return False
+    return entry['source_hash'] == source.get('hash')
@@ -2,13 +2,46 @@
 Search functions for vocabulary labels and URIs in the
 context of a metadata field.
 
+The results of :py:func:`search_uri`, :py:func:`search_label`
+and :py:func:`search_territory`, including the negative ones,
+are memoized. By default, the memo is shared by the whole
+process. Harvesters should rather use :py:func:`search_scope`
+to get one memo per harvest job, as the same values are
+usually repeated across the records of a catalog:
+
+>>> with search_scope(harvest_job_id) as memo:
+...     uri = search_uri('theme', 'Agriculture')
+>>> memo.stats()
+
+The following configuration options are available:
+
+``ckanext.ecospheres.search_cache.size`` (default ``10000``)
+    Maximum number of results kept by a memo. ``0``
+    disables the memoization.
+``ckanext.ecospheres.search_cache.ttl`` (default ``3600``)
+    How long, in seconds, a result is kept.
+
+Values without any match are not logged as warnings, they
+are counted in the report of the harvest job instead,
+see :py:func:`ckanext.ecospheres.vocabulary.unmatched.unmatched_scope`.
+
 """
 
 import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 import ckan.plugins.toolkit as toolkit
 
+from ckanext.ecospheres.matcher import compile_map
+from ckanext.ecospheres.scheming.registry import SchemaRegistry
+from ckanext.ecospheres.vocabulary.cache import track_lookups
+from ckanext.ecospheres.vocabulary.plan import ResolutionPlans
 from ckanext.ecospheres.vocabulary.reader import VocabularyReader
+from ckanext.ecospheres.vocabulary.unmatched import current_collector
 
 
 logger = logging.getLogger(__name__)
@@ -16,8 +49,6 @@ logger = logging.getLogger(__name__)
 class FieldsVocabularies():
     """Access to the names of the vocabularies to be used for each of the schema's fields."""
 
-    INDEX = {}
-
     @classmethod
     def load(cls, update=False):
         """Retrieve vocabulary information from the schema.
@@ -25,40 +56,18 @@ class FieldsVocabularies():
         Parameters
         ----------
         update : bool, default False
-            Unless this is set to ``True``, the method
-            won't load the data again if it had been
-            collected before.
+            Unless this is set to ``True``, the schema
+            won't be compiled again if it hasn't changed
+            since it was last compiled.
 
-        """
-        if update or not cls.INDEX:
-            dataset_schema = toolkit.get_action(
-                'scheming_dataset_schema_show'
-            )(None, {'type': 'dataset'})
-            for field_dict in dataset_schema.get('dataset_fields', []):
-                cls._build_index(tuple(), field_dict)
-            for field_dict in dataset_schema.get('resource_fields', []):
-                cls._build_index(('resource',), field_dict)
+        Returns
+        -------
+        ckanext.ecospheres.scheming.registry.SchemaRegistry
 
-    @classmethod
-    def _build_index(cls, parent_path, field_dict):
-        path = list(parent_path)
-        if field_name := field_dict.get('field_name'):
-            path.append(field_name)
-            path = tuple(path)
-        else:
-            logger.error(f'Missing "field_name" key for a subfield of "{parent_path}"')
-            return
-        vocabularies = field_dict.get('vocabularies', [])
-        if vocabularies:
-            cls.INDEX[path] = vocabularies
-        if (
-            vocabularies
-            and field_name == 'uri'
-            and not cls.INDEX.get(parent_path)
-        ):
-            cls.INDEX[parent_path] = vocabularies
-        for subfield in field_dict.get('repeating_subfields', []):
-            cls._build_index(path, subfield)
+        """
+        if update:
+            SchemaRegistry.clear()
+        return SchemaRegistry.get()
 
     @classmethod
     def list(cls, field_path):
@@ -87,8 +96,144 @@ class FieldsVocabularies():
             return []
         if isinstance(field_path, str):
             field_path = (field_path,)
-        cls.load()
-        return cls.INDEX.get(field_path, [])
+        return list(cls.load().vocabularies(field_path))
+
+class SearchMemo:
+    """Bounded memo for the results of the search functions.
+
+    Parameters
+    ----------
+    size : int, optional
+        Maximum number of results to keep. If not provided,
+        it is read from the configuration.
+    ttl : float, optional
+        How long, in seconds, a result is kept. If not
+        provided, it is read from the configuration.
+
+    Attributes
+    ----------
+    hits : int
+        Number of searches answered by the memo.
+    misses : int
+        Number of searches the memo couldn't answer.
+
+    """
+
+    MISSING = object()
+
+    def __init__(self, size=None, ttl=None):
+        if size is None:
+            size = toolkit.config.get('ckanext.ecospheres.search_cache.size', 10000)
+        if ttl is None:
+            ttl = toolkit.config.get('ckanext.ecospheres.search_cache.ttl', 3600)
+        self.size = int(size)
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the memoized result, or :py:attr:`SearchMemo.MISSING`."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] >= time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return self.MISSING
+
+    def set(self, key, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the memo's counters.
+
+        Returns
+        -------
+        dict
+            A dictionnary with keys ``hits``, ``misses``
+            and ``size`` (number of memoized results).
+
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+_PROCESS_MEMO = None
+_SCOPED_MEMOS = OrderedDict()
+_MAX_SCOPES = 8
+_scopes_lock = threading.Lock()
+_current_memo = ContextVar('ecospheres_search_memo', default=None)
+
+def current_memo():
+    """Return the memo used by the search functions in the current context.
+
+    Returns
+    -------
+    SearchMemo
+
+    """
+    global _PROCESS_MEMO
+    memo = _current_memo.get()
+    if memo is None:
+        with _scopes_lock:
+            if _PROCESS_MEMO is None:
+                _PROCESS_MEMO = SearchMemo()
+            memo = _PROCESS_MEMO
+    return memo
+
+@contextmanager
+def search_scope(scope):
+    """Use a dedicated memo for the searches run within the context.
+
+    The memo is kept after the context exits, so that
+    the next context with the same `scope` reuses it. Only
+    the memos of the last few scopes are kept.
+
+    Parameters
+    ----------
+    scope : str
+        Identifier of the scope, typically the
+        identifier of a harvest job.
+
+    Yields
+    ------
+    SearchMemo
+
+    """
+    with _scopes_lock:
+        memo = _SCOPED_MEMOS.get(scope)
+        if memo is None:
+            memo = _SCOPED_MEMOS[scope] = SearchMemo()
+        _SCOPED_MEMOS.move_to_end(scope)
+        while len(_SCOPED_MEMOS) > _MAX_SCOPES:
+            _SCOPED_MEMOS.popitem(last=False)
+    token = _current_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _current_memo.reset(token)
+        logger.debug(f'Search memo for scope "{scope}": {memo.stats()}')
+
+def _normalize_path(field_path):
+    if isinstance(field_path, str):
+        return (field_path,)
+    return tuple(field_path) if field_path else field_path
 
 def search_label(field_path, uri, language=None):
     """Return the preferred label for the given vocabulary URI.
@@ -114,7 +259,18 @@ def search_label(field_path, uri, language=None):
     """
     if not uri:
         return
-    
+
+    memo = current_memo()
+    key = ('search_label', _normalize_path(field_path), uri, language)
+    label = memo.get(key)
+    if label is memo.MISSING:
+        with track_lookups() as outcome:
+            label = _search_label(field_path, uri, language=language)
+        if not outcome.failed:
+            memo.set(key, label)
+    return label
+
+def _search_label(field_path, uri, language=None):
     vocabularies = FieldsVocabularies.list(field_path)
     if not vocabularies:
         return
@@ -165,8 +321,11 @@ def search_uri(
         function will look for a match using regular
         expressions.
     warn_if_not_found : bool, default True
-        If ``True``, the function will log a warning
-        if `value` doesn't match any vocabulary item.
+        If ``True`` and `value` doesn't match any
+        vocabulary item, the value is counted in the
+        unmatched values report of the current harvest
+        job, if any (see :py:mod:`ckanext.ecospheres.vocabulary.unmatched`),
+        and a debug message is logged.
     map : dict, optional
         A dictionary to translate `value` before 
         searching for the URI.
@@ -191,23 +350,47 @@ def search_uri(
     """
     if not value:
         return
-    
+
+    memo = current_memo()
+    key = (
+        'search_uri', _normalize_path(field_path), value,
+        check_synonyms, check_labels, check_regexp, check_id_fragment,
+        tuple(map.items()) if map else None, map_type, map_strict
+    )
+    uri = memo.get(key)
+    if uri is memo.MISSING:
+        with track_lookups() as outcome:
+            uri = _search_uri(
+                field_path, value, check_synonyms=check_synonyms,
+                check_labels=check_labels, check_regexp=check_regexp,
+                check_id_fragment=check_id_fragment, map=map,
+                map_type=map_type, map_strict=map_strict
+            )
+        if not outcome.failed:
+            memo.set(key, uri)
+
+    if uri is None and warn_if_not_found:
+        _report_unmatched(field_path, value)
+    return uri
+
+def _report_unmatched(field_path, value):
+    logger.debug(
+        f"Value '{value}' doesn't match any registered "
+        f'vocabulary item for field "{field_path}"'
+    )
+    if collector := current_collector():
+        collector.add(field_path, value)
+
+def _search_uri(
+    field_path, value, check_synonyms=True,
+    check_labels=True, check_regexp=True,
+    check_id_fragment=True, map=None,
+    map_type='all', map_strict=False
+):
     if map:
-        if not map_type in ('all', 'exact'):
-            logger.warning(f'Unknown map type "{map_type}"')
-        for map_key, map_value in map.items():
-            if map_type == 'all' and all(
-                map_term.lower() in value.lower()
-                for map_term in map_key
-            ) or (
-                map_type == 'exact'
-                and map_key.lower() == value.lower()
-            ):
-                value = map_value
-                break
-        else:
-            if map_strict:
-                return
+        value = _map_value(value, map, map_type=map_type, map_strict=map_strict)
+        if value is None:
+            return
     
     vocabularies = FieldsVocabularies.list(field_path)
     if not vocabularies:
@@ -216,51 +399,130 @@ def search_uri(
         )
         return
 
-    # URI match
-    for vocabulary in vocabularies:
-        if VocabularyReader.is_known_uri(
-            vocabulary, value
-        ):
-            return value
-
-    # ID fragment match
-    if check_id_fragment:
-        for vocabulary in vocabularies:
-            if uri := VocabularyReader.get_uri_from_id_fragment(
-                vocabulary, value
-            ):
-                return uri
-
-    # synonym match
-    if check_synonyms:
-        for vocabulary in vocabularies:
-            if uri := VocabularyReader.get_uri_from_synonym(
-                vocabulary, value
-            ):
-                return uri
-        
-    # label match
-    if check_labels:
-        for vocabulary in vocabularies:
-            if uri := VocabularyReader.get_uri_from_label(
-                vocabulary, value
-            ):
-                return uri
-
-    # regular expression match
-    if check_regexp:
-        for vocabulary in vocabularies:
-            if uris := VocabularyReader.get_uris_from_regexp(
-                vocabulary, [value]
-            ):
-                
-                return uris[0]
-
-    if warn_if_not_found:
+    plan = ResolutionPlans.get(
+        field_path, check_synonyms=check_synonyms,
+        check_labels=check_labels, check_regexp=check_regexp,
+        check_id_fragment=check_id_fragment
+    )
+    return plan.resolve(value)
+
+def _map_value(value, map, map_type='all', map_strict=False):
+    """Translate a value with a map, see :py:func:`search_uri`.
+
+    Returns
+    -------
+    str or None
+        The translated value, `value` itself if there
+        was no match in `map`, or ``None`` if there was
+        no match and `map_strict` is ``True``.
+
+    """
+    if not map_type in ('all', 'exact'):
+        logger.warning(f'Unknown map type "{map_type}"')
+    else:
+        matcher = compile_map(map, map_type=map_type)
+        if matcher.match(value) is not None:
+            return matcher.lookup(value)
+    if not map_strict:
+        return value
+
+def search_uri_many(
+    field_path, values, check_synonyms=True,
+    check_labels=True, check_regexp=True,
+    check_id_fragment=True, warn_if_not_found=True,
+    map=None, map_type='all', map_strict=False
+):
+    """Return valid vocabulary URIs for a list of values.
+
+    This is the batch version of :py:func:`search_uri`: the
+    results are the same, but each search strategy is run
+    once for all the values that are still unresolved, with
+    a single query per vocabulary.
+
+    Parameters
+    ----------
+    field_path : tuple(str)
+        The path of the field or subfield in the
+        metadata schema. See :py:func:`search_uri`.
+    values : list(str)
+        Values, presumably matching vocabulary items
+        allowed for the field.
+    check_synonyms, check_labels, check_regexp, check_id_fragment,\
+    warn_if_not_found, map, map_type, map_strict
+        See :py:func:`search_uri`.
+
+    Returns
+    -------
+    dict
+        Dictionnary whose keys are the non empty values
+        of `values` and values are the matching URIs,
+        or ``None`` for values without any match.
+
+    """
+    memo = current_memo()
+    options = (
+        check_synonyms, check_labels, check_regexp, check_id_fragment,
+        tuple(map.items()) if map else None, map_type, map_strict
+    )
+    path = _normalize_path(field_path)
+
+    results = {}
+    pending = {}
+    for value in values or ():
+        if not value or value in results or value in pending:
+            continue
+        uri = memo.get(('search_uri', path, value) + options)
+        if uri is not memo.MISSING:
+            results[value] = uri
+            continue
+        searched_value = value
+        if map:
+            searched_value = _map_value(
+                value, map, map_type=map_type, map_strict=map_strict
+            )
+        if searched_value is None:
+            results[value] = None
+        else:
+            pending[value] = searched_value
+
+    failed = False
+    if pending:
+        with track_lookups() as outcome:
+            found = _search_uris(
+                field_path, set(pending.values()), check_synonyms=check_synonyms,
+                check_labels=check_labels, check_regexp=check_regexp,
+                check_id_fragment=check_id_fragment
+            )
+        # the values whose lookup failed can't be told apart
+        failed = outcome.failed
+        for value, searched_value in pending.items():
+            results[value] = found.get(searched_value)
+
+    for value, uri in results.items():
+        if value in pending and not failed:
+            memo.set(('search_uri', path, value) + options, uri)
+        if uri is None and warn_if_not_found:
+            _report_unmatched(field_path, value)
+    return results
+
+def _search_uris(
+    field_path, values, check_synonyms=True,
+    check_labels=True, check_regexp=True,
+    check_id_fragment=True
+):
+    vocabularies = FieldsVocabularies.list(field_path)
+    if not vocabularies:
         logger.warning(
-            f"Value '{value}' doesn't match any registered "
-            f'vocabulary item for field "{field_path}"'
+            f"Field '{field_path}' has no associated vocabulary"
         )
+        return {}
+
+    plan = ResolutionPlans.get(
+        field_path, check_synonyms=check_synonyms,
+        check_labels=check_labels, check_regexp=check_regexp,
+        check_id_fragment=check_id_fragment
+    )
+    return plan.resolve_many(values)
 
 def search_territory(uri):
     """Return the territory from the ecospheres_territory vocabulary best suited to represent the given URI.
@@ -279,7 +541,18 @@ def search_territory(uri):
     """
     if not uri:
         return
-    
+
+    memo = current_memo()
+    key = ('search_territory', uri)
+    territory_uri = memo.get(key)
+    if territory_uri is memo.MISSING:
+        with track_lookups() as outcome:
+            territory_uri = _search_territory(uri)
+        if not outcome.failed:
+            memo.set(key, territory_uri)
+    return territory_uri
+
+def _search_territory(uri):
     vocabularies = FieldsVocabularies.list('territory')
     for vocabulary in vocabularies:
         if territory_uri := VocabularyReader.get_ecospheres_territory(